@@ -0,0 +1,345 @@
+import numpy as np
+
+from srcid_compact import source_mask, srcid_codes, srcid_durations_s, srcid_levels, srcid_starts_ns, SOURCE_CODE_SCALE
+
+#------------------------------------------------------------------------------------------------------------------
+# ### PANDAS-FREE NUMPY CORE
+#
+# The public functions in derivedDataFunctions format their results for reports: levels rounded to 0.1 dB,
+# durations as timedeltas.  That is convenient once, and slow inside bootstraps, optimizers or per-window
+# sweeps.  This layer holds the same computations on plain numpy arrays, returning raw float64 values with
+# no rounding (round_level() gives the reported form); the public functions, and the report planner's shared
+# intermediates, are thin wrappers around it.  Callers in tight loops can extract the arrays once and call the
+# reductions directly:
+#
+#     Lmax = _core.levels(srcid, source="air")
+#     boot = [_core.quantile(np.random.choice(Lmax, len(Lmax)), 0.5) for i in range(1000)]
+#
+# NaN values are ignored throughout, and an empty selection gives NaN, as the pandas reductions do.
+
+
+#------------------------------------------------------------------------------------------------------------------
+# ### ARRAY EXTRACTION (either the soundDB layout or the compact form from srcid_compact.py)
+
+
+def amplitude_column(metric = "Lmax", weight = "A"):
+    """
+    The srcid column holding an amplitude metric: "MaxSPL", "MaxSPLt", "SEL" or "SELt".
+    """
+
+    # allow the user to enter weighting networks either way, but convert to upper case
+    w = weight.upper()
+
+    # intialize a weighting lookup function based on the metric used
+    if(metric == "Lmax"):
+        lookup = {"A":"MaxSPL", "T":"MaxSPLt"}
+    elif(metric == "SEL"):
+        lookup = {"A":"SEL", "T":"SELt"}
+    else:
+        raise ValueError('metric must be either "Lmax" or "SEL"')
+
+    return lookup[w]
+
+
+def levels(srcid, metric = "Lmax", weight = "A", source = "all"):
+    """
+    Amplitude values of a source subset, in dB (string levels, as older merged SRCIDs carry, are parsed).
+
+    Returns
+    -------
+    numpy array of float64
+    """
+
+    return srcid_levels(srcid, amplitude_column(metric, weight))[source_mask(srcid, source)]
+
+
+def durations_s(srcid, source = "all"):
+    """
+    Event durations of a source subset, in seconds.
+
+    Returns
+    -------
+    numpy array of float64
+    """
+
+    return srcid_durations_s(srcid)[source_mask(srcid, source)].astype(np.float64)
+
+
+def starts_ns(srcid, source = "all"):
+    """
+    Event starts of a source subset, in integer nanoseconds since the epoch, in file order.
+
+    Returns
+    -------
+    numpy array of int64
+    """
+
+    return srcid_starts_ns(srcid)[source_mask(srcid, source)]
+
+
+def codes(srcid, source = "all"):
+    """
+    srcID codes of a source subset, as floats (1.1, 2.0, ...).
+
+    Returns
+    -------
+    numpy array of float64
+    """
+
+    return srcid_codes(srcid)[source_mask(srcid, source)]/float(SOURCE_CODE_SCALE)
+
+
+def events_ns(srcid, source = "all"):
+    """
+    Chronologically sorted event starts and ends of a source subset, in integer nanoseconds.
+
+    Returns
+    -------
+    tuple: (numpy array of int64 starts, numpy array of int64 ends)
+    """
+
+    mask = source_mask(srcid, source)
+    return sorted_events(srcid_starts_ns(srcid)[mask], srcid_durations_s(srcid)[mask])
+
+
+def sorted_events(starts, durations):
+    """
+    Event starts and ends in chronological order, from starts in integer nanoseconds and durations in seconds.
+
+    Returns
+    -------
+    tuple: (numpy array of int64 starts, numpy array of int64 ends)
+    """
+
+    ends = starts + np.round(durations*1e9).astype("int64")
+
+    order = np.argsort(starts, kind="stable")
+    return starts[order], ends[order]
+
+
+
+#------------------------------------------------------------------------------------------------------------------
+# ### REDUCTIONS
+
+
+def _valid(values):
+
+    values = np.asarray(values, dtype=np.float64)
+    return values[~np.isnan(values)]
+
+
+def count(values):
+    """
+    The number of non-NaN values, as numpy.int64 (so a ratio of two empty counts is NaN, as with pandas, rather than an error).
+    """
+
+    return np.int64(np.count_nonzero(~np.isnan(np.asarray(values, dtype=np.float64))))
+
+
+def total(values):
+    """
+    The sum of the non-NaN values (0.0 when there are none).
+    """
+
+    return float(np.nansum(values))
+
+
+def mean(values):
+    """
+    The arithmetic mean of the non-NaN values.
+    """
+
+    values = _valid(values)
+    return float(values.mean()) if len(values) else np.nan
+
+
+def std(values):
+    """
+    The sample standard deviation (ddof = 1) of the non-NaN values.
+    """
+
+    values = _valid(values)
+    return float(values.std(ddof=1)) if len(values) > 1 else np.nan
+
+
+def stderr(values):
+    """
+    The standard error of the mean of the non-NaN values.
+    """
+
+    values = _valid(values)
+    return float(values.std(ddof=1)/np.sqrt(len(values))) if len(values) > 1 else np.nan
+
+
+def quantile(values, q):
+    """
+    Quantile(s) of the non-NaN values, interpolated linearly between ranks as pandas.Series.quantile does.
+
+    Parameters
+    ----------
+    values: array-like of floats.
+    q: float or array-like of floats, from 0.0 (minimum) to 1.0 (maximum.)
+
+    Returns
+    -------
+    float, or numpy array of floats if q is an array
+    """
+
+    values = _valid(values)
+    if(len(values) == 0):
+        return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+
+    out = np.quantile(values, q)
+    return out if np.ndim(q) else float(out)
+
+
+def iqr(values):
+    """
+    The interquartile range of the non-NaN values.
+    """
+
+    quartiles = quantile(values, [0.25, 0.75])
+    return float(quartiles[1] - quartiles[0])
+
+
+def mad(values):
+    """
+    The median absolute deviation of the non-NaN values.
+    """
+
+    values = _valid(values)
+    if(len(values) == 0):
+        return np.nan
+
+    return float(np.median(np.abs(np.median(values) - values)))
+
+
+def fraction_above(values, threshold):
+    """
+    The fraction of the non-NaN values strictly above a threshold.
+    """
+
+    values = _valid(values)
+    return float(np.count_nonzero(values > threshold)/len(values)) if len(values) else np.nan
+
+
+
+#------------------------------------------------------------------------------------------------------------------
+# ### FINISHING STEPS SHARED BY THE PUBLIC FUNCTIONS AND THE REPORT PLANNER
+
+
+_DAY_NS = 86400*10**9
+
+
+def round_level(value):
+    """
+    A level as the public functions report it: rounded to 0.1 dB.
+    """
+
+    return float("{0:.1f}".format(value))
+
+
+def event_days(starts):
+    """
+    The number of distinct calendar days on which an event starts.
+
+    Parameters
+    ----------
+    starts: array of int64 nanoseconds since the epoch.
+
+    Returns
+    -------
+    int
+    """
+
+    return len(np.unique(np.asarray(starts)//_DAY_NS))
+
+
+def percent_of(part, whole):
+    """
+    The number of non-NaN values in one selection as a percentage of those in another.
+    """
+
+    return 100*(count(part)/count(whole))
+
+
+def count_ratio(numerator, denominator):
+    """
+    The ratio of the numbers of non-NaN values in two selections.
+    """
+
+    return count(numerator)/count(denominator)
+
+
+def percent_above(values, threshold):
+    """
+    The percentage of the non-NaN values strictly above a threshold.
+    """
+
+    return 100*fraction_above(values, threshold)
+
+
+def rate_above(values, threshold, days):
+    """
+    The number of values strictly above a threshold, per day.
+    """
+
+    values = np.asarray(values, dtype=np.float64)
+    return count(values[values > threshold])/days
+
+
+def percent_time_audible(pa, hours):
+    """
+    Audible time as a percentage of the hours sampled.
+
+    Parameters
+    ----------
+    pa: array of hourly percent time audible values (NaN for hours without a value).
+    hours: int, the number of hours sampled.
+
+    Returns
+    -------
+    float, as a percentage
+    """
+
+    return 100*total((np.asarray(pa, dtype=np.float64)/100)*3600)/(hours*3600)
+
+
+
+#------------------------------------------------------------------------------------------------------------------
+# ### NOISE FREE INTERVALS
+
+
+def nfi_between_starts(starts, unit = 1.):
+    """
+    The positive intervals between consecutive sorted event starts.
+
+    Parameters
+    ----------
+    starts: array of int64 nanoseconds, sorted ascending.
+    unit: float, optional.  Seconds per output unit, e.g. 3600 for hours.  Defaults to seconds.
+
+    Returns
+    -------
+    numpy array of float64
+    """
+
+    intervals = np.diff(starts)
+    return intervals[intervals > 0]/1e9/unit
+
+
+def nfi_between_events(starts, ends, unit = 1.):
+    """
+    The intervals from the end of each event to the start of the next (negative where events overlap).
+
+    Parameters
+    ----------
+    starts, ends: arrays of int64 nanoseconds, ordered by start.
+    unit: float, optional.  Seconds per output unit, e.g. 3600 for hours.  Defaults to seconds.
+
+    Returns
+    -------
+    numpy array of float64
+    """
+
+    return (starts[1:] - ends[:-1])/1e9/unit
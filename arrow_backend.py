@@ -0,0 +1,147 @@
+import functools
+
+import pandas as pd
+import numpy as np
+
+# pyarrow is optional: without it, plain pandas inputs work exactly as before
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+    pc = None
+
+#------------------------------------------------------------------------------------------------------------------
+# ### APACHE ARROW BACKEND FOR SRCID, DAILYPA AND NVSPL FRAMES
+#
+# Metric functions accept pyarrow Tables and ArrowDtype-backed pandas frames as well as ordinary pandas frames.
+# NVSPL band columns are read straight off the Arrow buffers as numpy views (no copy for numeric columns
+# without nulls); other inputs are converted to numpy-backed pandas once, at the function boundary.
+
+
+def _arrow_dtype(dtype):
+
+    ArrowDtype = getattr(pd, "ArrowDtype", None)
+    return ArrowDtype is not None and isinstance(dtype, ArrowDtype)
+
+
+def is_arrow(data):
+    """
+    True if data is a pyarrow Table / RecordBatch, or a pandas DataFrame with any ArrowDtype column.
+    """
+
+    if(pa is not None and isinstance(data, (pa.Table, pa.RecordBatch))):
+        return True
+
+    if(isinstance(data, pd.DataFrame)):
+        return any(_arrow_dtype(dtype) for dtype in data.dtypes)
+
+    return False
+
+
+def column_names(data):
+    """
+    The column names of a pandas DataFrame or a pyarrow Table, as strings.
+    """
+
+    if(pa is not None and isinstance(data, (pa.Table, pa.RecordBatch))):
+        return list(data.schema.names)
+
+    return [str(c) for c in data.columns]
+
+
+def _arrow_to_numpy(column):
+
+    # text columns (soundDB writes some levels as strings) are parsed once by arrow's cast kernel
+    if(pa.types.is_string(column.type) or pa.types.is_large_string(column.type)):
+        column = pc.cast(column, pa.float64())
+
+    if(isinstance(column, pa.ChunkedArray) and column.num_chunks == 1):
+        column = column.chunk(0)
+
+    # a single chunk of a primitive type with no nulls can be viewed in place
+    if(isinstance(column, pa.Array) and column.null_count == 0 and
+       (pa.types.is_floating(column.type) or pa.types.is_integer(column.type))):
+        return column.to_numpy(zero_copy_only=True)
+
+    return np.asarray(column.to_numpy(zero_copy_only=False), dtype=float)
+
+
+def column_values(data, name):
+    """
+    The values of one column as a numeric numpy array, read without copying when the column allows it.
+
+    Parameters
+    ----------
+    data: pandas DataFrame (numpy- or ArrowDtype-backed) or pyarrow Table.
+    name: str, the column name.
+
+    Returns
+    -------
+    numpy array (a read-only view of the Arrow buffer for numeric Arrow columns without nulls)
+    """
+
+    if(pa is not None and isinstance(data, (pa.Table, pa.RecordBatch))):
+        return _arrow_to_numpy(data.column(name))
+
+    series = data[name]
+    if(_arrow_dtype(series.dtype)):
+        return _arrow_to_numpy(series.array.__arrow_array__())
+
+    # object-typed columns as delivered by soundDB
+    return series.to_numpy().astype(float, copy=False)
+
+
+def to_pandas(data):
+    """
+    Convert a pyarrow Table or ArrowDtype-backed DataFrame into a numpy-backed pandas DataFrame,
+    restoring the index stored in the Arrow schema metadata.  Anything else is returned unchanged.
+
+    Returns
+    -------
+    pandas DataFrame
+    """
+
+    if(not is_arrow(data)):
+        return data
+
+    if(isinstance(data, pd.DataFrame)):
+        data = pa.Table.from_pandas(data, preserve_index=True)
+
+    # numeric columns without nulls come across without a copy
+    return data.to_pandas(split_blocks=True)
+
+
+def nvspl_times(nvspl):
+    """
+    The timestamps of an NVSPL frame or Arrow table, from its index or, for soundDB frames, the datetime level of its MultiIndex.
+
+    Returns
+    -------
+    pandas DatetimeIndex
+    """
+
+    index = nvspl.index if isinstance(nvspl, pd.DataFrame) else to_pandas(nvspl).index
+
+    # soundDB NVSPL frames carry the timestamps in one level of a MultiIndex
+    if(isinstance(index, pd.MultiIndex)):
+        for level in range(index.nlevels):
+            values = index.get_level_values(level)
+            if(isinstance(values, pd.DatetimeIndex)):
+                return values
+        raise ValueError("the NVSPL index has no datetime level")
+
+    return pd.DatetimeIndex(index)
+
+
+def accepts_arrow(function):
+    """
+    Decorator converting an Arrow first argument (srcid, dailypa, ...) to numpy-backed pandas
+    at the boundary, so that the conversion happens once per call and not per column access.
+    """
+
+    @functools.wraps(function)
+    def wrapper(data, *args, **kwargs):
+        return function(to_pandas(data), *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,313 @@
+import pandas as pd
+import numpy as np
+
+from srcid_compact import srcid_codes, srcid_durations_s, srcid_starts_ns, SOURCE_CODE_SCALE
+from srcid_index import indexed_events
+from stratified import SOURCE_GROUPS
+
+#------------------------------------------------------------------------------------------------------------------
+# ### BIT-PACKED PER-SECOND AUDIBILITY TIMELINE
+#
+# Percent time audible, union audible duration, noise free intervals and hourly saturation are all questions
+# about one timeline: which seconds were audible.  A season is about 8M seconds, so one bit per second fits in
+# about 1 MB per source group (a decade, about 40 MB).  Events are merged into disjoint runs of seconds, and the
+# timeline is filled about 12 days at a time from a difference array over the runs (+1 at each run's first second,
+# -1 after its last), each chunk packed with np.packbits straight into the output, so the working memory stays a
+# few MB whatever the span.  Timelines are queried with byte-wise popcounts and bit operations:
+#
+#     timelines = audibility_timelines(srcid)
+#     (timelines["air"] & ~timelines["vehicle"]).percent_time_audible("2019-07-01", "2019-08-01")
+#
+# Timelines start at midnight and span whole days, so every hour is exactly 450 bytes.  Both builders take an
+# optional SRCIDIntervalIndex (srcid_index.py) and reuse its start-sorted events, skipping the sort in _pack().
+
+
+# number of set bits in every possible byte
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.int64)
+
+_SECONDS_PER_DAY = 86400
+
+# seconds filled per step when building a timeline: a multiple of 8, so every chunk packs into whole bytes
+_CHUNK_SECONDS = 2**20
+
+
+
+class AudibilityTimeline(object):
+    """
+    One bit per second, set where at least one event was audible.
+
+    Parameters
+    ----------
+    bits: numpy array of uint8, the packed timeline (most significant bit first, as np.packbits).
+    start: pandas Timestamp, the time of the first bit.
+    seconds: int, the number of seconds covered.
+    """
+
+    def __init__(self, bits, start, seconds):
+
+        self.bits = bits
+        self.start = pd.Timestamp(start)
+        self.seconds = int(seconds)
+
+    def __len__(self):
+        return self.seconds
+
+    def _check(self, other):
+        if(self.start != other.start or self.seconds != other.seconds):
+            raise ValueError("timelines must cover the same span; build them together with audibility_timelines()")
+
+    def __and__(self, other):
+        self._check(other)
+        return AudibilityTimeline(self.bits & other.bits, self.start, self.seconds)
+
+    def __or__(self, other):
+        self._check(other)
+        return AudibilityTimeline(self.bits | other.bits, self.start, self.seconds)
+
+    def __xor__(self, other):
+        self._check(other)
+        return AudibilityTimeline(self.bits ^ other.bits, self.start, self.seconds)
+
+    def __invert__(self):
+
+        bits = ~self.bits
+        # keep the padding bits past the end clear
+        if(self.seconds % 8):
+            bits[-1] &= np.uint8((0xFF << (8 - self.seconds % 8)) & 0xFF)
+
+        return AudibilityTimeline(bits, self.start, self.seconds)
+
+    def _window(self, t0, t1):
+
+        # second offsets of [t0, t1), clipped to the timeline
+        first = 0 if t0 is None else int((pd.Timestamp(t0) - self.start)//pd.Timedelta(seconds=1))
+        last = self.seconds if t1 is None else int(-(-(pd.Timestamp(t1) - self.start)//pd.Timedelta(seconds=1)))
+
+        return min(max(first, 0), self.seconds), min(max(last, 0), self.seconds)
+
+    def to_array(self, t0 = None, t1 = None):
+        """
+        Unpack the timeline (or a window of it) into one boolean per second.
+
+        Returns
+        -------
+        numpy array of booleans
+        """
+
+        first, last = self._window(t0, t1)
+        if(last <= first):
+            return np.zeros(0, dtype=bool)
+
+        # unpack only the bytes touching the window
+        block = np.unpackbits(self.bits[first//8:(last + 7)//8])
+
+        return block[first % 8:first % 8 + last - first].astype(bool)
+
+    def audible_seconds(self, t0 = None, t1 = None):
+        """
+        The union audible duration, in seconds, over the whole timeline or the window [t0, t1).
+
+        Returns
+        -------
+        int
+        """
+
+        first, last = self._window(t0, t1)
+        if(last <= first):
+            return 0
+
+        # whole bytes by popcount, the partial bytes at either edge by unpacking
+        head = -(-first//8)
+        tail = last//8
+        if(head >= tail):
+            return int(self.to_array(t0, t1).sum())
+
+        count = _POPCOUNT[self.bits[head:tail]].sum()
+        if(first < head*8):
+            count += np.unpackbits(self.bits[first//8:head])[first % 8:].sum()
+        if(last > tail*8):
+            count += np.unpackbits(self.bits[tail:tail + 1])[:last - tail*8].sum()
+
+        return int(count)
+
+    def percent_time_audible(self, t0 = None, t1 = None):
+        """
+        Percent of seconds with at least one audible event, over the whole timeline or the window [t0, t1).
+
+        Returns
+        -------
+        float
+        """
+
+        first, last = self._window(t0, t1)
+        if(last <= first):
+            return np.nan
+
+        return 100*self.audible_seconds(t0, t1)/(last - first)
+
+    def hourly_percent_time_audible(self):
+        """
+        Percent time audible in every hour of the timeline (hourly saturation).
+
+        Returns
+        -------
+        pandas Series indexed by hour
+        """
+
+        # whole days from midnight, so each hour is exactly 450 bytes
+        counts = _POPCOUNT[self.bits[:self.seconds//8]].reshape(-1, 3600//8).sum(axis=1)
+        index = pd.date_range(self.start, periods=len(counts), freq="h")
+
+        return pd.Series(100*counts/3600., index=index, name="percent_time_audible")
+
+    def gaps(self, t0 = None, t1 = None, unit = "seconds"):
+        """
+        The noise free intervals: lengths of the inaudible runs between two audible seconds.
+        Runs before the first or after the last audible second in the window are censored and left out.
+
+        Parameters
+        ----------
+        t0, t1: optional, bounds of the window to consider.  Defaults to the whole timeline.
+        unit: str, a value that indicates the units desired for the output value.  Defaults to "seconds".
+
+        Returns
+        -------
+        numpy array of floats
+        """
+
+        unitDict = {"seconds":1, "minutes":60, "hours":3600, "days":86400}
+
+        audible = self.to_array(t0, t1)
+        edges = np.flatnonzero(np.diff(audible.astype(np.int8)))
+
+        # a gap opens after a 1 -> 0 edge and closes at the next 0 -> 1 edge
+        opens = edges[~audible[edges + 1]] + 1
+        closes = edges[audible[edges + 1]] + 1
+        if(len(opens) == 0 or len(closes) == 0):
+            return np.zeros(0)
+
+        closes = closes[closes > opens[0]]
+        opens = opens[:len(closes)]
+
+        return (closes - opens)/float(unitDict[unit])
+
+
+
+def _span(srcid, start, end):
+
+    starts = srcid_starts_ns(srcid)
+    ends = starts + np.round(srcid_durations_s(srcid)*1e9).astype("int64")
+
+    day = _SECONDS_PER_DAY*10**9
+    # with no events, an unspecified bound falls back to the other one, giving an empty timeline if neither is given
+    first = pd.Timestamp(start).value if start is not None else (starts.min() if len(starts) else None)
+    last = pd.Timestamp(end).value if end is not None else (ends.max() if len(ends) else first)
+    if(first is None):
+        first = 0 if last is None else last
+        last = first
+
+    # whole days, from the midnight at or before the first event
+    first = (first//day)*day
+    last = -(-last//day)*day
+
+    return first, int((last - first)//10**9)
+
+
+def _pack(starts, ends, first, seconds):
+
+    # the seconds each event touches: from the second holding its start up to the one holding its end
+    lo = np.clip((starts - first)//10**9, 0, seconds)
+    hi = np.clip(-(-(ends - first)//10**9), 0, seconds)
+    keep = hi > lo
+
+    # merge overlapping and touching events into disjoint runs of seconds [run_lo, run_hi), in order
+    lo, hi = lo[keep], hi[keep]
+    if(np.any(lo[1:] < lo[:-1])):
+        order = np.argsort(lo, kind="stable")
+        lo, hi = lo[order], hi[order]
+    hi = np.maximum.accumulate(hi)
+    new = np.ones(len(lo), dtype=bool)
+    new[1:] = lo[1:] > hi[:-1]
+    run_lo = lo[new]
+    run_hi = hi[np.append(np.flatnonzero(new)[1:] - 1, len(lo) - 1)] if len(lo) else hi
+
+    bits = np.zeros(-(-seconds//8), dtype=np.uint8)
+    for c0 in range(0, seconds, _CHUNK_SECONDS):
+        c1 = min(c0 + _CHUNK_SECONDS, seconds)
+
+        # the runs overlapping this chunk, clipped to it; runs neither overlap nor touch, so no two marks coincide
+        i0 = np.searchsorted(run_hi, c0, side="right")
+        i1 = np.searchsorted(run_lo, c1, side="left")
+        if(i1 <= i0):
+            continue
+
+        marks = np.zeros(c1 - c0 + 1, dtype=np.int8)
+        marks[np.maximum(run_lo[i0:i1], c0) - c0] = 1
+        marks[np.minimum(run_hi[i0:i1], c1) - c0] = -1
+
+        bits[c0//8:-(-c1//8)] = np.packbits(np.cumsum(marks[:-1], dtype=np.int8) > 0)
+
+    return bits
+
+
+
+def audibility_timeline(srcid, source = "all", start = None, end = None, index = None):
+    """
+    Build the per-second audibility timeline of a source subset.
+
+    Parameters
+    ----------
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
+    source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
+    start, end: optional, the span to cover, extended to whole days.  Defaults to the days holding the srcid events.
+    index: SRCIDIntervalIndex, optional.  An index over the same srcid and source, whose sorted events are reused.  Defaults to None.
+
+    Returns
+    -------
+    AudibilityTimeline
+    """
+
+    first, seconds = _span(srcid, start, end)
+    starts, ends, _ = indexed_events(srcid, source, index)
+
+    return AudibilityTimeline(_pack(starts, ends, first, seconds), pd.Timestamp(first), seconds)
+
+
+
+def audibility_timelines(srcid, by = "source_group", start = None, end = None, index = None):
+    """
+    Build one audibility timeline per source category, all covering the same span so they can be combined with & | ^ ~.
+    The "all" entry holds the union over every category.
+
+    Parameters
+    ----------
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
+    by: str, optional.  "source_group" (air, vehicle, ...) or "srcID" (individual codes).  Defaults to "source_group".
+    start, end: optional, the span to cover, extended to whole days.  Defaults to the days holding the srcid events.
+    index: SRCIDIntervalIndex, optional.  An index over the same srcid with source "all", whose sorted events are reused.  Defaults to None.
+
+    Returns
+    -------
+    dict of {category: AudibilityTimeline}
+    """
+
+    first, seconds = _span(srcid, start, end)
+
+    starts, ends, positions = indexed_events(srcid, "all", index)
+    codes = srcid_codes(srcid)[positions]
+
+    if(by == "source_group"):
+        groups = codes//SOURCE_CODE_SCALE
+        label = lambda g: SOURCE_GROUPS.get(g, str(g))
+    elif(by == "srcID"):
+        groups = codes
+        label = lambda g: g/SOURCE_CODE_SCALE
+    else:
+        raise ValueError('by must be either "source_group" or "srcID"')
+
+    timelines = {"all": AudibilityTimeline(_pack(starts, ends, first, seconds), pd.Timestamp(first), seconds)}
+    for g in np.unique(groups):
+        rows = groups == g
+        timelines[label(g)] = AudibilityTimeline(_pack(starts[rows], ends[rows], first, seconds), pd.Timestamp(first), seconds)
+
+    return timelines
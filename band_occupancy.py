@@ -0,0 +1,145 @@
+import pandas as pd
+import numpy as np
+
+from kernels import split_at_hours
+from srcid_compact import source_mask, srcid_codes, srcid_durations_s, srcid_levels, srcid_starts_ns, SOURCE_CODE_SCALE
+from stratified import SOURCE_GROUPS
+from weighting import CENTER_FREQUENCIES, NVSPL_BANDS
+
+#------------------------------------------------------------------------------------------------------------------
+# ### ONE-THIRD-OCTAVE BAND OCCUPANCY FROM SRCID FREQUENCY SPANS
+#
+# Every SRCID annotation carries the frequency span of the source (Hz_L to Hz_U).  Each span is mapped onto
+# NVSPL band indices with two searchsorted calls against the band edges, and each event adds its weight (its
+# duration, its SEL energy, or 1) to a run of bands.  Runs are accumulated in a 2-D difference array, one row
+# per stratum (source group, or source group x hour of day), with a single bincount: +weight at the first band,
+# -weight past the last, then a cumulative sum across bands:
+#
+#     band_occupancy(srcid)                                    # seconds of each source group in each band
+#     band_occupancy(srcid, weight = "energy", by_hour = True, normalize = True)
+
+
+# base-10 one-third-octave band edges, 10^((n -/+ 0.5)/10) Hz
+_LOWER_EDGES = CENTER_FREQUENCIES/np.power(10, 0.05)
+_UPPER_EDGES = CENTER_FREQUENCIES*np.power(10, 0.05)
+
+
+def band_span(Hz_L, Hz_U):
+    """
+    The NVSPL bands overlapped by frequency spans, as half-open index ranges into weighting.NVSPL_BANDS.
+
+    Parameters
+    ----------
+    Hz_L, Hz_U: array-like of floats, the lower and upper frequencies of each span, in Hz.
+
+    Returns
+    -------
+    tuple: (first band index, one past the last band index) as numpy arrays of int64; equal where a span overlaps no band
+    """
+
+    Hz_L = np.asarray(Hz_L, dtype=float)
+    Hz_U = np.asarray(Hz_U, dtype=float)
+
+    # the first band ending above Hz_L, and the bands beginning at or below Hz_U
+    first = np.searchsorted(_UPPER_EDGES, Hz_L, side="right")
+    stop = np.searchsorted(_LOWER_EDGES, Hz_U, side="right")
+
+    valid = ~(np.isnan(Hz_L) | np.isnan(Hz_U))
+    stop = np.where(valid, np.maximum(stop, first), first)
+
+    return first.astype(np.int64), stop.astype(np.int64)
+
+
+
+def band_occupancy(srcid, weight = "duration", by = "source_group", by_hour = False, source = "all", normalize = False):
+    """
+    How much of each source category's activity occupies each one-third-octave band.
+
+    Parameters
+    ----------
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
+    weight: str, optional.  What each event contributes to the bands it spans: "duration" (seconds), "energy" (10^(SEL/10), A-weighted) or "count".  Defaults to "duration".
+    by: str or None, optional.  "source_group" (air, vehicle, ...), "srcID" for individual codes, or None for all events together.  Defaults to "source_group".
+    by_hour: boolean, optional.  Also split by hour of day.  Durations and energy of events crossing an hour boundary are shared between the hours in proportion to time; counts go to the starting hour.  Defaults to False.
+    source: str or list of floats, optional.  Which subset of srcid codes to include - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
+    normalize: boolean, optional.  Divide each row by the total weight of its events, giving the fraction of the source's time (energy, events) that occupies each band.  Defaults to False.
+
+    Returns
+    -------
+    pandas DataFrame indexed by source group (or srcID, or "all"), and hour when by_hour, with one column per NVSPL band
+    """
+
+    if(weight not in ["duration", "energy", "count"]):
+        raise ValueError('weight must be "duration", "energy" or "count"')
+    if(by not in ["source_group", "srcID", None]):
+        raise ValueError('by must be "source_group", "srcID" or None')
+
+    mask = source_mask(srcid, source)
+    first, stop = band_span(srcid_levels(srcid, "Hz_L")[mask], srcid_levels(srcid, "Hz_U")[mask])
+    durations = srcid_durations_s(srcid)[mask].astype(np.float64)
+
+    if(weight == "duration"):
+        weights = durations
+    elif(weight == "energy"):
+        weights = np.nan_to_num(np.power(10, srcid_levels(srcid, "SEL")[mask]/10))
+    else:
+        weights = np.ones(len(first))
+
+    codes = srcid_codes(srcid)[mask]
+    if(by == "source_group"):
+        keys = codes//SOURCE_CODE_SCALE
+    elif(by == "srcID"):
+        keys = codes
+    else:
+        keys = np.zeros(len(codes), dtype=np.int64)
+    labels, stratum = np.unique(keys, return_inverse=True)
+
+    # with hours, each event becomes one piece per clock hour it touches
+    hours = 1
+    if(by_hour):
+        hours = 24
+        starts = srcid_starts_ns(srcid)[mask]
+        ends = starts + np.round(durations*1e9).astype("int64")
+        if(weight == "count"):
+            row, piece_start, share = np.arange(len(starts)), starts, np.ones(len(starts))
+        else:
+            row, piece_start, piece_end = split_at_hours(starts, ends)
+
+            # zero-length events produce no piece, so they keep their whole weight in the hour they start
+            instant = np.flatnonzero(ends <= starts)
+            row = np.concatenate([row, instant])
+            piece_start = np.concatenate([piece_start, starts[instant]])
+            piece_end = np.concatenate([piece_end, starts[instant]])
+
+            length = (ends - starts)[row].astype(np.float64)
+            share = np.where(length > 0, (piece_end - piece_start)/np.where(length > 0, length, 1), 1.)
+        hour = (piece_start//(3600*10**9)) % 24
+        first, stop, stratum, weights = first[row], stop[row], stratum[row]*24 + hour, weights[row]*share
+
+    # the 2-D difference array: one row per stratum, one column per band plus an overflow column
+    width = len(NVSPL_BANDS) + 1
+    rows = len(labels)*hours
+    spans = stop > first
+    difference = np.bincount(np.concatenate([stratum[spans]*width + first[spans], stratum[spans]*width + stop[spans]]),
+                             weights=np.concatenate([weights[spans], -weights[spans]]), minlength=rows*width)
+    occupancy = np.cumsum(difference.reshape(rows, width), axis=1)[:, :-1]
+
+    if(normalize):
+        totals = np.bincount(stratum, weights=weights, minlength=rows)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            occupancy = occupancy/totals[:, None]
+
+    if(by == "source_group"):
+        names = [SOURCE_GROUPS.get(g, str(g)) for g in labels]
+    elif(by == "srcID"):
+        names = list(labels/float(SOURCE_CODE_SCALE))
+    else:
+        names = ["all"]*len(labels)
+    level = "source_group" if by == "source_group" else ("srcID" if by == "srcID" else "source")
+
+    if(by_hour):
+        index = pd.MultiIndex.from_product([names, range(24)], names=[level, "hour"])
+    else:
+        index = pd.Index(names, name=level)
+
+    return pd.DataFrame(occupancy, index=index, columns=NVSPL_BANDS)
@@ -0,0 +1,210 @@
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import sys
+import time
+
+import pandas as pd
+import numpy as np
+
+import derivedDataFunctions
+import merge_SRCID
+import synthetic_data
+from function_catalog import call_arguments, public_functions
+
+#------------------------------------------------------------------------------------------------------------------
+# ### SYNTHETIC-DATA BENCHMARK SUITE
+#
+# Times every public function in derivedDataFunctions and merge_SRCID on seeded synthetic data
+# and appends the results to a JSON-lines history file, one record per (scale, function).
+#
+#     python benchmark_suite.py --scale season --scale year
+#     python benchmark_suite.py --compare
+
+
+# name: (days of srcid/dailypa/loudevents, hours of NVSPL, number of sites)
+SCALES = {"season": (90, 24, 1),
+          "year": (365, 72, 1),
+          "decade": (3650, 168, 1),
+          "park": (90, 24, 100)}
+
+HISTORY_FILE = "benchmark_history.jsonl"
+
+
+def _rows(data):
+
+    try:
+        return len(data)
+    except TypeError:
+        return 0
+
+
+def time_function(function, sites, repeat = 3):
+    """
+    Time a function over every synthetic site, keeping the best of several repeats.
+
+    Parameters
+    ----------
+    function: callable, a public function from derivedDataFunctions or merge_SRCID.
+    sites: list of dicts produced by synthetic_data.synthetic_site().
+    repeat: int, optional.  The number of repeats; the fastest is reported.  Defaults to 3.
+
+    Returns
+    -------
+    dict with "seconds", "rows" and "status" (and "error" if the function raised)
+    """
+
+    best = np.inf
+    rows = 0
+
+    for r in range(repeat):
+
+        elapsed = 0.
+        for site in sites:
+            args = call_arguments(function, site)
+            if(r == 0):
+                rows = rows + _rows(args[0])
+
+            # time each call on its own copy, so a function that modified its input could not affect the next
+            if(hasattr(args[0], "copy")):
+                args[0] = args[0].copy()
+
+            t = time.perf_counter()
+            try:
+                function(*args)
+            except Exception as e:
+                return {"seconds": None, "rows": rows, "status": "error",
+                        "error": type(e).__name__ + ": " + str(e)[:200]}
+            elapsed = elapsed + (time.perf_counter() - t)
+
+        best = min(best, elapsed)
+
+    return {"seconds": best, "rows": rows, "status": "ok"}
+
+
+def _revision():
+
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(scales = ("season",), history = HISTORY_FILE, repeat = 3, seed = 0, functions = None):
+    """
+    Benchmark every public function at each scale and append the results to a history file.
+
+    Parameters
+    ----------
+    scales: list of str, optional.  Keys of SCALES to run.  Defaults to ("season",).
+    history: str, optional.  Path of the JSON-lines history file, or None to skip writing.  Defaults to "benchmark_history.jsonl".
+    repeat: int, optional.  The number of repeats per function; the fastest is reported.  Defaults to 3.
+    seed: int, optional.  Seed for the synthetic data.  Defaults to 0.
+    functions: list of str, optional.  Only benchmark functions with these names.
+
+    Returns
+    -------
+    list of dicts, one record per (scale, function)
+    """
+
+    stamp = datetime.datetime.now().isoformat(timespec="seconds")
+    environment = {"revision": _revision(),
+                   "python": platform.python_version(),
+                   "numpy": np.__version__,
+                   "pandas": pd.__version__}
+
+    targets = public_functions(derivedDataFunctions) + public_functions(merge_SRCID)
+    if(functions is not None):
+        targets = [(name, f) for name, f in targets if name in functions]
+
+    records = []
+    for scale in scales:
+
+        days, nvspl_hours, n_sites = SCALES[scale]
+        sites = [synthetic_data.synthetic_site(days = days, nvspl_hours = nvspl_hours, seed = seed + s)
+                 for s in range(n_sites)]
+
+        for name, function in targets:
+            result = time_function(function, sites, repeat = repeat)
+            record = dict(environment, timestamp=stamp, scale=scale, sites=n_sites,
+                          module=function.__module__, function=name, **result)
+            records.append(record)
+
+    if(history is not None):
+        with open(history, "a") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+
+    return records
+
+
+def compare_history(history = HISTORY_FILE, threshold = 1.2):
+    """
+    Compare the latest run in a history file against the run before it.
+
+    Parameters
+    ----------
+    history: str, optional.  Path of the JSON-lines history file.  Defaults to "benchmark_history.jsonl".
+    threshold: float, optional.  Slowdown ratio (latest / previous) flagged as a regression.  Defaults to 1.2.
+
+    Returns
+    -------
+    pandas DataFrame with previous and latest seconds, their ratio, an error flag (the function raised in the latest run)
+    and a regression flag, per (scale, function)
+    """
+
+    with open(history) as f:
+        runs = pd.DataFrame([json.loads(line) for line in f if line.strip()])
+
+    stamps = sorted(runs.timestamp.unique())
+    if(len(stamps) < 2):
+        raise ValueError("at least two runs are needed for a comparison")
+
+    key = ["scale", "module", "function"]
+    ok = runs.loc[runs.status == "ok"]
+    previous = ok.loc[ok.timestamp == stamps[-2]].set_index(key).seconds
+    latest = ok.loc[ok.timestamp == stamps[-1]].set_index(key).seconds
+
+    out = pd.DataFrame({"previous": previous, "latest": latest}).dropna()
+    out["ratio"] = out.latest/out.previous
+    out["error"] = False
+
+    # functions that raised in the latest run have no timing, and always count as regressions
+    failed = runs.loc[(runs.timestamp == stamps[-1]) & (runs.status == "error")].set_index(key)
+    if(len(failed)):
+        failed = pd.DataFrame({"previous": previous.reindex(failed.index), "latest": np.nan, "ratio": np.nan, "error": True}, index=failed.index)
+        out = pd.concat([out, failed])
+    out["regression"] = out.error | (out.ratio > threshold)
+
+    return out.sort_values("ratio", ascending=False)
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark derivedDataFunctions and merge_SRCID on synthetic data.")
+    parser.add_argument("--scale", action="append", choices=sorted(SCALES), help="scale(s) to run; defaults to season")
+    parser.add_argument("--history", default=HISTORY_FILE, help="JSON-lines history file to append to")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--function", action="append", help="only benchmark these functions")
+    parser.add_argument("--compare", action="store_true", help="compare the last two runs in the history file instead")
+    options = parser.parse_args()
+
+    if(options.compare):
+        comparison = compare_history(options.history)
+        print(comparison.to_string())
+        sys.exit(1 if comparison.regression.any() else 0)
+
+    records = run_benchmarks(options.scale or ["season"], options.history, options.repeat, options.seed, options.function)
+    for record in records:
+        seconds = "{0:.4f}".format(record["seconds"]) if record["status"] == "ok" else record["error"]
+        print("{0:8s} {1:40s} {2}".format(record["scale"], record["function"], seconds))
+
+    errors = [record["function"] for record in records if record["status"] == "error"]
+    if(errors):
+        print("{0} function(s) raised: {1}".format(len(errors), ", ".join(errors)))
+        sys.exit(1)
@@ -0,0 +1,181 @@
+import pandas as pd
+import numpy as np
+
+from srcid_compact import srcid_codes, SOURCE_CODE_SCALE
+from srcid_index import indexed_events
+from stratified import SOURCE_GROUPS
+
+#------------------------------------------------------------------------------------------------------------------
+# ### SOURCE-CONCURRENCY TIMELINE AND OVERLAP STATISTICS
+#
+# A sweep line over the SRCID event boundaries: every start is a +1 and every end a -1, sorted once
+# (O(n log n)) and accumulated with a cumulative sum, giving the number of concurrently audible sources
+# as a step function over the whole record.  Events are half-open intervals [start, start + len), so an
+# event ending at the instant another starts does not count as an overlap.  Every function takes an optional
+# SRCIDIntervalIndex (srcid_index.py) built over the same srcid and source, and reuses its sorted events.
+
+
+def _boundaries(srcid, source, index):
+
+    starts, ends, positions = indexed_events(srcid, source, index)
+
+    times = np.concatenate([starts, ends])
+    deltas = np.concatenate([np.ones(len(starts), dtype=np.int64), -np.ones(len(ends), dtype=np.int64)])
+
+    # sort by time, ends (-1) before starts (+1) at the same instant
+    order = np.lexsort((deltas, times))
+
+    return times[order], deltas[order], positions, order
+
+
+def _steps(times, counts):
+
+    # keep the last value at each distinct time: one step per change point
+    last = np.ones(len(times), dtype=bool)
+    last[:-1] = times[1:] != times[:-1]
+
+    return times[last], counts[last]
+
+
+def concurrency_timeline(srcid, source = "all", index = None):
+    """
+    The number of concurrently audible sources as a step function over the whole record.
+
+    Parameters
+    ----------
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
+    source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
+    index: SRCIDIntervalIndex, optional.  An index over the same srcid and source, whose sorted events are reused.  Defaults to None.
+
+    Returns
+    -------
+    pandas Series of ints indexed by the times at which the count changes; each value holds until the next index
+    """
+
+    times, deltas, _, _ = _boundaries(srcid, source, index)
+    times, counts = _steps(times, np.cumsum(deltas))
+
+    return pd.Series(counts, index=pd.DatetimeIndex(times.view("datetime64[ns]")), name="concurrent_sources")
+
+
+def time_at_concurrency(srcid, source = "all", unit = "seconds", index = None):
+    """
+    Total time with at least k sources audible at once, for every k observed.
+
+    Parameters
+    ----------
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
+    source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
+    unit: str, a value that indicates the units desired for the output value.  Defaults to "seconds".
+    index: SRCIDIntervalIndex, optional.  An index over the same srcid and source, whose sorted events are reused.  Defaults to None.
+
+    Returns
+    -------
+    pandas Series indexed by k = 1, 2, ... of the time with k or more concurrent sources
+    """
+
+    unitDict = {"seconds":1, "minutes":60, "hours":3600, "days":86400}
+
+    times, deltas, _, _ = _boundaries(srcid, source, index)
+    times, counts = _steps(times, np.cumsum(deltas))
+    if(len(times) == 0):
+        return pd.Series(dtype=float, name="time_at_or_above")
+
+    # time spent at exactly each count, then a reverse cumulative sum for "at least k"
+    exactly = np.bincount(counts[:-1], weights=np.diff(times)/1e9/unitDict[unit])
+    at_least = np.cumsum(exactly[::-1])[::-1]
+
+    return pd.Series(at_least[1:], index=pd.Index(np.arange(1, len(at_least)), name="k"), name="time_at_or_above")
+
+
+def peak_concurrency(srcid, freq = "D", source = "all", index = None):
+    """
+    The peak number of concurrently audible sources in each day (freq="D") or hour (freq="h").
+
+    Parameters
+    ----------
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
+    freq: str, optional.  "D" for daily or "h" for hourly peaks.  Defaults to "D".
+    source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
+    index: SRCIDIntervalIndex, optional.  An index over the same srcid and source, whose sorted events are reused.  Defaults to None.
+
+    Returns
+    -------
+    pandas Series of ints indexed by period start, covering every period from the first to the last event
+    """
+
+    periods = {"D": 86400, "H": 3600}
+    if(str(freq).upper() not in periods):
+        raise ValueError('freq must be either "D" (daily) or "h" (hourly)')
+    period = periods[str(freq).upper()]*10**9
+
+    times, deltas, _, _ = _boundaries(srcid, source, index)
+    times, counts = _steps(times, np.cumsum(deltas))
+    if(len(times) == 0):
+        return pd.Series(dtype=int, name="peak_concurrent_sources")
+
+    # each step [t_i, t_i+1) with a nonzero count touches periods floor(t_i) .. floor(t_i+1 - 1)
+    active = counts[:-1] > 0
+    first = times[:-1][active]//period
+    last = (times[1:][active] - 1)//period
+    spans = last - first + 1
+
+    touched = np.repeat(first, spans) + np.arange(spans.sum()) - np.repeat(np.cumsum(spans) - spans, spans)
+    values = np.repeat(counts[:-1][active], spans)
+
+    origin = times[0]//period
+    peaks = np.zeros(times[-1]//period - origin + 1, dtype=np.int64)
+    np.maximum.at(peaks, touched - origin, values)
+
+    index = pd.DatetimeIndex(((origin + np.arange(len(peaks)))*period).view("datetime64[ns]"))
+    return pd.Series(peaks, index=index, name="peak_concurrent_sources")
+
+
+def cooccurrence(srcid, by = "source_group", source = "all", unit = "seconds", index = None):
+    """
+    How long each pair of source categories was audible at the same time.  The diagonal holds the
+    total audible time of each category (overlaps within a category counted once).
+
+    Parameters
+    ----------
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
+    by: str, optional.  "source_group" (air, vehicle, ...) or "srcID" (individual codes).  Defaults to "source_group".
+    source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
+    unit: str, a value that indicates the units desired for the output value.  Defaults to "seconds".
+    index: SRCIDIntervalIndex, optional.  An index over the same srcid and source, whose sorted events are reused.  Defaults to None.
+
+    Returns
+    -------
+    pandas DataFrame, a symmetric category x category matrix of co-audible time
+    """
+
+    unitDict = {"seconds":1, "minutes":60, "hours":3600, "days":86400}
+
+    times, deltas, positions, order = _boundaries(srcid, source, index)
+
+    codes = srcid_codes(srcid)[positions]
+    if(by == "source_group"):
+        groups = codes//SOURCE_CODE_SCALE
+        labels = [SOURCE_GROUPS.get(g, str(g)) for g in np.unique(groups)]
+    elif(by == "srcID"):
+        groups = codes
+        labels = [g/SOURCE_CODE_SCALE for g in np.unique(groups)]
+    else:
+        raise ValueError('by must be either "source_group" or "srcID"')
+
+    # one running count per category: scatter each boundary's +1/-1 into its category's column
+    category = np.unique(groups, return_inverse=True)[1].reshape(-1)
+    category = np.concatenate([category, category])[order]
+
+    per_category = np.zeros((len(times), len(labels)), dtype=np.int32)
+    per_category[np.arange(len(times)), category] = deltas
+    np.cumsum(per_category, axis=0, out=per_category)
+
+    times, rows = _steps(times, np.arange(len(times)))
+    audible = (per_category[rows[:-1]] > 0).astype(float)
+    durations = np.diff(times)/1e9/unitDict[unit]
+
+    # pairwise co-audible time in one matrix product over the step segments
+    matrix = audible.T @ (audible*durations[:, None])
+
+    return pd.DataFrame(matrix, index=labels, columns=labels)
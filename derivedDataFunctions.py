@@ -1,17 +1,32 @@
+import datetime
+
 import pandas as pd
 import numpy as np
 
+import _core
+from arrow_backend import accepts_arrow, column_names, column_values
+from stratified import SOURCE_GROUPS
+from weighting import weighted_level
+
+# Denali Backcountry Management Plan standards by zone: the Lmax of an event (dBA), and the percent time audible in an hour
+SPL_ZONES = {"low":40.0, "med":40.0, "medium":40.0, "high":60., "very high":60., "v. high":60., "veryhigh":60., "v high":60.}
+PA_ZONES = {"low": 5., "med": 15., "medium":15., "high":25., "very high":50., "v. high":50., "veryhigh":50., "v high":50.}
+
+# 'look-up' dictionary to translate the NFI time unit from string to integer (in seconds)
+NFI_UNITS = {"seconds":1, "minutes":60, "hours":3600, "days":86400}
+
 #------------------------------------------------------------------------------------------------------------------
 # ### AMPLITUDE METRICS FROM SRCID
 
 
+@accepts_arrow
 def quantile_amplitude(srcid, q, metric = "Lmax", weight = "A", source = "all"):
     """
     Calculate a quantile for amplitude values of SPLAT-annotated sources at a site.
 
     Parameters
     ----------
-    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library.
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
     q: float, a value that indicates the quantile desired, from 0.0 (minimum) to 1.0 (maximum.) 
     metric: str, optional.  The amplitude metric to use when preforming the calculation, either "Lmax" or "SEL". Defaults to "Lmax" if unspecified.
     weight: str, optional.  The acoustic weighting used to calculate Lmax, either "A" or "T". Defaults to "A" if unspecified.  
@@ -21,39 +36,18 @@ def quantile_amplitude(srcid, q, metric = "Lmax", weight = "A", source = "all"):
     -------
     formatted float
     """
-
-    # allow the user to enter weighting networks either way, but convert to upper case
-    w = weight.upper()
-
-    # intialize a weighting lookup function based on the metric used
-    if(metric == "Lmax"):
-        lookup = {"A":"MaxSPL", "T":"MaxSPLt"}
-    elif(metric == "SEL"):
-        lookup = {"A":"SEL", "T":"SELt"}
-    else:
-        raise ValueError('metric must be either "Lmax" or "SEL"')
-
-    
-    if(type(source) == str):
-        if(source.lower() == "all"):
-            return float("{0:.1f}".format(srcid.loc[:,lookup[w]].quantile(q)))
-            
-        elif(source.lower() == "air"):
-            return float("{0:.1f}".format(srcid.loc[(srcid.srcID > 0) & (srcid.srcID < 2.),lookup[w]].quantile(q)))
-    
-    else:
-        return float("{0:.1f}".format(srcid.loc[srcid.srcID.isin(source), lookup[w]].quantile(q)))
-
+    return _core.round_level(_core.quantile(_core.levels(srcid, metric, weight, source), q))
 
 
 
+@accepts_arrow
 def mad_amplitude(srcid, metric = "Lmax", weight = "A", source = "all"):
     """
     Calculate the median absolute deviation for amplitude values of SPLAT-annotated sources at a site.
 
     Parameters
     ----------
-    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library.
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
     metric: str, optional.  The amplitude metric to use when preforming the calculation, either "Lmax" or "SEL". Defaults to "Lmax" if unspecified.
     weight: str, specifies the acoustic weighting used to calculate Lmax, either "A" or "T". Defaults to "A" if unspecified.  
     source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
@@ -62,39 +56,18 @@ def mad_amplitude(srcid, metric = "Lmax", weight = "A", source = "all"):
     -------
     formatted float
     """
-
-    # allow the user to enter weighting networks either way, but convert to upper case
-    w = weight.upper()
-
-    # intialize a weighting lookup function based on the metric used
-    if(metric == "Lmax"):
-        lookup = {"A":"MaxSPL", "T":"MaxSPLt"}
-    elif(metric == "SEL"):
-        lookup = {"A":"SEL", "T":"SELt"}
-    else:
-        raise ValueError('metric must be either "Lmax" or "SEL"')
-    
-
-    if(type(source) == str):
-        if(source.lower() == "all"):
-            return float("{0:.1f}".format(pd.Series(abs(srcid.loc[:,lookup[w]].median() - srcid.loc[:,lookup[w]])).median()))
-            
-        elif(source.lower() == "air"):
-            return float("{0:.1f}".format(pd.Series(abs(srcid.loc[(srcid.srcID > 0) & (srcid.srcID < 2.),lookup[w]].median() - srcid.loc[(srcid.srcID > 0) & (srcid.srcID < 2.),lookup[w]])).median()))
-    
-    else:
-        return float("{0:.1f}".format(pd.Series(abs(srcid.loc[srcid.srcID.isin(source),lookup[w]].median() - srcid.loc[srcid.srcID.isin(source),lookup[w]])).median()))
-
+    return _core.round_level(_core.mad(_core.levels(srcid, metric, weight, source)))
 
 
 
+@accepts_arrow
 def iqr_amplitude(srcid, metric = "Lmax", weight = "A", source = "all"):
     """
     Calculate the interquartile range for amplitude values of SPLAT-annotated sources at a site.
 
     Parameters
     ----------
-    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library.
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
     metric: str, optional.  The amplitude metric to use when preforming the calculation, either "Lmax" or "SEL". Defaults to "Lmax" if unspecified.
     weight: str, optional.  The acoustic weighting used to calculate Lmax, either "A" or "T". Defaults to "A" if unspecified.  
     source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
@@ -103,39 +76,18 @@ def iqr_amplitude(srcid, metric = "Lmax", weight = "A", source = "all"):
     -------
     formatted float
     """
-
-    # allow the user to enter weighting networks either way, but convert to upper case
-    w = weight.upper()
-
-    # intialize a weighting lookup function based on the metric used
-    if(metric == "Lmax"):
-        lookup = {"A":"MaxSPL", "T":"MaxSPLt"}
-    elif(metric == "SEL"):
-        lookup = {"A":"SEL", "T":"SELt"}
-    else:
-        raise ValueError('metric must be either "Lmax" or "SEL"')
-    
-
-    if(type(source) == str):
-        if(source.lower() == "all"):
-            return float("{0:.1f}".format(srcid.loc[:,lookup[w]].quantile(0.75) - srcid.loc[:,lookup[w]].quantile(0.25)))
-            
-        elif(source.lower() == "air"):
-            return float("{0:.1f}".format(srcid.loc[(srcid.srcID > 0) & (srcid.srcID < 2.),lookup[w]].quantile(0.75) - srcid.loc[(srcid.srcID > 0) & (srcid.srcID < 2.),lookup[w]].quantile(0.25)))
-    
-    else:
-        return float("{0:.1f}".format(srcid.loc[srcid.srcID.isin(source), lookup[w]].quantile(0.75) - srcid.loc[srcid.srcID.isin(source), lookup[w]].quantile(0.25)))        
-
+    return _core.round_level(_core.iqr(_core.levels(srcid, metric, weight, source)))
 
 
 
+@accepts_arrow
 def mean_amplitude(srcid, metric = "Lmax", weight = "A", source = "all"):
     """
     Calculate a mean amplitude value for SPLAT-annotated sources at a site.
 
     Parameters
     ----------
-    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library.
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
     metric: str, optional.  The amplitude metric to use when preforming the calculation, either "Lmax" or "SEL". Defaults to "Lmax" if unspecified.
     weight: str, optional.  The acoustic weighting used to calculate Lmax, either "A" or "T". Defaults to "A" if unspecified.  
     source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
@@ -144,38 +96,18 @@ def mean_amplitude(srcid, metric = "Lmax", weight = "A", source = "all"):
     -------
     formatted float
     """
-    # allow the user to enter weighting networks either way, but convert to upper case
-    w = weight.upper()
-
-    # intialize a weighting lookup function based on the metric used
-    if(metric == "Lmax"):
-        lookup = {"A":"MaxSPL", "T":"MaxSPLt"}
-    elif(metric == "SEL"):
-        lookup = {"A":"SEL", "T":"SELt"}
-    else:
-        raise ValueError('metric must be either "Lmax" or "SEL"')
-
-
-    if(type(source) == str):
-        if(source.lower() == "all"):
-            return float("{0:.1f}".format(srcid.loc[:,lookup[w]].mean()))
-            
-        elif(source.lower() == "air"):
-            return float("{0:.1f}".format(srcid.loc[(srcid.srcID > 0) & (srcid.srcID < 2.),lookup[w]].mean()))
-    
-    else:
-        return float("{0:.1f}".format(srcid.loc[srcid.srcID.isin(source), lookup[w]].mean()))
-
+    return _core.round_level(_core.mean(_core.levels(srcid, metric, weight, source)))
 
 
 
+@accepts_arrow
 def stdev_amplitude(srcid, metric = "Lmax", weight = "A", source = "all"):
     """
     Calculate the standard deviation for amplitude values of SPLAT-annotated sources at a site.
 
     Parameters
     ----------
-    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library.
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
     metric: str, optional.  The amplitude metric to use when preforming the calculation, either "Lmax" or "SEL". Defaults to "Lmax" if unspecified.
     weight: str, optional.  The acoustic weighting used to calculate Lmax, either "A" or "T". Defaults to "A" if unspecified.  
     source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
@@ -184,38 +116,18 @@ def stdev_amplitude(srcid, metric = "Lmax", weight = "A", source = "all"):
     -------
     formatted float
     """
-    # allow the user to enter weighting networks either way, but convert to upper case
-    w = weight.upper()
-
-    # intialize a weighting lookup function based on the metric used
-    if(metric == "Lmax"):
-        lookup = {"A":"MaxSPL", "T":"MaxSPLt"}
-    elif(metric == "SEL"):
-        lookup = {"A":"SEL", "T":"SELt"}
-    else:
-        raise ValueError('metric must be either "Lmax" or "SEL"')
-
-    
-    if(type(source) == str):
-        if(source.lower() == "all"):
-            return float("{0:.1f}".format(srcid.loc[:,lookup[w]].std()))
-            
-        elif(source.lower() == "air"):
-            return float("{0:.1f}".format(srcid.loc[(srcid.srcID > 0) & (srcid.srcID < 2.),lookup[w]].std()))
-    
-    else:
-        return float("{0:.1f}".format(srcid.loc[srcid.srcID.isin(source), lookup[w]].std()))
-
+    return _core.round_level(_core.std(_core.levels(srcid, metric, weight, source)))
 
 
 
+@accepts_arrow
 def stderr_amplitude(srcid, metric = "Lmax", weight = "A", source = "all"):
     """
     Calculate the standard error of the mean for amplitude values of SPLAT-annotated sources at a site.
 
     Parameters
     ----------
-    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library.
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
     metric: str, optional.  The amplitude metric to use when preforming the calculation, either "Lmax" or "SEL". Defaults to "Lmax" if unspecified.
     weight: str, optional.  The acoustic weighting used to calculate Lmax, either "A" or "T". Defaults to "A" if unspecified.  
     source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
@@ -224,33 +136,15 @@ def stderr_amplitude(srcid, metric = "Lmax", weight = "A", source = "all"):
     -------
     formatted float
     """
-    # allow the user to enter weighting networks either way, but convert to upper case
-    w = weight.upper()
-
-    # intialize a weighting lookup function based on the metric used
-    if(metric == "Lmax"):
-        lookup = {"A":"MaxSPL", "T":"MaxSPLt"}
-    elif(metric == "SEL"):
-        lookup = {"A":"SEL", "T":"SELt"}
-    else:
-        raise ValueError('metric must be either "Lmax" or "SEL"')
-    
+    return _core.round_level(_core.stderr(_core.levels(srcid, metric, weight, source)))
 
-    if(type(source) == str):
-        if(source.lower() == "all"):
-            return float("{0:.1f}".format(srcid.loc[:,lookup[w]].std()/np.sqrt(srcid.loc[:,lookup[w]].count())))
-            
-        elif(source.lower() == "air"):
-            return float("{0:.1f}".format(srcid.loc[(srcid.srcID > 0) & (srcid.srcID < 2.),lookup[w]].std()/np.sqrt(srcid.loc[(srcid.srcID > 0) & (srcid.srcID < 2.),lookup[w]].count())))
-    
-    else:
-        return float("{0:.1f}".format(srcid.loc[srcid.srcID.isin(source), lookup[w]].std()/np.sqrt(srcid.loc[srcid.srcID.isin(source), lookup[w]].count())))  
 
 
 #------------------------------------------------------------------------------------------------------------------
 # ### DURATION METRICS FROM SRCID
 
   
+@accepts_arrow
 def total_event_duration(srcid, source = "all"):
     """
     Sum the duration of SPLAT-annotated sources at a site.  Note that this is NOT EQUAL to percent time audible.
@@ -258,26 +152,18 @@ def total_event_duration(srcid, source = "all"):
 
     Parameters
     ----------
-    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library.
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
     source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
     
     Returns
     -------
     formatted string (from timedelta)
     """
-    
-    if(type(source) == str):
-        if(source.lower() == "all"):
-            return srcid.loc[:,"len"].sum()
-            
-        elif(source.lower() == "air"):
-            return srcid.loc[(srcid.srcID > 0) & (srcid.srcID < 2.),"len"].sum()
-    
-    else:
-        return srcid.loc[srcid.srcID.isin(source),"len"].sum()
+    return pd.Timedelta(seconds = _core.total(_core.durations_s(srcid, source)))
 
 
 
+@accepts_arrow
 def quantile_event_duration(srcid, q, source = "all"):  
     """
     Return a quantile of durations from SPLAT-annotated sources at a site.  
@@ -285,7 +171,7 @@ def quantile_event_duration(srcid, q, source = "all"):
 
     Parameters
     ----------
-    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library.
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
     q: float, a value that indicates the quantile desired, from 0.0 (minimum) to 1.0 (maximum.)   
     source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
     
@@ -293,176 +179,101 @@ def quantile_event_duration(srcid, q, source = "all"):
     -------
     timedelta
     """
-    
-    if(type(source) == str):
-        if(source.lower() == "all"):
-            import datetime
-            return datetime.timedelta(seconds = srcid.loc[:,"len"].quantile(q).total_seconds())
-            
-        elif(source.lower() == "air"):
-            import datetime
-            return datetime.timedelta(seconds = srcid.loc[(srcid.srcID > 0) & (srcid.srcID < 2.),"len"].quantile(q).total_seconds())
-    
-    else:
-        import datetime
-        return datetime.timedelta(seconds = srcid.loc[srcid.srcID.isin(source),"len"].quantile(q).total_seconds())
-
+    return datetime.timedelta(seconds = _core.quantile(_core.durations_s(srcid, source), q))
 
 
 
+@accepts_arrow
 def mad_event_duration(srcid, source = "all"):  
     """
     Calculate the median absolute deviation for duration values of SPLAT-annotated sources at a site.
 
     Parameters
     ----------
-    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library. 
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py). 
     source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
     
     Returns
     -------
     timedelta
     """
-    
-    if(type(source) == str):
-        if(source.lower() == "all"):
-            import datetime
-            mad = pd.Series(abs(srcid.loc[:,"len"].median() - srcid.loc[:,"len"])).median()
-            return datetime.timedelta(seconds = mad.total_seconds())
-            
-        elif(source.lower() == "air"):
-            import datetime
-            mad = pd.Series(abs(srcid.loc[(srcid.srcID > 0) & (srcid.srcID < 2.),"len"].median() - srcid.loc[(srcid.srcID > 0) & (srcid.srcID < 2.),"len"])).median()
-            return datetime.timedelta(seconds = mad.total_seconds())
-    
-    else:
-        import datetime
-        mad = pd.Series(abs(srcid.loc[srcid.srcID.isin(source),"len"].median() - srcid.loc[srcid.srcID.isin(source),"len"])).median()
-        return datetime.timedelta(seconds = mad.total_seconds())
-
+    return datetime.timedelta(seconds = _core.mad(_core.durations_s(srcid, source)))
 
 
 
+@accepts_arrow
 def iqr_event_duration(srcid, source = "all"):  
     """
     Calculate the interquartile range for durations of SPLAT-annotated sources at a site.
 
     Parameters
     ----------
-    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library. 
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py). 
     source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
     
     Returns
     -------
     timedelta
     """
-    
-    if(type(source) == str):
-        if(source.lower() == "all"):
-            import datetime
-            iqr = srcid.loc[:,"len"].quantile(0.75) - srcid.loc[:,"len"].quantile(0.25)
-            return datetime.timedelta(seconds = iqr.total_seconds())
-            
-        elif(source.lower() == "air"):
-            import datetime
-            iqr = srcid.loc[(srcid.srcID > 0) & (srcid.srcID < 2.),"len"].quantile(0.75) - srcid.loc[(srcid.srcID > 0) & (srcid.srcID < 2.),"len"].quantile(0.25)
-            return datetime.timedelta(seconds = iqr.total_seconds())
-    
-    else:
-        import datetime
-        iqr = srcid.loc[srcid.srcID.isin(source),"len"].quantile(0.75) - srcid.loc[srcid.srcID.isin(source),"len"].quantile(0.25)
-        return datetime.timedelta(seconds = iqr.total_seconds())
+    return datetime.timedelta(seconds = _core.iqr(_core.durations_s(srcid, source)))
 
 
-        
-  
+
+@accepts_arrow
 def mean_event_duration(srcid, source = "all"):
     """
     The mean duration of SPLAT-annotated sources at a site.  
 
     Parameters
     ----------
-    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library.
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
     source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
     
     Returns
     -------
     timedelta
     """
-    
-    if(type(source) == str):
-        if(source.lower() == "all"):
-            import datetime
-            return datetime.timedelta(seconds = srcid.loc[:,"len"].mean().total_seconds())
-            
-        elif(source.lower() == "air"):
-            import datetime
-            return datetime.timedelta(seconds = srcid.loc[(srcid.srcID > 0) & (srcid.srcID < 2.),"len"].mean().total_seconds())
-    
-    else:
-        import datetime
-        return datetime.timedelta(seconds = srcid.loc[srcid.srcID.isin(source),"len"].mean().total_seconds())
+    return datetime.timedelta(seconds = _core.mean(_core.durations_s(srcid, source)))
 
 
-  
+
+@accepts_arrow
 def stdev_event_duration(srcid, source = "all"):
     """
     The standard deviation of durations for SPLAT-annotated sources at a site.  
 
     Parameters
     ----------
-    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library.
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
     source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
     
     Returns
     -------
     timedelta
     """
-    
-    if(type(source) == str):
-        if(source.lower() == "all"):
-            import datetime
-            return datetime.timedelta(seconds = srcid.loc[:,"len"].std().total_seconds())
-            
-        elif(source.lower() == "air"):
-            import datetime
-            return datetime.timedelta(seconds = srcid.loc[(srcid.srcID > 0) & (srcid.srcID < 2.),"len"].std().total_seconds())
-    
-    else:
-        import datetime
-        return datetime.timedelta(seconds = srcid.loc[srcid.srcID.isin(source),"len"].std().total_seconds())
+    return datetime.timedelta(seconds = _core.std(_core.durations_s(srcid, source)))
 
 
-  
+
+@accepts_arrow
 def stderr_event_duration(srcid, source = "all"):
     """
     The standard error of the mean for durations of SPLAT-annotated sources at a site.  
 
     Parameters
     ----------
-    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library.
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
     source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
     
     Returns
     -------
     timedelta
     """
-    
-    if(type(source) == str):
-        if(source.lower() == "all"):
-            import datetime
-            return datetime.timedelta(seconds = srcid.loc[:,"len"].std().total_seconds()/np.sqrt(srcid.loc[:, "len"].count()))
-            
-        elif(source.lower() == "air"):
-            import datetime
-            return datetime.timedelta(seconds = srcid.loc[(srcid.srcID > 0) & (srcid.srcID < 2.),"len"].std().total_seconds()/np.sqrt(srcid.loc[:, "len"].count()))
-    
-    else:
-        import datetime
-        return datetime.timedelta(seconds = srcid.loc[srcid.srcID.isin(source),"len"].std().total_seconds()/np.sqrt(srcid.loc[srcid.srcID.isin(source), "len"].count()))
+    return datetime.timedelta(seconds = _core.stderr(_core.durations_s(srcid, source)))
 
 
 
+@accepts_arrow
 def total_audible_dur_hourly(dailypa, hour, source = "all"): 
     """
     The total percent time audible for SPLAT-annotated sources at a site.  
@@ -481,22 +292,20 @@ def total_audible_dur_hourly(dailypa, hour, source = "all"):
     
     if(type(source) == str):
         if(source.lower() == "all"):
-            import datetime
             secs = (dailypa.loc[(slice(None), "Total_All"), "00h":"23h"]*3600)/100
             return datetime.timedelta(seconds = secs.sum()[h])
             
         elif(source.lower() == "air"):
-            import datetime
             secs = (dailypa.loc[(slice(None), "Total_1"), "00h":"23h"]*3600)/100
             return datetime.timedelta(seconds = secs.sum()[h])
     
     else:
-        import datetime
         secs = (dailypa.loc[(slice(None), str(source)), "00h":"23h"]*3600)/100
         return datetime.timedelta(seconds = secs.sum()[h])
 
 
 
+@accepts_arrow
 def mean_audible_duration_hourly(dailypa, hour, source = "all"): 
     """
     The average percent time audible for SPLAT-annotated sources at a site.  
@@ -515,19 +324,16 @@ def mean_audible_duration_hourly(dailypa, hour, source = "all"):
     
     if(type(source) == str):
         if(source.lower() == "all"):
-            import datetime
             tot_count = dailypa.loc[(slice(None), "Total_All"), "nEvents_24Hr"].sum()
             secs = (dailypa.loc[(slice(None), "Total_All"), "00h":"23h"]*3600)/100
             return datetime.timedelta(seconds = secs.sum()[h]/tot_count)
             
         elif(source.lower() == "air"):
-            import datetime
             tot_count = dailypa.loc[(slice(None), "Total_1"), "nEvents_24Hr"].sum()
             secs = (dailypa.loc[(slice(None), "Total_1"), "00h":"23h"]*3600)/100
             return datetime.timedelta(seconds = secs.sum()[h]/tot_count)
     
     else:
-        import datetime
         tot_count = dailypa.loc[(slice(None), str(source)), "nEvents_24Hr"].sum()
         secs = (dailypa.loc[(slice(None), str(source)), "00h":"23h"]*3600)/100
         return datetime.timedelta(seconds = secs.sum()[h]/tot_count)
@@ -538,92 +344,85 @@ def mean_audible_duration_hourly(dailypa, hour, source = "all"):
 # ### COUNT METRICS FROM SRCID
 
   
+@accepts_arrow
 def total_count(srcid, source = "all"):  # will give total props, total jets, total helicopters
     """
     The total number of noise events by source type.  
 
     Parameters
     ----------
-    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library.
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
     source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", or "air".  Defaults to "all" if unspecified.
     
     Returns
     -------
     int
     """
-    if(type(source) == str):
-        if(source.lower() == "all"):
-            return srcid.loc[:,"MaxSPL"].count()
-        
-        elif(source.lower() == "air"):
-            return srcid.loc[(srcid.srcID > 0) & (srcid.srcID < 2.),"MaxSPL"].count()
-
-    else:       
-        return srcid.loc[srcid.srcID.isin(source),"MaxSPL"].count()
+    return _core.count(_core.levels(srcid, "Lmax", "A", source))
 
 
 
-  
+@accepts_arrow
 def percentageOfAll_bySource(srcid, id_code):  
     """
     Counts by srcID code expressed as a percentage of all annotated sources at a site.
 
     Parameters
     ----------
-    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library.
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
     id_code: float, an srcID code used for annotating noise sources in SPLAT.
     
     Returns
     -------
     float, as a percentage
     """
-    return 100*(srcid.loc[srcid.srcID == id_code,"MaxSPL"].count()/srcid.loc[:, "MaxSPL"].count())
+    return _core.percent_of(_core.levels(srcid, "Lmax", "A", [id_code]), _core.levels(srcid, "Lmax", "A", "all"))
 
 
 
-  
+@accepts_arrow
 def percentageOfAir_bySource(srcid, id_code):  
     """
     Counts by srcID code expressed as a percentage of aviation sources annotated at a site.
 
     Parameters
     ----------
-    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library.
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
     id_code: float, an srcID code used for annotating noise sources in SPLAT.
     
     Returns
     -------
     float, as a percentage
     """
-    return 100*(srcid.loc[srcid.srcID == id_code,"MaxSPL"].count()/srcid.loc[(srcid.srcID > 0) & (srcid.srcID < 2.), "MaxSPL"].count())
+    return _core.percent_of(_core.levels(srcid, "Lmax", "A", [id_code]), _core.levels(srcid, "Lmax", "A", "air"))
 
 
 
-  
+@accepts_arrow
 def propJetRatio(srcid):  
     """
     Returns the count of props at a site by the count of jets at a site.
 
     Parameters
     ----------
-    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library.
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
     
     Returns
     -------
     float
     """
-    return srcid.loc[srcid.srcID == 1.2,"MaxSPL"].count()/srcid.loc[srcid.srcID == 1.1,"MaxSPL"].count()
+    return _core.count_ratio(_core.levels(srcid, "Lmax", "A", [1.2]), _core.levels(srcid, "Lmax", "A", [1.1]))
 
 
 
-  
+@accepts_arrow
 def DENABCMP_SPL_exceedance(srcid, zone, source = "all"):  # report the percentage of events exceeding DENA BCMP SPL standard
     """
     Reports the percentage of noise events exceeding the Denali Backcountry Managment Plan SPL standard.  
 
     Parameters
     ----------
-    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library.
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
     zone: str, the Denali backcountry managment plan zone:  "low", "medium", "high", or "very high".  case insensitive.
     source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", or "air".  Defaults to "all" if unspecified, which is the truest expression of the plan as well.
     
@@ -631,28 +430,18 @@ def DENABCMP_SPL_exceedance(srcid, zone, source = "all"):  # report the percenta
     -------
     float, as a percentage
     """
+    return _core.percent_above(_core.levels(srcid, "Lmax", "A", source), SPL_ZONES[zone.lower()])
 
-    key = zone.lower()
-    lookup = {"low":40.0, "med":40.0, "medium":40.0, "high":60., "very high":60., "v. high":60., "veryhigh":60., "v high":60.}
-    
 
-    if(source.lower() == "all"):
-        return 100*(srcid.loc[srcid.MaxSPL > lookup[key], "MaxSPL"].count()/srcid.loc[:,"MaxSPL"].count())
 
-    elif(source.lower() == "air"):
-        subset = srcid.loc[(srcid.srcID > 0) & (srcid.srcID < 2.), "MaxSPL"]
-        return 100*(subset.loc[subset > lookup[key]].count()/subset.count())
-
-
-
-  
+@accepts_arrow
 def DENABCMP_SPL_exceedanceRate(srcid, zone, source = "all"):  # the number of events exceeding DENA BCMP SPL standard per day
     """
     Reports the number of noise events per day exceeding the Denali Backcountry Managment Plan SPL standard.  
 
     Parameters
     ----------
-    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library.
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
     zone: str, the Denali backcountry managment plan zone:  "low", "medium", "high", or "very high".  case insensitive.
     source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", or "air".  Defaults to "all" if unspecified, which is the truest expression of the plan as well.
     
@@ -660,17 +449,66 @@ def DENABCMP_SPL_exceedanceRate(srcid, zone, source = "all"):  # the number of e
     -------
     float, as a percentage
     """
+    days = _core.event_days(_core.starts_ns(srcid))
 
-    key = zone.lower()
-    lookup = {"low":40.0, "med":40.0, "medium":40.0, "high":60., "very high":60., "v. high":60., "veryhigh":60., "v high":60.}
-    days = len(pd.Series(srcid.index.values).dt.date.unique())
+    return _core.rate_above(_core.levels(srcid, "Lmax", "A", source), SPL_ZONES[zone.lower()], days)
 
-    if(source.lower() == "all"):
-        return srcid.loc[srcid.MaxSPL > lookup[key], "MaxSPL"].count()/days
 
-    elif(source.lower() == "air"):
-        subset = srcid.loc[(srcid.srcID > 0) & (srcid.srcID < 2.), "MaxSPL"]
-        return subset.loc[subset > lookup[key]].count()/days
+
+@accepts_arrow
+def SPL_exceedance_curve(srcid, thresholds = np.arange(20., 90.5, 0.5), metric = "Lmax", weight = "A", source = "all", by = None):
+    """
+    The exceedance curve behind DENABCMP_SPL_exceedance and DENABCMP_SPL_exceedanceRate: the percentage of noise events,
+    and the number of events per day, exceeding every threshold in a vector.  Levels are sorted once and each threshold
+    is located with a binary search, so a fine sweep costs little more than a single threshold.
+
+    Parameters
+    ----------
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
+    thresholds: array-like of floats, optional.  The levels to evaluate, in dB.  Defaults to 20 - 90 dB in 0.5 dB steps.
+    metric: str, optional.  The amplitude metric to use when preforming the calculation, either "Lmax" or "SEL". Defaults to "Lmax" if unspecified.
+    weight: str, optional.  The acoustic weighting used to calculate Lmax, either "A" or "T". Defaults to "A" if unspecified.
+    source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
+    by: str or None, optional.  "source_group" gives one curve per source group (air, vehicle, ...).  Defaults to None.
+
+    Returns
+    -------
+    pandas DataFrame indexed by threshold, or (source_group, threshold), with columns "percent" (of events) and "rate" (events per day)
+    """
+    if(by not in ["source_group", None]):
+        raise ValueError('by must be either "source_group" or None')
+
+    thresholds = np.asarray(thresholds, dtype=float)
+
+    # as in DENABCMP_SPL_exceedanceRate, the days are those with any annotated event
+    days = _core.event_days(_core.starts_ns(srcid))
+
+    values = _core.levels(srcid, metric, weight, source)
+    codes = _core.codes(srcid, source)
+    valid = ~np.isnan(values)
+
+    groups = {None: valid}
+    if(by == "source_group"):
+        group = np.floor(codes).astype(np.int64)
+        groups = {SOURCE_GROUPS.get(g, str(g)): valid & (group == g) for g in np.unique(group[valid])}
+
+    curves = []
+    for name, mask in groups.items():
+        ordered = np.sort(values[mask])
+
+        # events strictly above each threshold, as in DENABCMP_SPL_exceedance
+        above = len(ordered) - np.searchsorted(ordered, thresholds, side="right")
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            curve = pd.DataFrame({"percent": 100*above/len(ordered) if len(ordered) else np.full(len(thresholds), np.nan),
+                                  "rate": above/days if days else np.full(len(thresholds), np.nan)},
+                                 index=pd.Index(thresholds, name="threshold"))
+        curves.append(curve)
+
+    if(by is None):
+        return curves[0]
+
+    return pd.concat(curves, keys=list(groups), names=["source_group"])
 
 
 
@@ -678,31 +516,32 @@ def DENABCMP_SPL_exceedanceRate(srcid, zone, source = "all"):  # the number of e
 # ### DATASET DESCRIPTION METRICS FROM SRCID
 
   
+@accepts_arrow
 def number_of_days_splatted(srcid):  
     """
     Returns the number of days of SPLAT analysis conducted for a site.  
 
     Parameters
     ----------
-    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library.
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
     
     Returns
     -------
     int
     """
-    import datetime as dt
     return len(pd.Series(srcid.index.values).dt.date.unique())
 
 
 
   
+@accepts_arrow
 def days_splatted(srcid): 
     """
     Returns a list of the days that were analyzed in SPLAT.
 
     Parameters
     ----------
-    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library.
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
     
     Returns
     -------
@@ -710,18 +549,19 @@ def days_splatted(srcid):
     """
     dates = pd.DataFrame(pd.Series(srcid.index).dt.date.unique())
     dates.columns = ["date"]
-    return dates.sort(['date'])  
+    return dates.sort_values(['date'])  
 
 
 
   
+@accepts_arrow
 def SPLAT_center_date(srcid): 
     """
     Returns the center date of the analyzed period (useful for typical day lengths, etc...)
 
     Parameters
     ----------
-    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library.
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
     
     Returns
     -------
@@ -731,7 +571,7 @@ def SPLAT_center_date(srcid):
     dList = pd.Series(srcid.index).dt.date.unique()
     # remember, .strftime("%Y-%m-%d") will turn this result into a string if you need it in that format
     # for MM/DD format, .strftime("%Y-%m-%d")[5:12].replace("-", "/")  will do the trick
-    return dList[len(dList)/2]
+    return dList[len(dList)//2]
 
 
 
@@ -739,13 +579,14 @@ def SPLAT_center_date(srcid):
 # ### NOISE FREE INTERVAL
 
 
+@accepts_arrow
 def mean_NFI(srcid, source = "all", unit="hours"): 
     """
     Returns the average NFI for selected source type.
 
     Parameters
     ----------
-    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library.
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
     source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
     unit: str, a value that indicates the units desired for the output value.  Defaults to "hours".
     
@@ -753,45 +594,22 @@ def mean_NFI(srcid, source = "all", unit="hours"):
     -------
     numpy.float64
     """
+    # because NFI depends on event timing, it is critical to first sort chronologically
+    starts, ends = _core.events_ns(srcid, source)
 
-    unitDict = {"seconds":1, "minutes":60, "hours":3600, "days":86400}
+    # the interval between the end of each event and the start of the next one
+    return _core.mean(_core.nfi_between_events(starts, ends, NFI_UNITS[unit]))
 
-    if(type(source) == str):
-        if(source.lower() == "all"):  
- 
-            dt = srcid.sort_index()
 
-            NFIlst = pd.Series([(dt.index[i+1] - (dt.index[i] + dt['len'][i])).total_seconds()/unitDict[unit] for i in range(len(dt.index)+1) 
-                if(i < len(dt.index)-1)])
-    
-            return NFIlst.mean()
-        
-        elif(source.lower() == "air"):
-            dt = srcid.loc[(srcid.srcID > 0) & (srcid.srcID < 2.), :]
-            dt.sort_index()
-
-            NFIlst = pd.Series([(dt.index[i+1] - (dt.index[i] + dt['len'][i])).total_seconds()/unitDict[unit] for i in range(len(dt.index)+1) 
-                if(i < len(dt.index)-1)])
-    
-            return NFIlst.mean()
-    
-    else: 
-
-        dt = srcid.loc[srcid.srcID.isin(source), :]
-        dt.sort_index()
-
-        NFIlst = pd.Series([(dt.index[i+1] - (dt.index[i] + dt['len'][i])).total_seconds()/unitDict[unit] for i in range(len(dt.index)+1) 
-            if(i < len(dt.index)-1)])
-    
-        return NFIlst.mean()
 
+@accepts_arrow
 def NFI_list(srcid, source = "all", unit="hours"): 
     """
     Returns a list of all Noise Free Intervals for selected source type.
 
     Parameters
     ----------
-    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library.
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
     source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
     unit: str, a value that indicates the units desired for the output value.  Defaults to "hours".
 
@@ -799,59 +617,22 @@ def NFI_list(srcid, source = "all", unit="hours"):
     -------
     pandas Series of floating-point times
     """
+    # because NFI depends on event timing, it is critical to first sort chronologically
+    starts, _ = _core.events_ns(srcid, source)
 
-    # 'look-up' dictionary to translate time unit from string to integer (in seconds)
-    unitDict = {"seconds":1, "minutes":60, "hours":3600, "days":86400}
+    # difference the starting times to create a list of intervals; we only want non-negative intervals
+    return pd.Series(_core.nfi_between_starts(starts, NFI_UNITS[unit]))
 
-    # because NFI depends on event timing, 
-    # it is critical to first sort chronologically
-    srcid.sort_index(inplace=True)
-
-    # two of the source categories are built-in as strings ("all", "air")
-    if(type(source) == str):
-        if(source.lower() == "all"):  
-
-            # difference the starting datetime indices to create a list of timedeltas
-            NFIlst = srcid.index.to_series().diff()
-
-            # we only want non-negative intervals
-            out = pd.Series(np.array([m.total_seconds() for m in NFIlst[NFIlst > "00:00:00"]])/unitDict[unit])
-
-            return out
-        
-        elif(source.lower() == "air"):
-
-            # aviation sources have source ID codes starting with 1: (1., 1.1, 1.2, 1.3, etc.)
-            srcid = srcid.loc[(srcid.srcID > 0) & (srcid.srcID < 2.), :]
-
-            # difference the starting datetime indices to create a list of timedeltas
-            NFIlst = srcid.index.to_series().diff()
-
-            out = pd.Series(np.array([m.total_seconds() for m in NFIlst[NFIlst > "00:00:00"]])/unitDict[unit])
-    
-            return out
-    
-    else: 
-
-        # select only the source ID code of interest
-        srcid = srcid.loc[srcid.srcID.isin(source), :]
-
-        # difference the starting datetime indices to create a list of timedeltas
-        NFIlst = srcid.index.to_series().diff()
-
-
-        out = pd.Series(np.array([m.total_seconds() for m in NFIlst[NFIlst > "00:00:00"]])/unitDict[unit])
-    
-        return out 
 
 
+@accepts_arrow
 def quantile_NFI(srcid, q, source = "all", unit="hours"): 
     """
     Returns the quantile NFI for selected source type.
 
     Parameters
     ----------
-    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library.
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
     q: float, a value that indicates the quantile desired, from 0.0 (minimum) to 1.0 (maximum.)   
     source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
     unit: str, a value that indicates the units desired for the output value.  Defaults to "hours".
@@ -861,12 +642,13 @@ def quantile_NFI(srcid, q, source = "all", unit="hours"):
     numpy.float64
     """
 
-    return NFI_list(srcid, source = "all", unit="hours").quantile(q)
+    return NFI_list(srcid, source = source, unit = unit).quantile(q)
       
 
 #------------------------------------------------------------------------------------------------------------------
 # ###PERCENT TIME AUDIBLE METRICS FROM DAILYPA
 
+@accepts_arrow
 def quantile_hourlyPA(dailypa, q, hour, source = "all"): # PA quantiles by hour for all sources 
     """
     Returns a quantile of percent time audible for a particular hour and source type.
@@ -896,6 +678,7 @@ def quantile_hourlyPA(dailypa, q, hour, source = "all"): # PA quantiles by hour
 
 
 
+@accepts_arrow
 def quantile_dailyPA(dailypa, q, source = "all", hour_range = [0, 23]): # PA quantiles by hour for all sources 
     """
     Returns a pandas Series containing percent time audible quantiles 
@@ -932,6 +715,7 @@ def quantile_dailyPA(dailypa, q, source = "all", hour_range = [0, 23]): # PA qua
 
 
 
+@accepts_arrow
 def DENABCMP_PA_exceedance(dailypa, zone, start_hour = 0, end_hour = 23, source = "all"): 
     """
     Returns the percentage of sampled hours exceeding the Denali Backcountry Management Plan PA standard.  
@@ -949,53 +733,24 @@ def DENABCMP_PA_exceedance(dailypa, zone, start_hour = 0, end_hour = 23, source
     -------
     float, as a percentage
     """
-    key = zone.lower()
-    lookup = {"low": 5., "med": 15., "medium":15., "high":25., "very high":50., "v. high":50., "veryhigh":50., "v high":50.}
-    
     hs = str(start_hour).zfill(2) + "h"
     hf = str(end_hour).zfill(2) + "h"
     
     if(type(source) == str):
         if(source.lower() == "all"):
             data = dailypa.loc[(slice(None), "Total_All"), hs:hf]
-
-            p = []
-            for index, values in data.iterrows():
-                date = pd.Timestamp(index[0]) #convert string dates to timestamps
-                hours = pd.to_timedelta(values.index.str.slice(0,2)) #this contains hourly offsets in time 
-                values.index = date + hours
-                p.append(values)
-
-            d = pd.concat(p)
-            return 100*(d.loc[d > lookup[key]].count()/d.count())
+            return _core.percent_above(data.to_numpy(dtype=float).ravel(), PA_ZONES[zone.lower()])
             
         elif(source.lower() == "air"):
             data = dailypa.loc[(slice(None), "Total_1"), hs:hf]
-
-            p = []
-            for index, values in data.iterrows():
-                date = pd.Timestamp(index[0]) #convert string dates to timestamps
-                hours = pd.to_timedelta(values.index.str.slice(0,2)) #this contains hourly offsets in time 
-                values.index = date + hours
-                p.append(values)
-
-            d = pd.concat(p)
-            return 100*(d.loc[d > lookup[key]].count()/d.count())
+            return _core.percent_above(data.to_numpy(dtype=float).ravel(), PA_ZONES[zone.lower()])
             
     else:
         data = dailypa.loc[(slice(None), str(source)), hs:hf]
-
-        p = []
-        for index, values in data.iterrows():
-            date = pd.Timestamp(index[0]) #convert string dates to timestamps
-            hours = pd.to_timedelta(values.index.str.slice(0,2)) #this contains hourly offsets in time 
-            values.index = date + hours
-            p.append(values)
-
-        d = pd.concat(p)
-        return 100*(d.loc[d > lookup[key]].count()/d.count())
+        return _core.percent_above(data.to_numpy(dtype=float).ravel(), PA_ZONES[zone.lower()])
 
 
+@accepts_arrow
 def overall_PA(dailypa, source = "all"): 
     """
     Returns the percentage of time a source type was audible over the entire sampling period.
@@ -1011,79 +766,30 @@ def overall_PA(dailypa, source = "all"):
 
     """
 
+    # every hour of every day counts as sampled; for a source subset, the days are those in the Total_All rows
+    sampled = dailypa.loc[(slice(None), "Total_All"), "00h":"23h"].size
     
     if(type(source) == str):
         if(source.lower() == "all"):
             data = dailypa.loc[(slice(None), "Total_All"), "00h":"23h"]
-
-            p = []
-            for index, values in data.iterrows():
-                date = pd.Timestamp(index[0]) #convert string dates to timestamps
-                hours = pd.to_timedelta(values.index.str.slice(0,2)) #this contains hourly offsets in time 
-                values.index = date + hours
-                p.append(values)
-
-            d = pd.concat(p)
-    
-            return 100*((d/100)*3600).sum()/(len(d)*3600)
+            return _core.percent_time_audible(data.to_numpy(dtype=float).ravel(), sampled)
             
         elif(source.lower() == "air"):
             data = dailypa.loc[(slice(None), "Total_1"), "00h":"23h"]
-
-            p = []
-            for index, values in data.iterrows():
-                date = pd.Timestamp(index[0]) #convert string dates to timestamps
-                hours = pd.to_timedelta(values.index.str.slice(0,2)) #this contains hourly offsets in time 
-                values.index = date + hours
-                p.append(values)
-
-            d = pd.concat(p)
-
-            data1 = dailypa.loc[(slice(None), "Total_All"), "00h":"23h"]
-
-            q = []
-            for index, values in data1.iterrows():
-                date = pd.Timestamp(index[0]) #convert string dates to timestamps
-                hours = pd.to_timedelta(values.index.str.slice(0,2)) #this contains hourly offsets in time 
-                values.index = date + hours
-                q.append(values)
-
-            tot = pd.concat(q)
-
-            return 100*((d/100)*3600).sum()/(len(tot)*3600)
+            return _core.percent_time_audible(data.to_numpy(dtype=float).ravel(), sampled)
             
     else:
 
         query = [str(s) for s in source]
         data = dailypa.loc[(slice(None), query), "00h":"23h"] # if a whole number, expects source as "2" instead of "2.0"
-
-        p = []
-        for index, values in data.iterrows():
-            date = pd.Timestamp(index[0]) #convert string dates to timestamps
-            hours = pd.to_timedelta(values.index.str.slice(0,2)) #this contains hourly offsets in time 
-            values.index = date + hours
-            p.append(values)
-
-        d = pd.concat(p)
-
-        data1 = dailypa.loc[(slice(None), "Total_All"), "00h":"23h"]
-
-        q = []
-        for index, values in data1.iterrows():
-            date = pd.Timestamp(index[0]) #convert string dates to timestamps
-            hours = pd.to_timedelta(values.index.str.slice(0,2)) #this contains hourly offsets in time 
-            values.index = date + hours
-            q.append(values)
-
-        tot = pd.concat(q)
-
-        return 100*((d/100)*3600).sum()/(len(tot)*3600)
+        return _core.percent_time_audible(data.to_numpy(dtype=float).ravel(), sampled)
 
 
 
 #------------------------------------------------------------------------------------------------------------------
 # ### EVENT RATE, COUNT, & SATURATION METRICS FROM DAILYPA
 
+@accepts_arrow
 def quantile_eventsPerDay(dailypa, q, source = "all"):
     """
     Returns a quantile of daily event rates.  Rates are calculated by source type.
@@ -1128,6 +834,7 @@ def quantile_eventsPerDay(dailypa, q, source = "all"):
 
 
  
+@accepts_arrow
 def total_events(dailypa, source = "all"): 
     """
     Returns a total count of events by source type.
@@ -1153,6 +860,7 @@ def total_events(dailypa, source = "all"):
 
 
 
+@accepts_arrow
 def event_saturation(dailypa, start_hour = 0, end_hour = 23, source = "all"): 
     """
     Returns a tuple of floats containing information on how many hours have events of a certain source type.
@@ -1217,6 +925,7 @@ def event_saturation(dailypa, start_hour = 0, end_hour = 23, source = "all"):
 # ### EVENT RATES ABOVE AMBIENT FROM LOUDEVENTS
 
  
+@accepts_arrow
 def DENABCMP_events_exceedance(loudevents, zone): 
     """
     Returns the percentage of days in the sampling period that exceed the Denali Backcountry Management Plan 'events per day' standard.
@@ -1237,24 +946,51 @@ def DENABCMP_events_exceedance(loudevents, zone):
     return 100*(len(day_counts.loc[day_counts > lookup[key]])/len(day_counts))
 
  
+@accepts_arrow
+def events_exceedance_curve(loudevents, thresholds = np.arange(0., 101.)):
+    """
+    The exceedance curve behind DENABCMP_events_exceedance: the percentage of days in the sampling period with more events
+    than every threshold in a vector.  Daily counts are sorted once and each threshold is located with a binary search.
+
+    Parameters
+    ----------
+    loudevents: pandas dataframe representing NPS NSNSD 'loudevents' file, formatted by soundDB library.
+    thresholds: array-like of floats, optional.  The events-per-day thresholds to evaluate.  Defaults to 0 - 100 events per day.
+
+    Returns
+    -------
+    pandas Series of percentages, indexed by threshold
+    """
+    thresholds = np.asarray(thresholds, dtype=float)
+    day_counts = np.sort(loudevents.above.sum(axis=1).to_numpy(dtype=float))
+
+    above = len(day_counts) - np.searchsorted(day_counts, thresholds, side="right")
+
+    return pd.Series(100*above/len(day_counts), index=pd.Index(thresholds, name="threshold"), name="percent")
+
+ 
+@accepts_arrow
 def quantile_eventRate_overAmbient(loudevents, q): #quantiles of the number of events per day over the natural ambient level
     """
     """
     return loudevents.above.sum(axis=1).quantile(q)
 
  
+@accepts_arrow
 def mean_eventRate_overAmbient(loudevents): #average number of events per day over the natural ambient level
     """
     """
     return loudevents.above.sum(axis=1).mean()
 
  
+@accepts_arrow
 def stdev_eventRate_overAmbient(loudevents): #standard deviation of the number of events per day over the natural ambient level
     """
     """
     return loudevents.above.sum(axis=1).std()
 
  
+@accepts_arrow
 def stderr_eventRate_overAmbient(loudevents): #standard deviation of the number of events per day over the natural ambient level
     """
     """
@@ -1386,8 +1122,8 @@ def Ldn(metrics, season="Summer", weight = "A"):
     
     #
     hourlyLeq = metrics.hourlyMedian.data.loc[season, lookup[w], "Leq"]
-    increaseNight10dB = hourlyLeq.iloc[0:7].append(hourlyLeq.iloc[22:])-10
-    artificialIncrease = increaseNight10dB.append(hourlyLeq.iloc[7:22]).sort_index()
+    increaseNight10dB = pd.concat([hourlyLeq.iloc[0:7], hourlyLeq.iloc[22:]])-10
+    artificialIncrease = pd.concat([increaseNight10dB, hourlyLeq.iloc[7:22]]).sort_index()
     Ldn = 10*np.log10(artificialIncrease.apply(lambda x: pow(10, x/10)).sum())
 
     return float("{0:.1f}".format(Ldn))
@@ -1426,15 +1162,17 @@ def percentTimeAbove(metrics, threshold, season="Summer", weight = "A", timeRang
 #------------------------------------------------------------------------------------------------------------------
 # ### STANDARD ACOUSTIC EXCEEDANCE METRICS
 
-def Lx(nvspl, x, dBA_only=True):
+def Lx(nvspl, x, dBA_only=True, weighting=None, bands=None):
     """
     Returns the exceedance percentile (Lx) for bands passed from an NVSPL file.
 
     Parameters
     ----------
-    nvspl: pandas dataframe representing NPS NSNSD NVSPL file, formatted by soundDB library.
+    nvspl: pandas dataframe representing NPS NSNSD NVSPL file, formatted by soundDB library.  May also be ArrowDtype-backed or a pyarrow Table.
     x: float, the exceedance level = (100 - percentile), such that x = 10 is the 90th percentile.
     dBA_only: boolean, optional.  Whether to return a single broadband A-weighted value or all the bands passed in the NVSPL DataFrame. Defaults to a single A-weighted value if unspecified.  
+    weighting: str, dict or array-like, optional.  Recompute the broadband level from the one-third-octave bands with this weighting ("A", "C", "Z" or custom, see weighting.py) and use it in place of dbA, named e.g. "dbC".  Defaults to the precomputed dbA column.
+    bands: list of str or (low Hz, high Hz) tuple, optional.  With weighting, restrict the broadband sum to these bands.  Requires weighting.
 
     Returns
     -------
@@ -1442,9 +1180,9 @@ def Lx(nvspl, x, dBA_only=True):
 
     """
 
-    # tidy up the NVSPL file for processing by dropping the outer index
-    nvspl.reset_index(level=1, drop=True)
-    
+    if(bands is not None and weighting is None):
+        raise ValueError('bands restricts a recomputed broadband level, so it needs a weighting, e.g. weighting = "A"')
+
     # which columns in the NVSPL file contain SPL values?
     SPLColumns = ['12.5', '15.8', '20', '25', '31.5', '40', '50', '63', '80',
                    '100', '125', '160', '200', '250', '315', '400', '500', '630', '800',
@@ -1454,8 +1192,20 @@ def Lx(nvspl, x, dBA_only=True):
     # convert x to a quantile value
     q = (100 - x)/100
 
-    # calculate the quantile for each band passed into the function
-    bands = pd.DataFrame.from_dict({column: nvspl[column].astype(float).quantile(q) for column in nvspl if column in SPLColumns}, orient='index')
+    # gather each band passed into the function
+    # (column_values reads pandas, ArrowDtype and pyarrow Table columns alike, viewing Arrow buffers without a copy)
+    levels = {column: column_values(nvspl, column) for column in column_names(nvspl) if column in SPLColumns}
+
+    # optionally recompute the broadband level with another weighting or a truncated band range
+    broadband = "dbA"
+    if(weighting is not None):
+        broadband = "db" + weighting.upper() if type(weighting) == str else "dbCustom"
+        levels[broadband] = weighted_level(nvspl, weighting, bands)
+        if(broadband not in SPLColumns):
+            SPLColumns = SPLColumns + [broadband]
+
+    # calculate the quantile for each band
+    bands = pd.DataFrame.from_dict({column: np.nanquantile(values, q) for column, values in levels.items()}, orient='index')
     bands.columns = ["L" + str(x)]
     bands["BANDS"] = bands.index
 
@@ -1474,8 +1224,17 @@ def Lx(nvspl, x, dBA_only=True):
     
     # the default will be to return a dBA value
     if(dBA_only):
-        return out.loc["dbA",:]
+        return out.loc[broadband,:]
     
     # else return a dataframe that has all the bands!
     else:
-        return out
\ No newline at end of file
+        return out
+
+
+#------------------------------------------------------------------------------------------------------------------
+# ### OPT-IN PROFILING (set DDF_PROFILE=1 before import, see instrumentation.py)
+
+import os as _os
+if(_os.environ.get("DDF_PROFILE")):
+    import instrumentation
+    instrumentation.instrument_on_import(__name__)
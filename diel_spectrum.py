@@ -0,0 +1,172 @@
+import pandas as pd
+import numpy as np
+
+from arrow_backend import column_names, column_values, nvspl_times
+from stratified import SEASON_OF_MONTH
+from weighting import NVSPL_BANDS
+
+#------------------------------------------------------------------------------------------------------------------
+# ### DIEL SPECTRAL EXCEEDANCE CUBE (HOUR OF DAY x BAND x PERCENTILE)
+#
+# Rather than calling Lx on 24 hourly slices per season, every NVSPL level is counted once into a histogram
+# cell keyed by (season, hour of day, band, 0.1 dB bin) with a single bincount per band.  Any set of exceedance
+# levels is then read from the cumulative counts, exactly as np.nanquantile would compute them from the raw
+# 0.1 dB values:
+#
+#     cube = diel_exceedance(nvspl, x=[10, 50, 90])
+#     cube.loc[(7, "1000"), "L50"]                                         # 07:00-08:00, 1 kHz
+#     cube.to_numpy().reshape(24, -1, 3)                                   # hour x band x percentile
+
+
+_SEASONS = ["Winter", "Spring", "Summer", "Fall"]
+
+
+class DielHistograms(object):
+    """
+    Per (season, hour of day, band) level histograms at fixed resolution, built in one pass by diel_histograms().
+    Histograms from different files or sites can be summed with + before reading exceedance levels.
+
+    Attributes
+    ----------
+    counts: numpy array of int64, shaped (strata, 24, bands, bins).
+    strata: list of str, the season names, or ["All"].
+    bands: list of str, the band (and broadband) column names.
+    low: float, the level of the first bin, in dB.
+    resolution: float, the bin width in dB.
+    """
+
+    def __init__(self, counts, strata, bands, low, resolution):
+
+        self.counts = counts
+        self.strata = strata
+        self.bands = bands
+        self.low = low
+        self.resolution = resolution
+
+    def __add__(self, other):
+
+        if(self.strata != other.strata or self.bands != other.bands or
+           self.low != other.low or self.resolution != other.resolution or self.counts.shape != other.counts.shape):
+            raise ValueError("histograms must share strata, bands and bins to be combined")
+
+        return DielHistograms(self.counts + other.counts, self.strata, self.bands, self.low, self.resolution)
+
+    def exceedance(self, x = (10, 50, 90)):
+        """
+        Exceedance levels Lx for every (stratum, hour, band) cell, interpolated between ranks as np.nanquantile does.
+
+        Parameters
+        ----------
+        x: float or list of floats, exceedance levels = (100 - percentile), such that x = 10 is the 90th percentile.
+
+        Returns
+        -------
+        numpy array of floats shaped (strata, 24, bands, len(x)); NaN where a cell holds no data
+        """
+
+        x = np.atleast_1d(np.asarray(x, dtype=float))
+        q = (100 - x)/100
+
+        cumulative = np.cumsum(self.counts, axis=-1)
+        n = cumulative[..., -1:]
+
+        # ranks below and above each quantile position, per cell
+        position = (n - 1)*q
+        below = np.floor(position).astype(np.int64)
+        above = np.minimum(below + 1, n - 1)
+
+        # the value at 0-based rank r is the first bin whose cumulative count exceeds r
+        lower = np.empty(position.shape)
+        upper = np.empty(position.shape)
+        for k in range(len(q)):
+            lower[..., k] = (cumulative > below[..., k:k + 1]).argmax(axis=-1)
+            upper[..., k] = (cumulative > above[..., k:k + 1]).argmax(axis=-1)
+
+        lower = self.low + lower*self.resolution
+        upper = self.low + upper*self.resolution
+        levels = lower + (upper - lower)*(position - below)
+
+        return np.where(n > 0, levels, np.nan)
+
+
+
+def diel_histograms(nvspl, bands = None, by_season = False, low = -10., high = 130., resolution = 0.1):
+    """
+    Count every NVSPL level into a (season, hour of day, band, level bin) histogram in one pass.
+    Levels outside [low, high] are counted in the first or last bin.
+
+    Parameters
+    ----------
+    nvspl: pandas dataframe representing NPS NSNSD NVSPL file, formatted by soundDB library.  May also be ArrowDtype-backed or a pyarrow Table.
+    bands: list of str, optional.  The columns to include.  Defaults to every band and dbA present in the NVSPL.
+    by_season: boolean, optional.  Keep a separate histogram per meteorological season.  Defaults to False.
+    low, high: float, optional.  The level range in dB.  Defaults to -10 to 130 dB.
+    resolution: float, optional.  The bin width in dB.  Defaults to 0.1 dB, the NVSPL resolution.
+
+    Returns
+    -------
+    DielHistograms
+    """
+
+    present = set(column_names(nvspl))
+    bands = [b for b in (NVSPL_BANDS + ["dbA"] if bands is None else bands) if b in present]
+    if(not bands):
+        raise ValueError("none of the requested bands are in the NVSPL")
+
+    times = nvspl_times(nvspl)
+    bins = int(round((high - low)/resolution)) + 1
+
+    # one combined (stratum, hour) key per row, shared by every band
+    if(by_season):
+        strata = _SEASONS
+        stratum = pd.Index(times.month).map(SEASON_OF_MONTH).map({s: i for i, s in enumerate(_SEASONS)}).to_numpy(dtype=np.int64)
+    else:
+        strata = ["All"]
+        stratum = np.zeros(len(times), dtype=np.int64)
+    cell = (stratum*24 + times.hour.to_numpy())*bins
+
+    counts = np.zeros((len(strata)*24, len(bands), bins), dtype=np.int64)
+    for j, band in enumerate(bands):
+        values = column_values(nvspl, band)
+        valid = ~np.isnan(values)
+        levels = np.clip(np.round((values[valid] - low)/resolution).astype(np.int64), 0, bins - 1)
+        counts[:, j, :] = np.bincount(cell[valid] + levels, minlength=len(strata)*24*bins).reshape(-1, bins)
+
+    return DielHistograms(counts.reshape(len(strata), 24, len(bands), bins), strata, bands, low, resolution)
+
+
+
+def diel_exceedance(nvspl, x = (10, 50, 90), bands = None, by_season = False):
+    """
+    The diel spectral exceedance cube: Lx for every hour of the day, band and requested x, optionally by season.
+
+    Parameters
+    ----------
+    nvspl: pandas dataframe representing NPS NSNSD NVSPL file, formatted by soundDB library (or a DielHistograms from diel_histograms()).
+    x: float or list of floats, optional.  Exceedance levels = (100 - percentile), such that x = 10 is the 90th percentile.  Defaults to [10, 50, 90].
+    bands: list of str, optional.  The columns to include.  Defaults to every band and dbA present in the NVSPL.
+    by_season: boolean, optional.  Split the cube by meteorological season.  Defaults to False.
+
+    Returns
+    -------
+    pandas DataFrame indexed by (hour, band), or (season, hour, band), with one column "L<x>" per exceedance level
+    """
+
+    histograms = nvspl if isinstance(nvspl, DielHistograms) else diel_histograms(nvspl, bands, by_season)
+    x = list(np.atleast_1d(x))
+    cube = histograms.exceedance(x)
+
+    names = ["hour", "band"]
+    levels = [range(24), histograms.bands]
+    if(len(histograms.strata) > 1):
+        # seasons without data are left out
+        keep = histograms.counts.sum(axis=(1, 2, 3)) > 0
+        names = ["season"] + names
+        levels = [[s for s, k in zip(histograms.strata, keep) if k]] + levels
+        cube = cube[keep]
+    else:
+        cube = cube[0]
+
+    index = pd.MultiIndex.from_product(levels, names=names)
+
+    return pd.DataFrame(cube.reshape(-1, len(x)), index=index, columns=["L" + str(v) for v in x])
@@ -0,0 +1,234 @@
+import datetime
+
+import pandas as pd
+import numpy as np
+
+import _core
+from kernels import running_max_nfi
+from srcid_compact import srcid_codes, srcid_levels, SOURCE_CODE_SCALE
+from srcid_index import indexed_events
+from stratified import SOURCE_GROUPS
+
+#------------------------------------------------------------------------------------------------------------------
+# ### NOISE EPISODES: SRCID EVENTS MERGED ACROSS SHORT GAPS
+#
+# An overflight is often annotated as a burst of several events a few seconds apart; managers count it once.
+# Events are sorted by start (or taken in order from a SRCIDIntervalIndex passed as index=), the gap before each
+# event is measured from the latest end of any earlier event (so overlapping annotations never open a new episode),
+# and episodes are labelled by a cumulative sum over the gap > max_gap mask.  Each episode is then reduced in one
+# vectorized pass: start, end, energetic SEL sum, maximum Lmax and member count.
+#
+# episodes() returns a frame in the soundDB srcid layout, so every srcid function in derivedDataFunctions
+# also works on episodes.  The helpers below it are the episode-level count, duration, amplitude and NFI metrics.
+
+
+def _label(starts, ends, max_gap_ns, groups):
+
+    # a new episode opens at each group boundary and wherever the silence before an event exceeds max_gap
+    opens = np.ones(len(starts), dtype=bool)
+    boundaries = np.flatnonzero(np.diff(groups)) + 1
+
+    for lo, hi in zip(np.concatenate([[0], boundaries]), np.concatenate([boundaries, [len(starts)]])):
+        opens[lo + 1:hi] = running_max_nfi(starts[lo:hi], ends[lo:hi]) > max_gap_ns
+
+    return np.cumsum(opens) - 1, np.flatnonzero(opens)
+
+
+def episodes(srcid, max_gap = 30, source = "all", by = "source_group", index = None):
+    """
+    Merge SRCID events separated by at most max_gap seconds into noise episodes.
+
+    Parameters
+    ----------
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
+    max_gap: float, optional.  The longest silence, in seconds, that still joins two events into one episode.  Defaults to 30.
+    source: str or list of floats, optional.  Which subset of srcid codes to merge - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
+    by: str or None, optional.  "source_group" keeps episodes of different source groups (air, vehicle, ...) apart; None merges across groups.  Defaults to "source_group".
+    index: SRCIDIntervalIndex, optional.  An index over the same srcid and source, whose sorted events are reused.  Defaults to None.
+
+    Returns
+    -------
+    pandas dataframe in the srcid layout, one row per episode, indexed by episode start: len, srcID (of the loudest member), MaxSPL (maximum),
+    SEL (energetic sum), MaxSPLt and SELt when present, members (event count) and source_group
+    """
+
+    if(by not in ["source_group", None]):
+        raise ValueError('by must be either "source_group" or None')
+
+    starts, ends, positions = indexed_events(srcid, source, index)
+    codes = srcid_codes(srcid)[positions]
+    groups = codes//SOURCE_CODE_SCALE if by == "source_group" else np.zeros(len(codes), dtype=np.int64)
+
+    # events ordered by group, then by start: a stable sort of the start-ordered events by group
+    order = np.argsort(groups, kind="stable")
+    starts, ends, codes, groups = starts[order], ends[order], codes[order], groups[order]
+
+    present = [c for c in ["MaxSPL", "SEL", "MaxSPLt", "SELt"] if c in srcid.columns]
+    levels = {c: srcid_levels(srcid, c)[positions][order] for c in present}
+
+    label, first = _label(starts, ends, int(round(max_gap*1e9)), groups)
+    if(len(first) == 0):
+        return pd.DataFrame(columns=["len", "srcID"] + present + ["members", "source_group"], index=pd.DatetimeIndex([], name=srcid.index.name))
+
+    episode_end = np.maximum.reduceat(ends, first)
+
+    out = pd.DataFrame(index=pd.DatetimeIndex(starts[first].view("datetime64[ns]"), name=srcid.index.name))
+    out["len"] = pd.to_timedelta(episode_end - starts[first], unit="ns")
+
+    # the loudest member (by Lmax) names the episode's srcID, so source filters work on episodes as on events
+    Lmax = levels.get("MaxSPL", np.zeros(len(starts)))
+    loudest = np.lexsort((-np.nan_to_num(Lmax, nan=-np.inf), label))
+    out["srcID"] = codes[loudest[first]]/float(SOURCE_CODE_SCALE)
+
+    for column, values in levels.items():
+        if(column.startswith("MaxSPL")):
+            out[column] = np.fmax.reduceat(values, first)
+        else:
+            # SEL is an energy dose, so members add logarithmically
+            energy = np.bincount(label, weights=np.nan_to_num(np.power(10, values/10)), minlength=len(first))
+            with np.errstate(divide="ignore"):
+                out[column] = np.where(energy > 0, np.round(10*np.log10(energy), 1), np.nan)
+
+    out["members"] = np.diff(np.append(first, len(starts)))
+    out["source_group"] = [SOURCE_GROUPS.get(g, str(g)) for g in groups[first]] if by == "source_group" else "all"
+
+    return out.sort_index(kind="stable")
+
+
+
+#------------------------------------------------------------------------------------------------------------------
+# ### EPISODE-LEVEL METRICS
+
+
+def episode_count(srcid, max_gap = 30, source = "all", by = "source_group", index = None):
+    """
+    The number of noise episodes.
+
+    Parameters
+    ----------
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
+    max_gap: float, optional.  The longest silence, in seconds, that still joins two events into one episode.  Defaults to 30.
+    source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
+    by: str or None, optional.  "source_group" keeps episodes of different source groups apart; None merges across groups.  Defaults to "source_group".
+    index: SRCIDIntervalIndex, optional.  An index over the same srcid and source, whose sorted events are reused.  Defaults to None.
+
+    Returns
+    -------
+    int
+    """
+
+    return len(episodes(srcid, max_gap, source, by, index))
+
+
+
+def quantile_episode_duration(srcid, q, max_gap = 30, source = "all", by = "source_group", index = None):
+    """
+    A quantile of noise episode durations.
+
+    Parameters
+    ----------
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
+    q: float, a value that indicates the quantile desired, from 0.0 (minimum) to 1.0 (maximum.)
+    max_gap: float, optional.  The longest silence, in seconds, that still joins two events into one episode.  Defaults to 30.
+    source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
+    by: str or None, optional.  "source_group" keeps episodes of different source groups apart; None merges across groups.  Defaults to "source_group".
+    index: SRCIDIntervalIndex, optional.  An index over the same srcid and source, whose sorted events are reused.  Defaults to None.
+
+    Returns
+    -------
+    timedelta
+    """
+
+    return datetime.timedelta(seconds = _core.quantile(_core.durations_s(episodes(srcid, max_gap, source, by, index)), q))
+
+
+
+def total_episode_duration(srcid, max_gap = 30, source = "all", by = "source_group", index = None):
+    """
+    The summed duration of noise episodes, including the short gaps they absorb.
+
+    Parameters
+    ----------
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
+    max_gap: float, optional.  The longest silence, in seconds, that still joins two events into one episode.  Defaults to 30.
+    source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
+    by: str or None, optional.  "source_group" keeps episodes of different source groups apart; None merges across groups.  Defaults to "source_group".
+    index: SRCIDIntervalIndex, optional.  An index over the same srcid and source, whose sorted events are reused.  Defaults to None.
+
+    Returns
+    -------
+    pandas Timedelta
+    """
+
+    return pd.Timedelta(seconds = _core.total(_core.durations_s(episodes(srcid, max_gap, source, by, index))))
+
+
+
+def quantile_episode_amplitude(srcid, q, max_gap = 30, metric = "Lmax", weight = "A", source = "all", by = "source_group", index = None):
+    """
+    A quantile of noise episode amplitudes: the loudest member's Lmax, or the energetic sum of member SELs.
+
+    Parameters
+    ----------
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
+    q: float, a value that indicates the quantile desired, from 0.0 (minimum) to 1.0 (maximum.)
+    max_gap: float, optional.  The longest silence, in seconds, that still joins two events into one episode.  Defaults to 30.
+    metric: str, optional.  The amplitude metric to use when preforming the calculation, either "Lmax" or "SEL". Defaults to "Lmax" if unspecified.
+    weight: str, optional.  The acoustic weighting used to calculate Lmax, either "A" or "T". Defaults to "A" if unspecified.
+    source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
+    by: str or None, optional.  "source_group" keeps episodes of different source groups apart; None merges across groups.  Defaults to "source_group".
+    index: SRCIDIntervalIndex, optional.  An index over the same srcid and source, whose sorted events are reused.  Defaults to None.
+
+    Returns
+    -------
+    formatted float
+    """
+
+    return float("{0:.1f}".format(_core.quantile(_core.levels(episodes(srcid, max_gap, source, by, index), metric, weight), q)))
+
+
+
+def episode_NFI_list(srcid, max_gap = 30, source = "all", unit = "hours", index = None):
+    """
+    The noise free intervals between episodes: from the end of each episode to the start of the next.
+    Episodes are merged across source groups here, so every interval is truly free of the selected sources.
+
+    Parameters
+    ----------
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
+    max_gap: float, optional.  The longest silence, in seconds, that still joins two events into one episode.  Defaults to 30.
+    source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
+    unit: str, a value that indicates the units desired for the output value.  Defaults to "hours".
+    index: SRCIDIntervalIndex, optional.  An index over the same srcid and source, whose sorted events are reused.  Defaults to None.
+
+    Returns
+    -------
+    pandas Series of floating-point times
+    """
+
+    unitDict = {"seconds":1, "minutes":60, "hours":3600, "days":86400}
+
+    starts, ends = _core.events_ns(episodes(srcid, max_gap, source, by = None, index = index))
+
+    return pd.Series(_core.nfi_between_events(starts, ends, unitDict[unit]))
+
+
+
+def mean_episode_NFI(srcid, max_gap = 30, source = "all", unit = "hours", index = None):
+    """
+    The average noise free interval between episodes.
+
+    Parameters
+    ----------
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
+    max_gap: float, optional.  The longest silence, in seconds, that still joins two events into one episode.  Defaults to 30.
+    source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
+    unit: str, a value that indicates the units desired for the output value.  Defaults to "hours".
+    index: SRCIDIntervalIndex, optional.  An index over the same srcid and source, whose sorted events are reused.  Defaults to None.
+
+    Returns
+    -------
+    numpy.float64
+    """
+
+    return episode_NFI_list(srcid, max_gap, source, unit, index).mean()
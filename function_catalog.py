@@ -0,0 +1,80 @@
+import inspect
+
+#------------------------------------------------------------------------------------------------------------------
+# ### PUBLIC FUNCTIONS AND THE DATA PRODUCTS THEY TAKE
+#
+# The report planner, the metrics service, the benchmark suite and the memory harness all enumerate the public
+# functions of a module and dispatch on the data product named by each function's first parameter:
+#
+#     for name, function in public_functions(derivedDataFunctions):
+#         args = call_arguments(function, site)      # site as from synthetic_data.synthetic_site()
+
+
+# the data product taken by a function, by the name of its first parameter
+PRODUCTS = {"srcid": "srcid", "src": "srcid", "df": "srcid", "dailypa": "dailypa",
+            "loudevents": "loudevents", "metrics": "metrics", "nvspl": "nvspl"}
+
+# representative values for the non-data arguments of each public function
+ARGUMENTS = {"q": 0.5,
+             "hour": 12,
+             "zone": "low",
+             "x": 10,
+             "id_code": 1.1,
+             "threshold": 35}
+
+
+def public_functions(module):
+    """
+    List the public functions defined in a module (not the ones it imports).
+
+    Returns
+    -------
+    list of (name, function) tuples in source order
+    """
+
+    found = [(name, f) for name, f in inspect.getmembers(module, inspect.isfunction)
+             if not name.startswith("_") and f.__module__ == module.__name__]
+
+    return sorted(found, key=lambda item: inspect.unwrap(item[1]).__code__.co_firstlineno)
+
+
+def data_product(function):
+    """
+    The data product a public function takes as its first argument: "srcid", "dailypa", "loudevents", "metrics" or "nvspl".
+    """
+
+    return PRODUCTS[list(inspect.signature(function).parameters)[0]]
+
+
+def call_arguments(function, site, arguments = ARGUMENTS):
+    """
+    Positional arguments for calling a public function on one site: its data product, then a representative value
+    for every parameter without a default.
+
+    Parameters
+    ----------
+    function: callable, a public function from derivedDataFunctions or merge_SRCID.
+    site: dict of data products, as produced by synthetic_data.synthetic_site().
+    arguments: dict, optional.  Values for the non-data parameters, by name.  Defaults to ARGUMENTS.
+
+    Returns
+    -------
+    list
+    """
+
+    params = list(inspect.signature(function).parameters.values())
+
+    # join_srcID_rows(df) joins the pieces of one merge group, which carry merge_SRCID's trailing group column
+    if(params[0].name == "df"):
+        data = site["srcid"].head(4).assign(group=0.)
+    else:
+        data = site[PRODUCTS[params[0].name]]
+
+    args = [data]
+    for p in params[1:]:
+        if(p.name in arguments):
+            args.append(arguments[p.name])
+        elif(p.default is inspect.Parameter.empty):
+            raise TypeError("no representative value for argument " + p.name)
+
+    return args
@@ -0,0 +1,334 @@
+import contextlib
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+
+import pandas as pd
+
+#------------------------------------------------------------------------------------------------------------------
+# ### OPT-IN PROFILING AND HOT-PATH INSTRUMENTATION
+#
+# Turn on for a whole process by setting DDF_PROFILE=1 before importing derivedDataFunctions / merge_SRCID,
+# or for a block of code with:
+#
+#     with instrumentation.profiling() as registry:
+#         derivedDataFunctions.overall_PA(dailypa)
+#     print(registry.table())
+#
+# Public functions are only wrapped while profiling is on, so when it is off calls run the original,
+# unwrapped functions at no cost.  Note that a name bound with "from derivedDataFunctions import Lx"
+# before profiling() was entered still points at the unwrapped function; DDF_PROFILE=1 avoids this
+# by wrapping the modules as they are imported.
+
+
+ENVIRONMENT_VARIABLE = "DDF_PROFILE"
+
+# the arguments that select which source / weight / metric branch a function runs
+BRANCH_ARGUMENTS = ("source", "weight", "metric", "unit", "dBA_only", "season", "zone", "timeRange")
+
+
+class Registry(object):
+    """
+    In-process store of call records: one dict per instrumented call, plus cache hit / miss counters.
+    """
+
+    def __init__(self):
+        self.records = []
+        self.cache = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._origin = time.perf_counter()
+
+    def _stack(self):
+        if(not hasattr(self._local, "stack")):
+            self._local.stack = []
+        return self._local.stack
+
+    def add(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def record_cache(self, name, hit):
+        """
+        Count a cache hit or miss, attributing it to the instrumented call currently running (if any).
+
+        Parameters
+        ----------
+        name: str, the name of the cache.
+        hit: bool, whether the lookup was a hit.
+        """
+
+        with self._lock:
+            hits, misses = self.cache.get(name, (0, 0))
+            self.cache[name] = (hits + int(hit), misses + int(not hit))
+
+        stack = self._stack()
+        if(stack):
+            key = "cache_hits" if hit else "cache_misses"
+            stack[-1][key] = stack[-1].get(key, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self.records = []
+            self.cache = {}
+
+    def table(self):
+        """
+        Summarize the records by function.
+
+        Returns
+        -------
+        pandas DataFrame indexed by (module, function) with calls, total / mean / max seconds, self seconds,
+        input rows and cache hits, sorted by total time
+        """
+
+        columns = ["module", "function", "seconds", "self_seconds", "rows", "cache_hits", "cache_misses"]
+        if(not self.records):
+            return pd.DataFrame(columns=columns[2:])
+
+        frame = pd.DataFrame(self.records).reindex(columns=columns)
+        frame[columns[4:]] = frame[columns[4:]].fillna(0)
+
+        grouped = frame.groupby(["module", "function"])
+        out = grouped.agg(calls=("seconds", "size"),
+                          total_seconds=("seconds", "sum"),
+                          mean_seconds=("seconds", "mean"),
+                          max_seconds=("seconds", "max"),
+                          self_seconds=("self_seconds", "sum"),
+                          rows=("rows", "sum"),
+                          cache_hits=("cache_hits", "sum"),
+                          cache_misses=("cache_misses", "sum"))
+
+        return out.sort_values("total_seconds", ascending=False)
+
+    def branches(self):
+        """
+        Count calls per (function, branch arguments), e.g. how often quantile_amplitude ran with source="air".
+
+        Returns
+        -------
+        pandas Series of call counts
+        """
+
+        rows = [dict(function=r["function"], **{k: str(v) for k, v in r["branch"].items()}) for r in self.records]
+        frame = pd.DataFrame(rows)
+
+        return frame.fillna("").groupby(list(frame.columns)).size()
+
+    def chrome_trace(self):
+        """
+        Convert the records to the Chrome trace event format (load in chrome://tracing or Perfetto).
+
+        Returns
+        -------
+        dict ready for json.dump
+        """
+
+        events = []
+        for r in self.records:
+            events.append({"name": r["function"],
+                           "cat": r["module"],
+                           "ph": "X",
+                           "ts": r["start"]*1e6,
+                           "dur": r["seconds"]*1e6,
+                           "pid": r["pid"],
+                           "tid": r["thread"],
+                           "args": dict(rows=r["rows"], **{k: str(v) for k, v in r["branch"].items()})})
+
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def dump_chrome_trace(self, path):
+        """
+        Write the records to a Chrome-trace JSON file.
+        """
+
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+
+
+# the process-wide registry
+registry = Registry()
+
+_enabled = False
+_originals = {}
+
+
+def _input_rows(value):
+
+    # dataframes, series, arrays and arrow tables all support len(); metrics objects do not
+    try:
+        return len(value)
+    except TypeError:
+        return 0
+
+
+def _wrap(function):
+
+    signature = inspect.signature(function)
+    branch_names = [n for n in BRANCH_ARGUMENTS if n in signature.parameters]
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+
+        if(not _enabled):
+            return function(*args, **kwargs)
+
+        bound = signature.bind_partial(*args, **kwargs)
+        first = next(iter(bound.arguments.values()), None)
+
+        record = {"module": function.__module__,
+                  "function": function.__name__,
+                  "rows": _input_rows(first),
+                  "branch": {n: bound.arguments.get(n, signature.parameters[n].default) for n in branch_names},
+                  "pid": os.getpid(),
+                  "thread": threading.get_ident(),
+                  "child_seconds": 0.}
+
+        stack = registry._stack()
+        stack.append(record)
+
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+
+            # nested instrumented calls (e.g. quantile_NFI -> NFI_list) count towards the parent's time only once
+            if(stack):
+                stack[-1]["child_seconds"] += elapsed
+
+            record["start"] = start - registry._origin
+            record["seconds"] = elapsed
+            record["self_seconds"] = elapsed - record.pop("child_seconds")
+            registry.add(record)
+
+    wrapper.__instrumented__ = True
+
+    return wrapper
+
+
+def instrument(module):
+    """
+    Replace every public function defined in a module with an instrumented wrapper.
+
+    Parameters
+    ----------
+    module: module object, e.g. derivedDataFunctions.
+    """
+
+    for name, function in inspect.getmembers(module, inspect.isfunction):
+        if(name.startswith("_") or function.__module__ != module.__name__):
+            continue
+        if(getattr(function, "__instrumented__", False)):
+            continue
+
+        _originals[(module.__name__, name)] = function
+        setattr(module, name, _wrap(function))
+
+
+def uninstrument(module):
+    """
+    Restore the original, unwrapped functions of a module.
+    """
+
+    for (module_name, name), function in list(_originals.items()):
+        if(module_name == module.__name__):
+            setattr(module, name, function)
+            del _originals[(module_name, name)]
+
+
+def _target_modules():
+
+    import derivedDataFunctions
+    import merge_SRCID
+
+    return [derivedDataFunctions, merge_SRCID]
+
+
+def enable():
+    """
+    Start recording calls to every public function in derivedDataFunctions and merge_SRCID.
+    """
+
+    global _enabled
+
+    for module in _target_modules():
+        instrument(module)
+    _enabled = True
+
+
+def disable():
+    """
+    Stop recording.  Modules wrapped because DDF_PROFILE was set stay wrapped, but their wrappers
+    fall straight through to the original functions.
+    """
+
+    global _enabled
+
+    _enabled = False
+    if(not os.environ.get(ENVIRONMENT_VARIABLE)):
+        for module in _target_modules():
+            uninstrument(module)
+
+
+def is_enabled():
+    return _enabled
+
+
+def record_cache(name, hit):
+    """
+    Count a cache hit or miss in the registry.  A no-op unless profiling is on.
+
+    Parameters
+    ----------
+    name: str, the name of the cache.
+    hit: bool, whether the lookup was a hit.
+    """
+
+    if(_enabled):
+        registry.record_cache(name, hit)
+
+
+@contextlib.contextmanager
+def profiling(clear = True):
+    """
+    Context manager that records calls made inside the block.
+
+    Parameters
+    ----------
+    clear: bool, optional.  Empty the registry on entry.  Defaults to True.
+
+    Returns
+    -------
+    the Registry, for .table(), .branches() or .dump_chrome_trace(path)
+    """
+
+    was_enabled = _enabled
+    if(clear):
+        registry.clear()
+
+    enable()
+    try:
+        yield registry
+    finally:
+        if(not was_enabled):
+            disable()
+
+
+def instrument_on_import(module_name):
+    """
+    Called at the bottom of derivedDataFunctions and merge_SRCID: wraps the module and turns
+    recording on when the DDF_PROFILE environment variable is set.
+    """
+
+    global _enabled
+
+    if(os.environ.get(ENVIRONMENT_VARIABLE)):
+        instrument(sys.modules[module_name])
+        _enabled = True
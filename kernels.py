@@ -0,0 +1,339 @@
+import numpy as np
+
+#------------------------------------------------------------------------------------------------------------------
+# ### OPTIONAL JIT-COMPILED KERNELS FOR THE SEQUENTIAL LOOPS
+#
+# A few steps are inherently sequential: the group-assignment state machine in merge_SRCID, noise free intervals
+# measured from the running maximum of event ends, hysteresis event detection, and splitting events at hour
+# breaks.  Each is written once as a plain loop, compiled with Numba when it is installed (cache=True, so the
+# compiled code persists across processes), and otherwise answered by an equivalent vectorized numpy version.
+# Both paths work on integers (or compare floats without arithmetic) and return bit-identical results;
+# verify_kernels() checks this on random inputs (run by test_kernels.py).
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+def _jit(function):
+
+    if(numba is None):
+        return None
+
+    return numba.njit(cache=True, nogil=True)(function)
+
+
+def jit_available():
+    """
+    True when Numba is installed and the compiled kernels are used.
+    """
+
+    return numba is not None
+
+
+
+#------------------------------------------------------------------------------------------------------------------
+# ### MERGE_SRCID GROUP ASSIGNMENT
+
+
+def _merge_groups_loop(block, start_minute, start_second, end_minute, end_second):
+
+    n = len(block)
+    groups = np.empty(n, dtype=np.int64)
+    group = 1
+
+    for i in range(n):
+
+        if((start_minute[i] != 0) & (start_second[i] != 0) & (end_minute[i] == 59) & (end_second[i] == 59)):
+            group = group + 1
+            groups[i] = group
+
+        elif((start_minute[i] == 0) & (start_second[i] == 0) & (end_minute[i] != 59) & (end_second[i] != 59)):
+            groups[i] = group
+            group = group + 1
+
+        else:
+            groups[i] = group
+
+        # at the end of the current source type, "flush" the current group
+        if((i == n - 1) or (block[i + 1] != block[i])):
+            group = group + 1
+
+    return groups
+
+
+def _merge_groups_numpy(block, start_minute, start_second, end_minute, end_second):
+
+    block = np.asarray(block)
+    opens = (start_minute != 0) & (start_second != 0) & (end_minute == 59) & (end_second == 59)
+    closes = (start_minute == 0) & (start_second == 0) & (end_minute != 59) & (end_second != 59)
+
+    last_in_block = np.ones(len(block), dtype=bool)
+    last_in_block[:-1] = block[1:] != block[:-1]
+
+    # increments applied before a row (opens) count for that row; those applied after (closes, block ends) for later rows
+    after = closes.astype(np.int64) + last_in_block
+    return 1 + np.cumsum(opens, dtype=np.int64) + np.cumsum(after) - after
+
+
+_merge_groups_jit = _jit(_merge_groups_loop)
+
+
+def merge_groups(block, start_minute, start_second, end_minute, end_second):
+    """
+    The group-assignment state machine of merge_SRCID: consecutive hour-break annotations of one source get
+    the same group number.  Rows must be ordered by source, then by time.
+
+    Parameters
+    ----------
+    block: array of ints, one value per source (e.g. codes from pandas.factorize), non-decreasing.
+    start_minute, start_second: arrays of ints, clock minute and second of each annotation's start.
+    end_minute, end_second: arrays of ints, clock minute and second of each annotation's end (start + len).
+
+    Returns
+    -------
+    numpy array of int64 group numbers
+    """
+
+    arrays = [np.ascontiguousarray(a, dtype=np.int64) for a in (block, start_minute, start_second, end_minute, end_second)]
+    if(len(arrays[0]) == 0):
+        return np.zeros(0, dtype=np.int64)
+
+    if(_merge_groups_jit is not None):
+        return _merge_groups_jit(*arrays)
+
+    return _merge_groups_numpy(*arrays)
+
+
+
+#------------------------------------------------------------------------------------------------------------------
+# ### NOISE FREE INTERVALS FROM THE RUNNING MAXIMUM OF EVENT ENDS
+
+
+def _running_max_nfi_loop(starts, ends):
+
+    n = len(starts)
+    gaps = np.empty(max(n - 1, 0), dtype=np.int64)
+    latest = ends[0]
+
+    for i in range(1, n):
+        gaps[i - 1] = starts[i] - latest
+        if(ends[i] > latest):
+            latest = ends[i]
+
+    return gaps
+
+
+def _running_max_nfi_numpy(starts, ends):
+
+    return starts[1:] - np.maximum.accumulate(ends)[:-1]
+
+
+_running_max_nfi_jit = _jit(_running_max_nfi_loop)
+
+
+def running_max_nfi(starts, ends):
+    """
+    Noise free intervals that respect overlapping events: the silence before each event is measured from the
+    latest end of any earlier event, not just the previous one.
+
+    Parameters
+    ----------
+    starts: array of int64 (e.g. nanoseconds), sorted ascending.
+    ends: array of int64, the end of each event.
+
+    Returns
+    -------
+    numpy array of int64 intervals, one per event after the first; zero or negative where an event started
+    while another was still audible
+    """
+
+    starts = np.ascontiguousarray(starts, dtype=np.int64)
+    ends = np.ascontiguousarray(ends, dtype=np.int64)
+    if(len(starts) == 0):
+        return np.zeros(0, dtype=np.int64)
+
+    if(_running_max_nfi_jit is not None):
+        return _running_max_nfi_jit(starts, ends)
+
+    return _running_max_nfi_numpy(starts, ends)
+
+
+
+#------------------------------------------------------------------------------------------------------------------
+# ### HYSTERESIS EVENT DETECTION
+
+
+def _hysteresis_loop(levels, on, off):
+
+    n = len(levels)
+    state = np.zeros(n, dtype=np.bool_)
+    current = False
+
+    for i in range(n):
+        # NaN compares False both ways, so it holds the current state
+        if(levels[i] >= on):
+            current = True
+        elif(levels[i] < off):
+            current = False
+        state[i] = current
+
+    return state
+
+
+def _hysteresis_numpy(levels, on, off):
+
+    # the state at each sample is set by the most recent sample above "on" or below "off"
+    decisive = (levels >= on) | (levels < off)
+    last = np.maximum.accumulate(np.where(decisive, np.arange(len(levels)), -1))
+
+    return np.where(last >= 0, levels[np.maximum(last, 0)] >= on, False)
+
+
+_hysteresis_jit = _jit(_hysteresis_loop)
+
+
+def hysteresis_events(levels, on, off):
+    """
+    Detect events in a level time series with hysteresis: an event begins when the level reaches "on" and lasts
+    until it falls below "off", so a level hovering around one threshold does not fragment into many events.
+
+    Parameters
+    ----------
+    levels: array of floats, e.g. one-second dBA values from an NVSPL.
+    on: float, the level at or above which an event begins.
+    off: float, the level below which an event ends.  Must not exceed "on".
+
+    Returns
+    -------
+    tuple: (numpy array of start positions, numpy array of stop positions), with each event covering levels[start:stop]
+    """
+
+    if(off > on):
+        raise ValueError('the "off" threshold must not exceed the "on" threshold')
+
+    levels = np.ascontiguousarray(levels, dtype=np.float64)
+    if(len(levels) == 0):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    if(_hysteresis_jit is not None):
+        state = _hysteresis_jit(levels, float(on), float(off))
+    else:
+        state = _hysteresis_numpy(levels, float(on), float(off))
+
+    edges = np.diff(np.concatenate([[0], state.astype(np.int8), [0]]))
+
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+
+#------------------------------------------------------------------------------------------------------------------
+# ### SPLITTING EVENTS AT HOUR BREAKS
+
+
+def _split_hours_loop(starts, ends, period):
+
+    n = len(starts)
+    total = 0
+    for i in range(n):
+        if(ends[i] > starts[i]):
+            total += (ends[i] - 1)//period - starts[i]//period + 1
+
+    rows = np.empty(total, dtype=np.int64)
+    piece_starts = np.empty(total, dtype=np.int64)
+    piece_ends = np.empty(total, dtype=np.int64)
+
+    k = 0
+    for i in range(n):
+        t = starts[i]
+        while(t < ends[i]):
+            boundary = (t//period + 1)*period
+            rows[k] = i
+            piece_starts[k] = t
+            piece_ends[k] = min(boundary, ends[i])
+            t = boundary
+            k += 1
+
+    return rows, piece_starts, piece_ends
+
+
+def _split_hours_numpy(starts, ends, period):
+
+    first = starts//period
+    counts = np.where(ends > starts, (ends - 1)//period - first + 1, 0)
+
+    rows = np.repeat(np.arange(len(starts)), counts)
+    hour = first[rows] + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    return rows, np.maximum(starts[rows], hour*period), np.minimum(ends[rows], (hour + 1)*period)
+
+
+_split_hours_jit = _jit(_split_hours_loop)
+
+
+def split_at_hours(starts, ends, period = 3600*10**9):
+    """
+    Split events into pieces that each fall within one clock hour (or any other period).
+
+    Parameters
+    ----------
+    starts: array of int64, event starts (by default in nanoseconds since the epoch).
+    ends: array of int64, event ends.
+    period: int, optional.  The period length in the same unit.  Defaults to one hour in nanoseconds.
+
+    Returns
+    -------
+    tuple: (row of the original event, piece start, piece end) as numpy arrays of int64
+    """
+
+    starts = np.ascontiguousarray(starts, dtype=np.int64)
+    ends = np.ascontiguousarray(ends, dtype=np.int64)
+
+    if(_split_hours_jit is not None):
+        return _split_hours_jit(starts, ends, np.int64(period))
+
+    return _split_hours_numpy(starts, ends, np.int64(period))
+
+
+
+#------------------------------------------------------------------------------------------------------------------
+# ### CROSS-CHECK
+
+
+def verify_kernels(n = 10000, seed = 0):
+    """
+    Run the plain-loop and numpy versions of every kernel on random inputs and check they agree exactly
+    (and the compiled versions too, when Numba is installed).
+
+    Returns
+    -------
+    True, or raises AssertionError naming the kernel that disagrees
+    """
+
+    rng = np.random.default_rng(seed)
+
+    block = np.sort(rng.integers(0, 5, n))
+    clock = [rng.choice([0, 1, 30, 59], n) for _ in range(4)]
+    starts = np.sort(rng.integers(0, 10**6, n))
+    ends = starts + rng.integers(0, 5000, n)
+    levels = np.round(rng.normal(40, 8, n), 1)
+    levels[rng.random(n) < 0.01] = np.nan
+
+    cases = {"merge_groups": (_merge_groups_loop, _merge_groups_numpy, _merge_groups_jit, (block, *clock)),
+             "running_max_nfi": (_running_max_nfi_loop, _running_max_nfi_numpy, _running_max_nfi_jit, (starts, ends)),
+             "hysteresis_events": (_hysteresis_loop, _hysteresis_numpy, _hysteresis_jit, (levels, 45.0, 40.0)),
+             "split_at_hours": (_split_hours_loop, _split_hours_numpy, _split_hours_jit, (starts, ends, np.int64(3600)))}
+
+    for name, (loop, vectorized, compiled, args) in cases.items():
+        expected = loop(*args)
+        for version in [vectorized, compiled]:
+            if(version is None):
+                continue
+            result = version(*args)
+            if(isinstance(expected, tuple)):
+                assert all(np.array_equal(a, b) for a, b in zip(expected, result)), name
+            else:
+                assert np.array_equal(expected, result), name
+
+    return True
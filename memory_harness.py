@@ -0,0 +1,212 @@
+import argparse
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+import numpy as np
+
+import derivedDataFunctions
+import merge_SRCID
+import synthetic_data
+from benchmark_suite import SCALES
+from function_catalog import call_arguments, public_functions
+
+#------------------------------------------------------------------------------------------------------------------
+# ### PEAK-MEMORY REGRESSION HARNESS
+#
+# Runs every public function in derivedDataFunctions and merge_SRCID on scaled synthetic inputs under tracemalloc,
+# while a background thread samples the process RSS, and reports peak memory as a multiple of the input size.
+# A function whose peak exceeds its declared budget fails the run:
+#
+#     python memory_harness.py --scale season --scale year
+#     python memory_harness.py --function Lx --function merge_SRCID
+
+
+# peak traced allocation allowed, as a multiple of the deep size of the function's data argument;
+# most functions peak near 1x, the dailypa functions that concatenate per-day pieces near 3.5x
+DEFAULT_BUDGET = 2.0
+
+BUDGETS = {"Lx": 1.0,
+           "merge_SRCID": 3.0,
+           "overall_PA": 5.0,
+           "DENABCMP_PA_exceedance": 5.0,
+           "event_saturation": 5.0}
+
+# peaks below this are pandas' fixed per-call overhead rather than growth with the input (Ldn on a metrics
+# object of a few kB, join_srcID_rows on one merge group), so they are reported but never fail a budget
+MIN_CHECKED_BYTES = 2**18
+
+_SAMPLE_SECONDS = 0.005
+
+
+def data_bytes(data):
+    """
+    The deep in-memory size of a data product: pandas objects including object-typed values and the index,
+    numpy arrays by their buffers, and the .data members of a metrics object.
+
+    Returns
+    -------
+    int, bytes
+    """
+
+    if(isinstance(data, (pd.DataFrame, pd.Series))):
+        usage = data.memory_usage(deep=True, index=True)
+        return int(usage.sum() if isinstance(data, pd.DataFrame) else usage)
+
+    if(isinstance(data, np.ndarray)):
+        return int(data.nbytes)
+
+    # metrics objects hold their tables as members with a .data attribute
+    return int(sum(data_bytes(member.data) for member in vars(data).values() if hasattr(member, "data")))
+
+
+def _rss():
+
+    # resident set size in bytes, from /proc where available
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1])*os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+
+class _RSSSampler(threading.Thread):
+
+    def __init__(self):
+
+        threading.Thread.__init__(self, daemon=True)
+        self.baseline = _rss()
+        self.peak = self.baseline
+        self._done = threading.Event()
+
+    def run(self):
+
+        while(not self._done.is_set()):
+            current = _rss()
+            if(current is not None and current > self.peak):
+                self.peak = current
+            time.sleep(_SAMPLE_SECONDS)
+
+    def finish(self):
+
+        self._done.set()
+        self.join()
+
+        current = _rss()
+        if(current is not None and current > self.peak):
+            self.peak = current
+
+        return None if self.baseline is None else self.peak - self.baseline
+
+
+def measure_function(function, site, budget = None):
+    """
+    Measure the peak memory of one call on one synthetic site.
+
+    Parameters
+    ----------
+    function: callable, a public function from derivedDataFunctions or merge_SRCID.
+    site: dict produced by synthetic_data.synthetic_site().
+    budget: float, optional.  Allowed peak as a multiple of the input size.  Defaults to the function's entry in BUDGETS.
+
+    Returns
+    -------
+    dict with "input_bytes", "peak_bytes" (tracemalloc), "rss_bytes" (sampled RSS growth), "ratio", "budget" and "status"
+    """
+
+    name = function.__name__
+    budget = budget if budget is not None else BUDGETS.get(name, DEFAULT_BUDGET)
+
+    args = call_arguments(function, site)
+    size = data_bytes(args[0])
+
+    # measure a copy made before tracing starts, so each call sees unshared input
+    if(hasattr(args[0], "copy")):
+        args[0] = args[0].copy()
+
+    sampler = _RSSSampler()
+    sampler.start()
+    tracemalloc.start()
+    try:
+        function(*args)
+        _, peak = tracemalloc.get_traced_memory()
+        status = "ok"
+        error = None
+    except Exception as e:
+        _, peak = tracemalloc.get_traced_memory()
+        status = "error"
+        error = type(e).__name__ + ": " + str(e)[:200]
+    finally:
+        tracemalloc.stop()
+        rss = sampler.finish()
+
+    ratio = peak/size if size else np.nan
+    if(status == "ok" and ratio > budget and peak > MIN_CHECKED_BYTES):
+        status = "over budget"
+
+    record = {"input_bytes": size, "peak_bytes": peak, "rss_bytes": rss, "ratio": ratio,
+              "budget": budget, "status": status}
+    if(error is not None):
+        record["error"] = error
+
+    return record
+
+
+def run_memory_checks(scales = ("season",), seed = 0, functions = None, budgets = None):
+    """
+    Measure every public function at each scale, worst site per (scale, function).
+
+    Parameters
+    ----------
+    scales: list of str, optional.  Keys of benchmark_suite.SCALES to run.  Defaults to ("season",).
+    seed: int, optional.  Seed for the synthetic data.  Defaults to 0.
+    functions: list of str, optional.  Only measure functions with these names.
+    budgets: dict, optional.  Budgets overriding BUDGETS, as {function name: multiple of input size}.
+
+    Returns
+    -------
+    pandas DataFrame indexed by (scale, function), largest ratio first
+    """
+
+    budgets = dict(BUDGETS, **(budgets or {}))
+
+    targets = public_functions(derivedDataFunctions) + public_functions(merge_SRCID)
+    if(functions is not None):
+        targets = [(name, f) for name, f in targets if name in functions]
+
+    records = []
+    for scale in scales:
+
+        days, nvspl_hours, n_sites = SCALES[scale]
+
+        # memory does not add up across sites, so a few sites are as informative as a whole park
+        sites = [synthetic_data.synthetic_site(days = days, nvspl_hours = nvspl_hours, seed = seed + s)
+                 for s in range(min(n_sites, 3))]
+
+        for name, function in targets:
+            results = [measure_function(function, site, budgets.get(name, DEFAULT_BUDGET)) for site in sites]
+            worst = max(results, key=lambda r: (r["status"] == "error", r["ratio"] if r["ratio"] == r["ratio"] else -1))
+            records.append(dict(worst, scale=scale, function=name))
+
+    return pd.DataFrame(records).set_index(["scale", "function"]).sort_values("ratio", ascending=False)
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Check the peak memory of derivedDataFunctions and merge_SRCID against declared budgets.")
+    parser.add_argument("--scale", action="append", choices=sorted(SCALES), help="scale(s) to run; defaults to season")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--function", action="append", help="only measure these functions")
+    options = parser.parse_args()
+
+    report = run_memory_checks(options.scale or ["season"], options.seed, options.function)
+
+    with pd.option_context("display.width", 200, "display.max_colwidth", 60):
+        print(report.to_string())
+
+    sys.exit(1 if report.status.isin(["over budget", "error"]).any() else 0)
@@ -2,31 +2,35 @@ import pandas as pd
 import numpy as np
 import datetime as dt
 
+from arrow_backend import accepts_arrow
+from kernels import merge_groups
+from srcid_compact import compact_srcid, expand_srcid, is_compact
+
 def join_srcID_rows(df):
 
     '''
     Join a sequence of spectrogram annotations into a single annotation.
     '''
 
-    new_begin = df.head(1).index[0]
+    new_begin = df.index[0]
     new_length = df['len'].sum()
     new_srcID = df["srcID"].values[0]
     new_L = df['Hz_L'].min()
     new_U = df['Hz_U'].max()
-    new_MaxA = "{0:.01f}".format(df["MaxSPL"].max())
+    new_MaxA = float("{0:.01f}".format(df["MaxSPL"].max()))
 
-    new_user = df.head(1)["userName"].values[0]
-    new_tagdate = df.tail(1)["tagDate"][0]
+    new_user = df["userName"].iloc[0]
+    new_tagdate = df["tagDate"].iloc[-1]
 
     # because SEL values are already normalized you just logarithmically add them
     # this gives the total energy dose
-    new_SELA = "{0:.01f}".format(10*np.log10(np.power(10, df["SEL"]/10).sum()))
+    new_SELA = float("{0:.01f}".format(10*np.log10(np.power(10, df["SEL"]/10).sum())))
 
     # repeat for truncated values
     # older SRCID files do not have these values, resulting in a KeyError, so we exept those cases
     try:
-        new_MaxT = "{0:.01f}".format(df["MaxSPLt"].max())
-        new_SELT = "{0:.01f}".format(10*np.log10(np.power(10, df["SELt"]/10).sum()))
+        new_MaxT = float("{0:.01f}".format(df["MaxSPLt"].max()))
+        new_SELT = float("{0:.01f}".format(10*np.log10(np.power(10, df["SELt"]/10).sum())))
 
         joined = pd.DataFrame([new_length, new_srcID, new_L, new_U, new_MaxA, new_SELA, new_MaxT, new_SELT, new_user, new_tagdate], 
                      columns=[new_begin], index=df.columns[:-1]).T
@@ -38,16 +42,18 @@ def join_srcID_rows(df):
     return joined
 
 
+@accepts_arrow
 def merge_SRCID(src):
 
-    import pandas as pd
-    import datetime as dt
-
     '''
     Find SRCID annotations that break across hours, and join them to create a
     final, merged SRCID for more accurate calculations.
     '''
 
+    # a compact srcid (see srcid_compact.py) is merged in the soundDB layout and compacted again on the way out
+    if(is_compact(src)):
+        return compact_srcid(merge_SRCID(expand_srcid(src)))
+
     # these are only the events that end during the last second of the hour
     end_at_hour = src.loc[((src.index + src["len"]).dt.minute==59)&
                           ((src.index + src["len"]).dt.second==59)]
@@ -72,33 +78,17 @@ def merge_SRCID(src):
     cons = cons.drop_duplicates(keep="first") # frankly, it doesn't matter
 
 
-    # assign groups to each set of consecutive annotations 
+    # assign groups to each set of consecutive annotations
     # it's a huge benefit to group by source type first!
-    group = 1
-    for srcID, source_group in cons.groupby("srcID"):
-
-        for ts, annotation in source_group.sort_index().iterrows():
-
-            ends = ts + annotation["len"]
-
-            if((ts.minute!=0)&(ts.second!=0)&
-               (ends.minute==59)&(ends.second==59)):
-
-                group = group + 1
-                cons.loc[ts, "group"] = group
-
-            elif((ts.minute==0)&(ts.second==0)&
-               (ends.minute!=59)&(ends.second!=59)):
+    # (the state machine runs in kernels.merge_groups, compiled with Numba when it is installed)
+    ordered = cons.sort_index(kind="stable").sort_values("srcID", kind="stable")
+    ends = ordered.index + ordered["len"]
+    groups = merge_groups(pd.factorize(ordered["srcID"], sort=True)[0],
+                          ordered.index.minute, ordered.index.second,
+                          ends.dt.minute, ends.dt.second)
 
-                cons.loc[ts, "group"] = group
-                group = group + 1
-
-            else:
-                cons.loc[ts, "group"] = group
-
-        # at the end of the current source type, 
-        # "flush" the current group
-        group = group + 1
+    # groups are assigned by timestamp, so a timestamp shared by two sources takes the last group assigned to it
+    cons["group"] = pd.Series(groups, index=ordered.index).groupby(level=0).last().reindex(cons.index).to_numpy(dtype=float)
 
 
     frames = []
@@ -113,15 +103,33 @@ def merge_SRCID(src):
         else:
             frames.append(join_srcID_rows(pieces))
 
-    # here are all the joined data
-    merged_breaks = pd.concat(frames)
+    # here are all the joined data; each joined row was built as object-typed, so restore the column types
+    # (durations, codes, frequencies, annotations) before combining, rather than boxing every value of the result
+    merged_breaks = pd.concat(frames).infer_objects()
+    joined = cons.index
+
+    # the one-row frames of every group, and the views of cons taken while grouping, carry far more memory than
+    # their values, so let them go before the result is assembled
+    del frames, cons, ordered, matches_start, matches_end
 
     # # now that everything is neat and tidy, we can get the lines
     # # not representing true breaks
-    no_breaks = src.loc[~src.index.isin(cons.index)]
+    no_breaks = src.loc[~src.index.isin(joined)]
 
     # final SRCID file with events across hour breaks merged
     final_src = pd.concat([merged_breaks, no_breaks])
+
+    # release the unsorted pieces before sorting makes a second copy of the result
+    del merged_breaks, no_breaks
     final_src = final_src.sort_index()
 
-    return final_src
\ No newline at end of file
+    return final_src
+
+
+#------------------------------------------------------------------------------------------------------------------
+# ### OPT-IN PROFILING (set DDF_PROFILE=1 before import, see instrumentation.py)
+
+import os as _os
+if(_os.environ.get("DDF_PROFILE")):
+    import instrumentation
+    instrumentation.instrument_on_import(__name__)
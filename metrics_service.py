@@ -0,0 +1,402 @@
+import argparse
+import asyncio
+import datetime
+import functools
+import inspect
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import numpy as np
+
+from function_catalog import data_product
+from report_planner import FUNCTIONS, plan_report
+from srcid_compact import compact_srcid, is_compact
+
+#------------------------------------------------------------------------------------------------------------------
+# ### LOCAL METRICS SERVICE WITH WARM SITE CACHES
+#
+# Every notebook that reloads and re-indexes the same site files pays the same start-up cost.  This service loads
+# each site once and keeps it warm (srcid already in compact form), and answers derivedDataFunctions calls over
+# HTTP/JSON on localhost using only the standard library.  Alongside the data, each site keeps the report planner's
+# intermediates from earlier calls (source masks, parsed level columns, chronologically sorted event arrays, dailypa
+# row selections), so repeated and related queries skip them.  Requests are handled concurrently by asyncio; the
+# metric work runs in worker processes, and each site is always routed to the same worker, so it is loaded once and
+# evicted least-recently-used when a worker holds more than max_sites:
+#
+#     python metrics_service.py sites.json --port 8765 --processes 4
+#
+#     client = MetricsClient("http://127.0.0.1:8765")
+#     client.quantile_amplitude("DENAUWBT", 0.5, source = "air")          # the site name takes the place of the data
+#
+# sites.json maps site names to their data products, as in result_store.rebuild_report:
+# {"DENAUWBT": {"srcid": ".../SRCID_DENAUWBT.pkl", "dailypa": ".../DAILYPA_DENAUWBT.pkl"}}.  Files changed on disk
+# are reloaded on their next use.
+
+
+DEFAULT_PORT = 8765
+
+# the site cache of the current process (a worker, or the server itself when processes = 1)
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_settings = {"max_sites": 8, "load": pd.read_pickle}
+
+
+def _init_worker(max_sites, load):
+
+    _settings.update(max_sites=max_sites, load=load)
+    _cache.clear()
+
+
+def _stamps(products):
+
+    return {product: os.stat(path).st_mtime_ns for product, path in products.items()}
+
+
+def _site_data(site, products, product):
+
+    # load a site's products once, and again only when a file changes (which also drops its intermediates)
+    stamps = _stamps(products)
+    with _cache_lock:
+        entry = _cache.get(site)
+        if(entry is None or entry["products"] != products or entry["stamps"] != stamps):
+            entry = {"products": products, "stamps": stamps, "data": {}, "intermediates": {}, "lock": threading.Lock()}
+            _cache[site] = entry
+        _cache.move_to_end(site)
+
+        while(len(_cache) > _settings["max_sites"]):
+            _cache.popitem(last=False)
+
+    # files are read under the site's own lock, so a slow load holds up only the requests for that site
+    with entry["lock"]:
+        if(product not in entry["data"]):
+            data = _settings["load"](products[product])
+            if(product == "srcid" and isinstance(data, pd.DataFrame) and not is_compact(data)):
+                data = compact_srcid(data)
+            entry["data"][product] = data
+
+        return entry["data"][product], entry["intermediates"]
+
+
+def _evaluate(site, products, name, params):
+
+    function = FUNCTIONS[name]
+    product = data_product(function)
+    if(product not in products):
+        raise KeyError("site " + site + " has no " + product + " file")
+
+    # evaluated through the report planner, so masks, level columns, sorted events and dailypa rows computed for one
+    # call are kept with the site and reused by the next
+    data, intermediates = _site_data(site, products, product)
+    return encode(plan_report([(name, name, params)]).run({product: data}, threads = 1, cache = intermediates)[name])
+
+
+
+#------------------------------------------------------------------------------------------------------------------
+# ### JSON ENCODING OF RESULTS
+
+
+def encode(value):
+    """
+    A JSON-compatible form of a metric result, tagged so decode() restores pandas and datetime types.
+    """
+
+    if(isinstance(value, pd.DataFrame)):
+        return {"__frame__": {"columns": [encode(c) for c in value.columns], "index": [encode(i) for i in value.index],
+                              "data": [[encode(v) for v in row] for row in value.itertuples(index=False)]}}
+    if(isinstance(value, pd.Series)):
+        return {"__series__": {"name": encode(value.name), "index": [encode(i) for i in value.index],
+                               "data": [encode(v) for v in value.to_numpy()]}}
+    if(isinstance(value, pd.Timedelta)):
+        return {"__Timedelta__": value.total_seconds()}
+    if(isinstance(value, datetime.timedelta)):
+        return {"__timedelta__": value.total_seconds()}
+    if(isinstance(value, (pd.Timestamp, datetime.datetime, datetime.date))):
+        return {"__timestamp__": value.isoformat()}
+    if(isinstance(value, tuple)):
+        return {"__tuple__": [encode(v) for v in value]}
+    if(isinstance(value, (list, np.ndarray))):
+        return [encode(v) for v in value]
+    if(isinstance(value, np.generic)):
+        value = value.item()
+    if(isinstance(value, float) and value != value):
+        return {"__nan__": True}
+
+    return value
+
+
+def decode(value):
+    """
+    Restore a value produced by encode().
+    """
+
+    if(isinstance(value, list)):
+        return [decode(v) for v in value]
+    if(not isinstance(value, dict) or len(value) != 1):
+        return value
+
+    tag, content = next(iter(value.items()))
+    if(tag == "__frame__"):
+        return pd.DataFrame([decode(row) for row in content["data"]], index=decode(content["index"]), columns=decode(content["columns"]))
+    if(tag == "__series__"):
+        return pd.Series(decode(content["data"]), index=decode(content["index"]), name=decode(content["name"]), dtype=object).infer_objects()
+    if(tag == "__Timedelta__"):
+        return pd.Timedelta(seconds = content)
+    if(tag == "__timedelta__"):
+        return datetime.timedelta(seconds = content)
+    if(tag == "__timestamp__"):
+        return pd.Timestamp(content)
+    if(tag == "__tuple__"):
+        return tuple(decode(v) for v in content)
+    if(tag == "__nan__"):
+        return np.nan
+
+    return value
+
+
+
+#------------------------------------------------------------------------------------------------------------------
+# ### SERVER
+
+
+class MetricsService(object):
+    """
+    An asyncio HTTP/JSON server for derivedDataFunctions on a fixed set of sites.
+
+    Parameters
+    ----------
+    sites: dict of {site name: {product name: path}}.
+    processes: int, optional.  Worker processes; 1 computes in the server process (in a thread).  Defaults to the number of CPUs.
+    max_sites: int, optional.  Sites each worker keeps loaded.  Defaults to 8.
+    load: callable, optional.  Reads one data file; must be picklable when processes > 1.  Defaults to pandas.read_pickle.
+
+    Endpoints
+    ---------
+    GET /health, GET /sites, GET /functions, and POST /call with {"site": ..., "function": ..., "params": {...}}
+    """
+
+    def __init__(self, sites, processes = None, max_sites = 8, load = pd.read_pickle):
+
+        self.sites = {site: {product: os.path.abspath(os.path.expanduser(path)) for product, path in products.items()}
+                      for site, products in sites.items()}
+        self.processes = processes or os.cpu_count() or 1
+        self.max_sites = max_sites
+        self.load = load
+        self._workers = []
+
+    def _submit(self, site, name, params):
+
+        loop = asyncio.get_running_loop()
+        task = functools.partial(_evaluate, site, self.sites[site], name, params)
+
+        if(self.processes == 1):
+            return loop.run_in_executor(None, task)
+
+        # a stable hash, so a site always goes to the worker that already holds it
+        worker = self._workers[zlib.crc32(site.encode()) % len(self._workers)]
+        return loop.run_in_executor(worker, task)
+
+    async def _respond(self, method, path, body):
+
+        if(method == "GET" and path == "/health"):
+            return 200, {"status": "ok"}
+
+        if(method == "GET" and path == "/sites"):
+            return 200, {"sites": self.sites}
+
+        if(method == "GET" and path == "/functions"):
+            return 200, {name: list(inspect.signature(f).parameters) for name, f in FUNCTIONS.items()}
+
+        if(method == "POST" and path == "/call"):
+            try:
+                request = json.loads(body or b"{}")
+                site, name = request["site"], request["function"]
+                params = {k: decode(v) for k, v in request.get("params", {}).items()}
+            except (ValueError, KeyError, TypeError):
+                return 400, {"error": 'expected JSON {"site": ..., "function": ..., "params": {...}}'}
+
+            if(site not in self.sites):
+                return 404, {"error": "unknown site: " + str(site)}
+            if(name not in FUNCTIONS):
+                return 404, {"error": "unknown function: " + str(name)}
+
+            try:
+                return 200, {"result": await self._submit(site, name, params)}
+            except Exception as e:
+                return 500, {"error": type(e).__name__ + ": " + str(e)}
+
+        return 404, {"error": "no such endpoint: " + method + " " + path}
+
+    async def _handle(self, reader, writer):
+
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            headers = {}
+            while(True):
+                line = (await reader.readline()).decode("latin-1").strip()
+                if(not line):
+                    break
+                key, _, value = line.partition(":")
+                headers[key.strip().lower()] = value.strip()
+
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+            if(len(request_line) < 2):
+                status, payload = 400, {"error": "malformed request"}
+            else:
+                status, payload = await self._respond(request_line[0].upper(), request_line[1].split("?")[0], body)
+
+            data = json.dumps(payload).encode()
+            reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}[status]
+            writer.write(("HTTP/1.1 {0} {1}\r\nContent-Type: application/json\r\nContent-Length: {2}\r\nConnection: close\r\n\r\n"
+                          .format(status, reason, len(data))).encode() + data)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host = "127.0.0.1", port = DEFAULT_PORT, ready = None):
+        """
+        Run the server until cancelled.
+
+        Parameters
+        ----------
+        host: str, optional.  Defaults to localhost only.
+        port: int, optional.  Defaults to 8765; 0 picks a free port.
+        ready: callable, optional.  Called with the bound port once the server is listening.
+        """
+
+        if(self.processes > 1):
+            self._workers = [ProcessPoolExecutor(max_workers=1, initializer=_init_worker, initargs=(self.max_sites, self.load))
+                             for i in range(self.processes)]
+        else:
+            _init_worker(self.max_sites, self.load)
+
+        server = await asyncio.start_server(self._handle, host, port)
+        try:
+            if(ready is not None):
+                ready(server.sockets[0].getsockname()[1])
+            async with server:
+                await server.serve_forever()
+        finally:
+            for worker in self._workers:
+                worker.shutdown(cancel_futures=True)
+            self._workers = []
+
+    def run(self, host = "127.0.0.1", port = DEFAULT_PORT):
+        """
+        Run the server in the foreground until interrupted.
+        """
+
+        try:
+            asyncio.run(self.serve(host, port, ready=lambda p: print("serving {0} sites on http://{1}:{2}".format(len(self.sites), host, p))))
+        except KeyboardInterrupt:
+            pass
+
+
+
+#------------------------------------------------------------------------------------------------------------------
+# ### CLIENT
+
+
+class MetricsError(Exception):
+    """
+    An error reported by the metrics service.
+    """
+
+
+
+class MetricsClient(object):
+    """
+    A client whose methods mirror derivedDataFunctions, with a site name in place of the data argument:
+    client.quantile_amplitude("DENAUWBT", 0.5, source = "air") returns what quantile_amplitude(srcid, 0.5, source = "air") would.
+
+    Parameters
+    ----------
+    url: str, optional.  The service address.  Defaults to http://127.0.0.1:8765.
+    timeout: float, optional.  Seconds to wait for each call.  Defaults to 300.
+    """
+
+    def __init__(self, url = "http://127.0.0.1:" + str(DEFAULT_PORT), timeout = 300):
+
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+        for name, function in FUNCTIONS.items():
+            setattr(self, name, self._method(name, function))
+
+    def _request(self, path, payload = None):
+
+        data = None if payload is None else json.dumps(payload).encode()
+        request = urllib.request.Request(self.url + path, data=data, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise MetricsError(json.loads(e.read()).get("error", str(e)))
+
+    def _method(self, name, function):
+
+        signature = inspect.signature(function)
+        first = list(signature.parameters)[0]
+
+        def method(site, *args, **kwargs):
+            bound = signature.bind(site, *args, **kwargs)
+            params = {k: encode(v) for k, v in bound.arguments.items() if k != first}
+            return self.call(site, name, **params)
+
+        method.__name__ = name
+        method.__doc__ = function.__doc__
+        method.__signature__ = signature.replace(parameters=[inspect.Parameter("site", inspect.Parameter.POSITIONAL_OR_KEYWORD)] +
+                                                 list(signature.parameters.values())[1:])
+        return method
+
+    def call(self, site, function, **params):
+        """
+        Call a derivedDataFunctions function by name on a site.
+
+        Returns
+        -------
+        the function's result
+        """
+
+        return decode(self._request("/call", {"site": site, "function": function, "params": params})["result"])
+
+    def sites(self):
+        """
+        The sites the service knows, with their data files.
+
+        Returns
+        -------
+        dict
+        """
+
+        return self._request("/sites")["sites"]
+
+    def health(self):
+
+        return self._request("/health")
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Serve derivedDataFunctions metrics for a set of sites on localhost.")
+    parser.add_argument("sites", help='JSON file of {site: {"srcid": path, "dailypa": path, ...}}')
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--processes", type=int, default=None, help="worker processes; 1 computes in the server process")
+    parser.add_argument("--max-sites", type=int, default=8, help="sites each worker keeps loaded")
+    options = parser.parse_args()
+
+    with open(options.sites) as f:
+        sites = json.load(f)
+
+    MetricsService(sites, options.processes, options.max_sites).run(options.host, options.port)
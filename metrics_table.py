@@ -0,0 +1,194 @@
+import pandas as pd
+import numpy as np
+
+#------------------------------------------------------------------------------------------------------------------
+# ### CONSOLIDATED MULTI-SITE METRICS TABLE
+#
+# L90, Lnat, L50, L10, Leq, Ldn and percentTimeAbove each make one .loc lookup into one site's metrics object;
+# a park table (40 sites x 4 seasons x 2 weights x 7 metrics) means thousands of lookups and float formatting
+# round-trips.  metrics_table() flattens any number of metrics objects once into a long-form, sorted, indexed
+# table, and the accessors below return whole site x season matrices with one index selection each:
+#
+#     table = metrics_table({"DENAUWBT": metrics_UWBT, "DENATRLA": metrics_TRLA})
+#     metric_matrix(table, "L90")                                 # sites x seasons
+#     batch_metrics(table, weight="A")                            # (site, season) x [L90, Lnat, L50, L10, Leq, Ldn]
+
+
+INDEX = ["table", "site", "season", "weight", "period", "metric"]
+
+# derivedDataFunctions name: metric name in the flattened ambient table
+AMBIENT_METRICS = {"L90": "L090", "Lnat": "Lnat", "L50": "L050", "L10": "L010", "Leq": "Leq"}
+
+_WEIGHTS = {"A": "dBA", "T": "dBT"}
+
+# hours given the night-time adjustment in Ldn
+_NIGHT = ["00h", "01h", "02h", "03h", "04h", "05h", "06h", "22h", "23h"]
+
+
+def _flatten(data):
+
+    # soundDB metrics tables are Series with a MultiIndex, or frames with the last key as columns
+    if(isinstance(data, pd.DataFrame)):
+        data = data.stack()
+
+    return data
+
+
+def _frame(data, site, table, names):
+
+    series = _flatten(data)
+    keys = pd.DataFrame({name: series.index.get_level_values(i) for i, name in enumerate(names)})
+    keys["value"] = pd.to_numeric(pd.Series(series.to_numpy()), errors="coerce").to_numpy(dtype=float)
+    keys["table"] = table
+    keys["site"] = site
+
+    return keys
+
+
+
+def metrics_table(sites):
+    """
+    Flatten any number of soundDB metrics objects into one long-form table, sorted and indexed for batch lookups.
+
+    Parameters
+    ----------
+    sites: dict of {site name: metrics object}, each with .ambient, .hourlyMedian and .percentTimeAbove members.
+
+    Returns
+    -------
+    pandas DataFrame with a "value" column, indexed by (table, site, season, weight, period, metric).
+    table is "ambient", "hourlyMedian" or "percentTimeAbove"; period is "overall", "Day", "Night" or, for hourly values, "00h" to "23h";
+    metric is e.g. "L090" or "Leq", or the threshold ("35dB") for percentTimeAbove
+    """
+
+    frames = []
+    for site, metrics in sites.items():
+
+        frames.append(_frame(metrics.ambient.data, site, "ambient", ["season", "weight", "period", "metric"]))
+        frames.append(_frame(metrics.percentTimeAbove.data, site, "percentTimeAbove", ["season", "weight", "period", "metric"]))
+
+        hourly = _frame(metrics.hourlyMedian.data, site, "hourlyMedian", ["season", "weight", "metric", "period"])
+        hourly["period"] = [str(h).zfill(2) + "h" for h in hourly["period"]]
+        frames.append(hourly)
+
+    table = pd.concat(frames, ignore_index=True)
+    for column in INDEX:
+        table[column] = table[column].astype(str)
+
+    return table.set_index(INDEX)[["value"]].sort_index()
+
+
+def _select(table, name, metric, weight, period):
+
+    # one sorted-index slice per call, then a single reshape into sites x seasons
+    w = _WEIGHTS[weight.upper()]
+    rows = table.loc[(name, slice(None), slice(None), w, period, metric), "value"]
+
+    return rows.droplevel(["table", "weight", "period", "metric"])
+
+
+
+def metric_matrix(table, metric, weight = "A", period = "overall"):
+    """
+    One ambient metric for every site and season.
+
+    Parameters
+    ----------
+    table: pandas DataFrame from metrics_table().
+    metric: str, "L90", "Lnat", "L50", "L10" or "Leq" (or the raw names "L090", "L050", "L010").
+    weight: str, optional.  The acoustic weighting, either "A" or "T". Defaults to "A" if unspecified.
+    period: str, optional.  "overall", "Day" or "Night".  Defaults to "overall".
+
+    Returns
+    -------
+    pandas DataFrame of floats, sites x seasons
+    """
+
+    rows = _select(table, "ambient", AMBIENT_METRICS.get(metric, metric), weight, period)
+
+    return rows.unstack("season")
+
+
+
+def percent_time_above_matrix(table, threshold, weight = "A", period = "overall"):
+    """
+    The percent time above a threshold for every site and season.
+
+    Parameters
+    ----------
+    table: pandas DataFrame from metrics_table().
+    threshold: int. The SPL threshold: 35, 45, 52, or 60 dB.
+    weight: str, optional.  The acoustic weighting, either "A" or "T". Defaults to "A" if unspecified.
+    period: str, optional.  "overall", "Day" or "Night".  Defaults to "overall".
+
+    Returns
+    -------
+    pandas DataFrame of floats, sites x seasons
+    """
+
+    if threshold not in [35, 45, 52, 60]:
+        raise ValueError("Percent time above threshold must be either 35, 45, 52, or 60 dB.  Please choose another value.")
+
+    return _select(table, "percentTimeAbove", str(threshold) + "dB", weight, period).unstack("season")
+
+
+
+def Ldn_matrix(table, weight = "A"):
+    """
+    The day-night level for every site and season, computed from the hourly Leq exactly as derivedDataFunctions.Ldn does,
+    in one vectorized pass over all sites and seasons.
+
+    Parameters
+    ----------
+    table: pandas DataFrame from metrics_table().
+    weight: str, optional.  The acoustic weighting, either "A" or "T". Defaults to "A" if unspecified.
+
+    Returns
+    -------
+    pandas DataFrame of floats, sites x seasons
+    """
+
+    w = _WEIGHTS[weight.upper()]
+    hourly = table.loc[("hourlyMedian", slice(None), slice(None), w, slice(None), "Leq"), "value"]
+
+    # the same 10 dB night-time adjustment and energetic sum as Ldn(), applied to every row at once
+    night = hourly.index.get_level_values("period").isin(_NIGHT)
+    energy = np.power(10, (hourly.to_numpy() - 10*night)/10)
+
+    keys = [hourly.index.get_level_values("site"), hourly.index.get_level_values("season")]
+    Ldn = 10*np.log10(pd.Series(energy).groupby(keys).sum())
+    Ldn.index.names = ["site", "season"]
+
+    return Ldn.unstack("season")
+
+
+
+def batch_metrics(table, metrics = ("L90", "Lnat", "L50", "L10", "Leq", "Ldn"), weight = "A", period = "overall", thresholds = ()):
+    """
+    Several metrics for every site and season in one table, rounded as the single-site functions round them.
+
+    Parameters
+    ----------
+    table: pandas DataFrame from metrics_table().
+    metrics: list of str, optional.  Names from "L90", "Lnat", "L50", "L10", "Leq" and "Ldn".  Defaults to all six.
+    weight: str, optional.  The acoustic weighting, either "A" or "T". Defaults to "A" if unspecified.
+    period: str, optional.  "overall", "Day" or "Night" for the ambient metrics.  Defaults to "overall".
+    thresholds: list of int, optional.  Add a "percentTimeAbove<threshold>" column for each, e.g. [35, 52].
+
+    Returns
+    -------
+    pandas DataFrame indexed by (site, season), one column per metric
+    """
+
+    columns = {}
+    for metric in metrics:
+        matrix = Ldn_matrix(table, weight) if metric == "Ldn" else metric_matrix(table, metric, weight, period)
+        columns[metric] = matrix.stack().round(1)
+
+    for threshold in thresholds:
+        columns["percentTimeAbove" + str(threshold)] = percent_time_above_matrix(table, threshold, weight, period).stack().round(2)
+
+    out = pd.DataFrame(columns)
+    out.index.names = ["site", "season"]
+
+    return out
@@ -0,0 +1,455 @@
+import json
+import os
+
+import pandas as pd
+import numpy as np
+
+from arrow_backend import column_names, column_values, nvspl_times
+from srcid_compact import source_mask, srcid_durations_s, srcid_starts_ns
+from weighting import NVSPL_BANDS
+
+#------------------------------------------------------------------------------------------------------------------
+# ### MEMORY-MAPPED NVSPL STORE WITH A CONSTANT-TIME TIME-TO-ROW INDEX
+#
+# Reading "the NVSPL seconds around this event" used to mean parsing whole hourly files.  A store holds one site's
+# levels as a single row-major (seconds x bands) memory-mapped array, either fixed-point int16 in 0.1 dB steps
+# (lossless for NVSPL, half the size of float32) or float32, with gaps simply absent.  Alongside it:
+#
+#     hours-<rows>.npy   int64, the row at which each hour since the first one begins (cumulative row counts)
+#     seconds.dat        int16, the second of the hour of every stored row
+#     meta.json          bands, dtype and row count, replaced atomically as the last step of every append
+#
+# A timestamp maps to its row with arithmetic alone when its hour is complete (3600 rows) or empty, and with a
+# binary search over at most 3600 entries when the hour is partial, so lookups never depend on the size of the
+# store.  Time-range slices of the raw array are zero-copy views:
+#
+#     store = write_nvspl_store(hourly_frames, "DENAUWBT_store")
+#     store.raw("2019-06-01 07:00", "2019-06-01 08:00")          # view of int16 codes, rows x bands
+#     store.frame("2019-06-01 07:00", "2019-06-01 08:00")        # decoded to dB, in the NVSPL layout
+#     store.Lx(90)                                                # every band, years of data, in bounded memory
+
+
+_META = "meta.json"
+_LEVELS = "levels.dat"
+_SECONDS = "seconds.dat"
+_HOURS = "hours.npy"          # the hour table of stores written before it was named by row count
+
+# the int16 code stored for a missing level, decoded to NaN by every reader
+NODATA = np.iinfo(np.int16).min
+_SECOND_NS = 10**9
+_HOUR_NS = 3600*_SECOND_NS
+
+_LEVEL_COLUMNS = NVSPL_BANDS + ["dbA"]
+
+
+
+def _hours_file(rows):
+
+    return "hours-" + str(rows) + ".npy"
+
+
+def _write_meta(path, meta):
+
+    # write then rename, so readers never see a partly written meta.json
+    temporary = os.path.join(path, _META + ".tmp")
+    with open(temporary, "w") as f:
+        json.dump(meta, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, os.path.join(path, _META))
+
+
+
+class NVSPLStore(object):
+    """
+    A read-only view of an NVSPL store on disk, created by write_nvspl_store() or NVSPLStore.create().
+
+    Parameters
+    ----------
+    path: str, the store directory.
+
+    Attributes
+    ----------
+    bands: list of str, the stored columns, in order.
+    dtype: numpy dtype, int16 (0.1 dB fixed point) or float32.
+    rows: int, the number of stored seconds.
+    start: pandas Timestamp, the start of the first stored hour.
+    """
+
+    def __init__(self, path):
+
+        self.path = path
+        self._load()
+
+    @classmethod
+    def create(cls, path, bands = None, dtype = "int16"):
+        """
+        Create an empty store.
+
+        Parameters
+        ----------
+        path: str, the store directory (created if needed; must not already hold a store).
+        bands: list of str, optional.  The columns to store.  Defaults to every one-third-octave band and dbA.
+        dtype: str, optional.  "int16" for 0.1 dB fixed point or "float32".  Defaults to "int16".
+
+        Returns
+        -------
+        NVSPLStore
+        """
+
+        if(np.dtype(dtype) not in [np.dtype("int16"), np.dtype("float32")]):
+            raise ValueError('dtype must be either "int16" or "float32"')
+        if(os.path.exists(os.path.join(path, _META))):
+            raise ValueError("an NVSPL store already exists at " + path)
+
+        os.makedirs(path, exist_ok=True)
+        meta = {"bands": list(_LEVEL_COLUMNS if bands is None else bands), "dtype": np.dtype(dtype).name,
+                "scale": 0.1 if np.dtype(dtype) == np.int16 else 1.0, "t0": None, "rows": 0, "hours": _hours_file(0)}
+
+        open(os.path.join(path, _LEVELS), "wb").close()
+        open(os.path.join(path, _SECONDS), "wb").close()
+        np.save(os.path.join(path, _hours_file(0)), np.zeros(1, dtype=np.int64))
+        _write_meta(path, meta)
+
+        return cls(path)
+
+    def _load(self):
+
+        with open(os.path.join(self.path, _META)) as f:
+            meta = json.load(f)
+
+        self.bands = meta["bands"]
+        self.dtype = np.dtype(meta["dtype"])
+        self.scale = meta["scale"]
+        self.rows = meta["rows"]
+        self._t0 = meta["t0"]
+        self.start = None if self._t0 is None else pd.Timestamp(self._t0)
+
+        self._hour_row = np.load(os.path.join(self.path, meta.get("hours", _HOURS)))
+        self.hours = len(self._hour_row) - 1
+
+        # an empty file cannot be mapped
+        if(self.rows):
+            self._levels = np.memmap(os.path.join(self.path, _LEVELS), dtype=self.dtype, mode="r", shape=(self.rows, len(self.bands)))
+            self._seconds = np.memmap(os.path.join(self.path, _SECONDS), dtype=np.int16, mode="r", shape=(self.rows,))
+        else:
+            self._levels = np.empty((0, len(self.bands)), dtype=self.dtype)
+            self._seconds = np.empty(0, dtype=np.int16)
+
+    def __len__(self):
+
+        return self.rows
+
+    def __repr__(self):
+
+        end = None if self._t0 is None else self.start + pd.Timedelta(hours=self.hours)
+        return "NVSPLStore(" + repr(self.path) + ", " + str(self.rows) + " seconds, " + str(self.start) + " to " + str(end) + ")"
+
+
+    def append(self, nvspl):
+        """
+        Append NVSPL data recorded after everything already in the store.  Timestamps are floored to the second;
+        repeated seconds keep their first row.
+
+        Parameters
+        ----------
+        nvspl: pandas dataframe representing NPS NSNSD NVSPL file, formatted by soundDB library.  May also be ArrowDtype-backed or a pyarrow Table.
+        """
+
+        missing = [b for b in self.bands if b not in set(column_names(nvspl))]
+        if(missing):
+            raise ValueError("the NVSPL is missing stored bands: " + ", ".join(missing))
+
+        times = nvspl_times(nvspl).to_numpy(dtype="datetime64[ns]").view(np.int64)//_SECOND_NS*_SECOND_NS
+        if(len(times) == 0):
+            return
+
+        order = np.argsort(times, kind="stable")
+        keep = np.ones(len(order), dtype=bool)
+        keep[1:] = np.diff(times[order]) > 0
+        order = order[keep]
+        times = times[order]
+
+        if(self._t0 is None):
+            self._t0 = int(times[0]//_HOUR_NS*_HOUR_NS)
+        elif(self.rows and times[0] <= self._last_ns()):
+            raise ValueError("NVSPL data must be appended in time order, after " + str(pd.Timestamp(self._last_ns())))
+        elif(times[0] < self._t0):
+            raise ValueError("NVSPL data must be appended in time order, after " + str(self.start))
+
+        offset = times - self._t0
+        hour = offset//_HOUR_NS
+        second = (offset - hour*_HOUR_NS)//_SECOND_NS
+
+        # encode band by band into one row-major block
+        block = np.empty((len(times), len(self.bands)), dtype=self.dtype)
+        for j, band in enumerate(self.bands):
+            values = np.asarray(column_values(nvspl, band), dtype=float)[order]
+            if(self.dtype == np.int16):
+                block[:, j] = np.where(np.isnan(values), NODATA, np.round(values/self.scale))
+            else:
+                block[:, j] = values
+
+        # meta.json is the commit point: rows written by an append that failed before replacing it are cut off first,
+        # and the new hour table goes to a file of its own, so until the commit the store reads exactly as before
+        self._levels = self._seconds = None
+        for name, width in [(_LEVELS, len(self.bands)*self.dtype.itemsize), (_SECONDS, 2)]:
+            with open(os.path.join(self.path, name), "r+b") as f:
+                f.truncate(self.rows*width)
+                f.seek(0, os.SEEK_END)
+                (block if name == _LEVELS else second.astype(np.int16)).tofile(f)
+
+        # extend the cumulative hour table to cover the new rows
+        hours = max(self.hours, int(hour[-1]) + 1)
+        counts = np.diff(self._hour_row)
+        counts = np.concatenate([counts, np.zeros(hours - len(counts), dtype=np.int64)])
+        counts += np.bincount(hour, minlength=hours)
+        rows = self.rows + len(times)
+        np.save(os.path.join(self.path, _hours_file(rows)), np.concatenate([[0], np.cumsum(counts)]))
+
+        _write_meta(self.path, {"bands": self.bands, "dtype": self.dtype.name, "scale": self.scale,
+                                "t0": self._t0, "rows": rows, "hours": _hours_file(rows)})
+
+        # hour tables of earlier commits, and of appends that never committed
+        for name in os.listdir(self.path):
+            if(name.startswith("hours") and name.endswith(".npy") and name != _hours_file(rows)):
+                os.remove(os.path.join(self.path, name))
+
+        self._load()
+
+    def _last_ns(self):
+
+        hour = int(np.searchsorted(self._hour_row, self.rows - 1, side="right")) - 1
+        return self._t0 + hour*_HOUR_NS + int(self._seconds[self.rows - 1])*_SECOND_NS
+
+
+    def positions(self, times):
+        """
+        The first row at or after each timestamp, in constant time per timestamp; len(store) for times after the last row.
+
+        Parameters
+        ----------
+        times: timestamp(s), as anything pandas.to_datetime accepts.
+
+        Returns
+        -------
+        numpy array of int64 row offsets
+        """
+
+        t = pd.to_datetime(np.atleast_1d(times)).to_numpy(dtype="datetime64[ns]").view(np.int64)
+        if(self._t0 is None):
+            return np.zeros(len(t), dtype=np.int64)
+
+        offset = t - self._t0
+        hour = np.clip(offset//_HOUR_NS, 0, self.hours)
+
+        # the first whole second at or after t, within its hour (3600 means the next hour)
+        second = np.clip(-((hour*_HOUR_NS - offset)//_SECOND_NS), 0, 3600)
+
+        base = self._hour_row[np.minimum(hour, self.hours - 1)] if self.hours else np.zeros(len(t), dtype=np.int64)
+        count = self._hour_row[np.minimum(hour + 1, self.hours)] - base
+        out = base + np.minimum(second, count)
+        out[hour >= self.hours] = self.rows
+
+        # partial hours: a bounded search among that hour's stored seconds
+        for i in np.flatnonzero((hour < self.hours) & (count > 0) & (count < 3600)):
+            out[i] = base[i] + np.searchsorted(self._seconds[base[i]:base[i] + count[i]], second[i])
+
+        return out
+
+    def row(self, t):
+        """
+        The row holding the second at t, or -1 if the store has no sample then.
+
+        Returns
+        -------
+        int
+        """
+
+        position = int(self.positions(t)[0])
+        if(position >= self.rows or self.times(position, position + 1)[0] != pd.Timestamp(t)):
+            return -1
+
+        return position
+
+    def _rows(self, start, end):
+
+        lo = 0 if start is None else int(self.positions(start)[0])
+        hi = self.rows if end is None else int(self.positions(end)[0])
+
+        return lo, max(lo, hi)
+
+    def times(self, lo = 0, hi = None):
+        """
+        The timestamps of rows lo to hi.
+
+        Returns
+        -------
+        pandas DatetimeIndex
+        """
+
+        hi = self.rows if hi is None else hi
+        rows = np.arange(lo, hi)
+        hour = np.searchsorted(self._hour_row, rows, side="right") - 1
+
+        return pd.DatetimeIndex((self._t0 + hour*_HOUR_NS + self._seconds[lo:hi].astype(np.int64)*_SECOND_NS).view("datetime64[ns]"))
+
+
+    def raw(self, start = None, end = None):
+        """
+        A zero-copy view of the stored values (int16 codes in 0.1 dB, or float32 dB) for start <= time < end.
+
+        Returns
+        -------
+        numpy array shaped (seconds, bands), read-only
+        """
+
+        lo, hi = self._rows(start, end)
+        return self._levels[lo:hi]
+
+    def values(self, start = None, end = None, bands = None):
+        """
+        Levels in dB for start <= time < end, decoded to float64 with NaN where nothing was recorded.
+
+        Returns
+        -------
+        numpy array shaped (seconds, bands)
+        """
+
+        columns = [self.bands.index(b) for b in (self.bands if bands is None else bands)]
+        raw = self.raw(start, end)[:, columns]
+
+        if(self.dtype == np.int16):
+            return np.where(raw == NODATA, np.nan, raw*self.scale)
+
+        return raw.astype(np.float64)
+
+    def frame(self, start = None, end = None, bands = None):
+        """
+        Levels for start <= time < end as an NVSPL-layout dataframe, accepted by Lx, weighted_level and the other NVSPL functions.
+
+        Returns
+        -------
+        pandas DataFrame indexed by time, one column per band
+        """
+
+        lo, hi = self._rows(start, end)
+        bands = self.bands if bands is None else list(bands)
+
+        return pd.DataFrame(self.values(start, end, bands), index=self.times(lo, hi), columns=bands)
+
+
+    def Lx(self, x, start = None, end = None, bands = None, chunk_rows = 1000000):
+        """
+        Exceedance levels for start <= time < end, equal to np.nanquantile on the decoded levels.
+        An int16 store is counted into one 0.1 dB histogram per band, chunk by chunk, so memory does not grow with the range.
+
+        Parameters
+        ----------
+        x: float, the exceedance level = (100 - percentile), such that x = 10 is the 90th percentile.
+        start, end: timestamps, optional.  Defaults to the whole store.
+        bands: list of str, optional.  Defaults to every stored band.
+        chunk_rows: int, optional.  Rows decoded at a time.  Defaults to 1,000,000.
+
+        Returns
+        -------
+        pandas Series indexed by band, named "L<x>"
+        """
+
+        bands = self.bands if bands is None else list(bands)
+        q = (100 - x)/100
+
+        if(self.dtype != np.int16):
+            values = self.values(start, end, bands)
+            with np.errstate(all="ignore"):
+                return pd.Series(np.nanquantile(values, q, axis=0) if len(values) else np.nan, index=bands, name="L" + str(x))
+
+        lo, hi = self._rows(start, end)
+        columns = [self.bands.index(b) for b in bands]
+
+        counts = np.zeros((len(bands), 65536), dtype=np.int64)
+        for first in range(lo, hi, chunk_rows):
+            chunk = self._levels[first:min(first + chunk_rows, hi)]
+            for k, j in enumerate(columns):
+                counts[k] += np.bincount(chunk[:, j].astype(np.int64) + 32768, minlength=65536)
+        counts[:, NODATA + 32768] = 0
+
+        out = np.full(len(bands), np.nan)
+        for k in range(len(bands)):
+            cumulative = np.cumsum(counts[k])
+            n = cumulative[-1]
+            if(n == 0):
+                continue
+
+            # the values at the ranks either side of the quantile position, interpolated linearly
+            position = (n - 1)*q
+            below = int(np.floor(position))
+            lower = np.searchsorted(cumulative, below, side="right") - 32768
+            upper = np.searchsorted(cumulative, min(below + 1, n - 1), side="right") - 32768
+            out[k] = (lower + (upper - lower)*(position - below))*self.scale
+
+        return pd.Series(out, index=bands, name="L" + str(x))
+
+
+    def event_SEL(self, srcid, band = "dbA", source = "all"):
+        """
+        Recompute each SRCID event's sound exposure level from the stored one-second levels: the energetic sum over
+        the seconds from the event start to start + len.
+
+        Parameters
+        ----------
+        srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
+        band: str, optional.  The stored column to integrate.  Defaults to "dbA".
+        source: str or list of floats, optional.  Which subset of srcid codes to recompute - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
+
+        Returns
+        -------
+        pandas Series of SEL in dB, indexed by event start; NaN where the store has no samples for the event
+        """
+
+        mask = source_mask(srcid, source)
+        starts = srcid_starts_ns(srcid)[mask]
+        ends = starts + np.round(srcid_durations_s(srcid)[mask]*1e9).astype("int64")
+
+        lo = self.positions(starts.view("datetime64[ns]"))
+        hi = self.positions(ends.view("datetime64[ns]"))
+        j = self.bands.index(band)
+
+        SEL = np.full(len(starts), np.nan)
+        for i in np.flatnonzero(hi > lo):
+            column = self._levels[lo[i]:hi[i], j]
+            levels = np.where(column == NODATA, np.nan, column*self.scale) if self.dtype == np.int16 else column.astype(np.float64)
+            energy = np.nansum(np.power(10, levels/10))
+            if(energy > 0):
+                SEL[i] = np.round(10*np.log10(energy), 1)
+
+        return pd.Series(SEL, index=pd.DatetimeIndex(starts.view("datetime64[ns]"), name=srcid.index.name), name="SEL_" + band)
+
+
+
+def write_nvspl_store(nvspl, path, bands = None, dtype = "int16"):
+    """
+    Write NVSPL data into a new store, or append to an existing one.
+
+    Parameters
+    ----------
+    nvspl: pandas dataframe representing NPS NSNSD NVSPL file, formatted by soundDB library, or a chronological iterable of them (e.g. hourly files).
+    path: str, the store directory.
+    bands: list of str, optional.  For a new store, the columns to keep.  Defaults to every band and dbA present in the first NVSPL.
+    dtype: str, optional.  For a new store, "int16" for 0.1 dB fixed point or "float32".  Defaults to "int16".
+
+    Returns
+    -------
+    NVSPLStore
+    """
+
+    frames = [nvspl] if isinstance(nvspl, pd.DataFrame) or hasattr(nvspl, "column_names") else nvspl
+
+    store = NVSPLStore(path) if os.path.exists(os.path.join(path, _META)) else None
+    for frame in frames:
+        if(store is None):
+            present = set(column_names(frame))
+            store = NVSPLStore.create(path, [b for b in (_LEVEL_COLUMNS if bands is None else bands) if b in present], dtype)
+        store.append(frame)
+
+    return store
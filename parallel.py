@@ -0,0 +1,282 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import pandas as pd
+import numpy as np
+
+from arrow_backend import column_names, column_values
+from weighting import NVSPL_BANDS, _energy_sum, weighting_vector
+
+#------------------------------------------------------------------------------------------------------------------
+# ### SHARED-MEMORY PARALLEL EXECUTION FOR BAND-WISE NVSPL COMPUTATIONS
+#
+# Exceedance levels, level histograms and weighting recomputation are independent across bands and time chunks,
+# but pickling an 8M-row NVSPL to every worker costs more than the work itself.  Instead the band matrix is
+# copied once into multiprocessing.shared_memory; worker processes attach a zero-copy numpy view when they
+# start, compute partial results per band or per row chunk, and only those small partials travel back to
+# the parent to be reduced:
+#
+#     with SharedBands(nvspl) as shared:
+#         L90 = parallel_Lx(shared, 90)
+#         counts = parallel_histograms(shared)
+
+
+_LEVEL_COLUMNS = NVSPL_BANDS + ["dbA"]
+
+# the worker's view of the shared matrix, attached once per process by _attach()
+_worker = {}
+
+
+
+class SharedBands(object):
+    """
+    The NVSPL band levels, band-major, in a shared memory block that worker processes can view without copying.
+    Use as a context manager, or call close() to release the block.
+
+    Parameters
+    ----------
+    nvspl: pandas dataframe representing NPS NSNSD NVSPL file, formatted by soundDB library.  May also be ArrowDtype-backed or a pyarrow Table.
+    bands: list of str, optional.  The columns to share.  Defaults to every band (and dbA) present in the NVSPL.
+    dtype: numpy dtype, optional.  float64 (the default) keeps results identical to the serial functions; float32 halves the memory.
+    """
+
+    def __init__(self, nvspl, bands = None, dtype = np.float64):
+
+        present = set(column_names(nvspl))
+        self.bands = [b for b in (_LEVEL_COLUMNS if bands is None else bands) if b in present]
+        if(not self.bands):
+            raise ValueError("none of the requested bands are in the NVSPL")
+
+        rows = len(column_values(nvspl, self.bands[0]))
+        self.dtype = np.dtype(dtype)
+        self._shm = shared_memory.SharedMemory(create=True, size=max(len(self.bands)*rows*self.dtype.itemsize, 1))
+        self.matrix = np.ndarray((len(self.bands), rows), dtype=self.dtype, buffer=self._shm.buf)
+
+        for j, band in enumerate(self.bands):
+            self.matrix[j] = column_values(nvspl, band)
+
+    @property
+    def spec(self):
+        """
+        What a worker needs to attach: (block name, shape, dtype string, band names).
+        """
+
+        return (self._shm.name, self.matrix.shape, self.dtype.str, self.bands)
+
+    def close(self):
+
+        if(self._shm is not None):
+            self.matrix = None
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+
+def _attach(spec, output = None):
+
+    # runs once in every worker process: view the shared blocks, never copy them
+    name, shape, dtype, bands = spec
+    _worker["shm"] = shared_memory.SharedMemory(name=name)
+    _worker["matrix"] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=_worker["shm"].buf)
+    _worker["bands"] = bands
+
+    if(output is not None):
+        _worker["out_shm"] = shared_memory.SharedMemory(name=output[0])
+        _worker["out"] = np.ndarray(output[1], dtype=np.dtype(output[2]), buffer=_worker["out_shm"].buf)
+
+
+def _run(shared, tasks, function, processes, output = None):
+
+    # in-process when one worker is asked for, so the serial and parallel paths run the same code
+    if(processes == 1):
+        _worker.update(matrix=shared.matrix, bands=shared.bands, out=output[3] if output else None)
+        try:
+            return [function(*task) for task in tasks]
+        finally:
+            _worker.clear()
+
+    with ProcessPoolExecutor(max_workers=processes, initializer=_attach,
+                             initargs=(shared.spec, output[:3] if output else None)) as pool:
+        return list(pool.map(function, *zip(*tasks))) if tasks else []
+
+
+def _processes(processes):
+    return processes or os.cpu_count() or 1
+
+
+def _row_chunks(rows, processes, chunk_rows):
+
+    # several chunks per worker so a slow chunk does not hold up the whole pool
+    size = chunk_rows or max(-(-rows//(4*processes)), 100000)
+
+    return [(start, min(start + size, rows)) for start in range(0, rows, size)]
+
+
+def _shared(nvspl, bands = None):
+
+    # accept either an open SharedBands (reused across calls) or an NVSPL to share for this call only
+    if(isinstance(nvspl, SharedBands)):
+        return nvspl, False
+
+    return SharedBands(nvspl, bands), True
+
+
+
+#------------------------------------------------------------------------------------------------------------------
+# ### EXCEEDANCE LEVELS, ONE TASK PER BAND
+
+
+def _band_quantile(j, q):
+    return float(np.nanquantile(_worker["matrix"][j], q))
+
+
+def parallel_Lx(nvspl, x, processes = None):
+    """
+    The exceedance level Lx of every band, one band per worker task.  Matches Lx(nvspl, x, dBA_only=False).
+
+    Parameters
+    ----------
+    nvspl: an NVSPL (see SharedBands), or an open SharedBands to reuse across calls.
+    x: float, the exceedance level = (100 - percentile), such that x = 10 is the 90th percentile.
+    processes: int, optional.  Worker processes.  Defaults to the number of CPUs.
+
+    Returns
+    -------
+    pandas DataFrame with one column "L<x>", indexed by band
+    """
+
+    shared, owned = _shared(nvspl)
+    try:
+        q = (100 - x)/100
+        values = _run(shared, [(j, q) for j in range(len(shared.bands))], _band_quantile, _processes(processes))
+    finally:
+        if(owned):
+            shared.close()
+
+    return pd.DataFrame({"L" + str(x): values}, index=shared.bands)
+
+
+
+#------------------------------------------------------------------------------------------------------------------
+# ### LEVEL HISTOGRAMS, ONE TASK PER ROW CHUNK
+
+
+def _chunk_histogram(start, stop, low, resolution, bins):
+
+    block = _worker["matrix"][:, start:stop]
+    counts = np.zeros((block.shape[0], bins), dtype=np.int64)
+
+    for j in range(block.shape[0]):
+        values = block[j][~np.isnan(block[j])]
+        keys = np.clip(np.round((values - low)/resolution).astype(np.int64), 0, bins - 1)
+        counts[j] = np.bincount(keys, minlength=bins)
+
+    return counts
+
+
+def parallel_histograms(nvspl, low = -10., high = 130., resolution = 0.1, processes = None, chunk_rows = None):
+    """
+    Histogram the levels of every band, each worker counting a chunk of rows; the parent sums the partial counts.
+    Levels outside [low, high] are counted in the first or last bin.
+
+    Parameters
+    ----------
+    nvspl: an NVSPL (see SharedBands), or an open SharedBands to reuse across calls.
+    low, high: float, optional.  The level range in dB.  Defaults to -10 to 130 dB.
+    resolution: float, optional.  The bin width in dB.  Defaults to 0.1 dB, the NVSPL resolution.
+    processes: int, optional.  Worker processes.  Defaults to the number of CPUs.
+    chunk_rows: int, optional.  Rows per task.  Defaults to about four tasks per worker.
+
+    Returns
+    -------
+    pandas DataFrame of counts indexed by level (bin centre, dB) with one column per band
+    """
+
+    bins = int(round((high - low)/resolution)) + 1
+    processes = _processes(processes)
+
+    shared, owned = _shared(nvspl)
+    try:
+        tasks = [(start, stop, low, resolution, bins) for start, stop in _row_chunks(shared.matrix.shape[1], processes, chunk_rows)]
+        counts = sum(_run(shared, tasks, _chunk_histogram, processes), np.zeros((len(shared.bands), bins), dtype=np.int64))
+    finally:
+        if(owned):
+            shared.close()
+
+    levels = np.round(low + np.arange(bins)*resolution, 6)
+
+    return pd.DataFrame(counts.T, index=pd.Index(levels, name="level"), columns=shared.bands)
+
+
+
+#------------------------------------------------------------------------------------------------------------------
+# ### WEIGHTING RECOMPUTATION, ONE TASK PER ROW CHUNK, WRITTEN INTO A SHARED OUTPUT
+
+
+def _chunk_weighted_level(start, stop, rows, offsets):
+
+    matrix = _worker["matrix"]
+    _energy_sum([matrix[j, start:stop] for j in rows], offsets, _worker["out"][start:stop])
+
+    return stop - start
+
+
+def parallel_weighted_level(nvspl, weighting = "A", bands = None, processes = None, chunk_rows = None):
+    """
+    Recompute a broadband level from the one-third-octave bands with any weighting, each worker writing a chunk
+    of rows straight into a shared output array.  Matches weighting.weighted_level().
+
+    Parameters
+    ----------
+    nvspl: an NVSPL (see SharedBands), or an open SharedBands to reuse across calls.
+    weighting: str, dict or array-like, optional.  "A", "C", "Z" or a custom weighting, see weighting.weighting_vector().  Defaults to "A".
+    bands: list of str or (low Hz, high Hz) tuple, optional.  Restrict the sum to these bands.
+    processes: int, optional.  Worker processes.  Defaults to the number of CPUs.
+    chunk_rows: int, optional.  Rows per task.  Defaults to about four tasks per worker.
+
+    Returns
+    -------
+    numpy array of float32 broadband levels, one per NVSPL row
+    """
+
+    processes = _processes(processes)
+    shared, owned = _shared(nvspl)
+    try:
+        vector = weighting_vector(weighting, bands)
+        present = [b for b in vector.index if b in shared.bands]
+        if(not present):
+            raise ValueError("none of the requested bands are in the NVSPL")
+
+        rows = [shared.bands.index(b) for b in present]
+        offsets = vector[present].to_numpy(dtype=np.float32)
+
+        n = shared.matrix.shape[1]
+        out_shm = shared_memory.SharedMemory(create=True, size=max(4*n, 1))
+        try:
+            out = np.ndarray((n,), dtype=np.float32, buffer=out_shm.buf)
+            tasks = [(start, stop, rows, offsets) for start, stop in _row_chunks(n, processes, chunk_rows)]
+            _run(shared, tasks, _chunk_weighted_level, processes, (out_shm.name, (n,), "<f4", out))
+            result = out.copy()
+            del out
+        finally:
+            out_shm.close()
+            out_shm.unlink()
+    finally:
+        if(owned):
+            shared.close()
+
+    return result
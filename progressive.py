@@ -0,0 +1,309 @@
+from statistics import NormalDist
+
+import pandas as pd
+import numpy as np
+
+from arrow_backend import column_names, column_values
+from nvspl_store import NVSPLStore, NODATA
+from weighting import NVSPL_BANDS
+
+#------------------------------------------------------------------------------------------------------------------
+# ### PROGRESSIVE APPROXIMATE RESULTS FOR LARGE NVSPL QUERIES
+#
+# Exploring years of NVSPL, two significant figures are often enough.  These generators answer first from a
+# systematic sample (every P-th second, which spreads across the whole record), then process the remaining
+# offsets one pass at a time, yielding a refined estimate and confidence bound after each pass.  After P passes
+# every row has been counted and the result is exact, equal to Lx / a direct count on the full data:
+#
+#     for estimate in progressive_Lx(nvspl, 90):
+#         print(estimate)
+#         if(estimate.width < 0.5):
+#             break
+#
+#     estimate = until(progressive_percent_time_above(store, 35), tolerance = 1.0)
+#
+# Levels are counted into 0.1 dB histograms as they arrive, so each pass costs a bincount and memory does not grow.
+# Bounds are Wilson score intervals treating the sample as random, with a finite-population correction, so they
+# close to zero only at full coverage; for strongly autocorrelated records early bounds are approximate.
+
+_LEVEL_COLUMNS = NVSPL_BANDS + ["dbA"]
+
+
+
+class ProgressiveEstimate(object):
+    """
+    One step of a progressive computation.
+
+    Attributes
+    ----------
+    estimate: pandas Series, the current estimate per band.
+    lower, upper: pandas Series, the confidence bound per band.
+    rows: int, the rows counted so far.
+    total: int, the rows in the record.
+    exact: boolean, whether every row has been counted.
+    """
+
+    def __init__(self, estimate, lower, upper, rows, total, exact):
+
+        self.estimate = estimate
+        self.lower = lower
+        self.upper = upper
+        self.rows = rows
+        self.total = total
+        self.exact = exact
+
+    @property
+    def fraction(self):
+        """
+        The fraction of rows counted so far.
+        """
+
+        return self.rows/self.total if self.total else 1.
+
+    @property
+    def width(self):
+        """
+        The widest confidence interval across bands.
+        """
+
+        return float(np.nanmax((self.upper - self.lower).to_numpy())) if len(self.estimate) else 0.
+
+    def __repr__(self):
+
+        return ("ProgressiveEstimate(" + "{0:.1%}".format(self.fraction) + " of rows, width " +
+                "{0:.2f}".format(self.width) + (", exact" if self.exact else "") + ")\n" +
+                pd.DataFrame({"lower": self.lower, self.estimate.name: self.estimate, "upper": self.upper}).to_string())
+
+
+
+def _band_reader(nvspl, bands):
+
+    # one function per band returning the decoded levels of rows offset, offset + passes, ...
+    if(isinstance(nvspl, NVSPLStore)):
+        raw = nvspl.raw()
+        present = set(nvspl.bands)
+        bands = [b for b in (_LEVEL_COLUMNS if bands is None else bands) if b in present]
+
+        def reader(band):
+            j = nvspl.bands.index(band)
+            if(nvspl.dtype == np.int16):
+                return lambda offset, passes: np.where(raw[offset::passes, j] == NODATA, np.nan, raw[offset::passes, j]*nvspl.scale)
+            return lambda offset, passes: raw[offset::passes, j].astype(np.float64)
+
+        return bands, [reader(b) for b in bands], len(nvspl)
+
+    present = set(column_names(nvspl))
+    bands = [b for b in (_LEVEL_COLUMNS if bands is None else bands) if b in present]
+    columns = [column_values(nvspl, b) for b in bands]
+
+    def reader(values):
+        return lambda offset, passes: np.asarray(values[offset::passes], dtype=np.float64)
+
+    return bands, [reader(c) for c in columns], len(columns[0]) if columns else 0
+
+
+
+class _Histogram(object):
+
+    # counts of 0.1 dB codes, widened as new levels arrive; on_grid turns False if any level is not a multiple of 0.1 dB
+    def __init__(self):
+
+        self.offset = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.on_grid = True
+
+    def add(self, values):
+
+        values = values[~np.isnan(values)]
+        if(len(values) == 0):
+            return
+
+        codes = np.round(values*10).astype(np.int64)
+        self.on_grid = self.on_grid and bool(np.all(np.abs(values*10 - codes) < 1e-6))
+
+        lo, hi = codes.min(), codes.max()
+        if(len(self.counts) == 0):
+            self.offset, self.counts = lo, np.zeros(hi - lo + 1, dtype=np.int64)
+        elif(lo < self.offset or hi >= self.offset + len(self.counts)):
+            new_offset = min(lo, self.offset)
+            counts = np.zeros(max(hi, self.offset + len(self.counts) - 1) - new_offset + 1, dtype=np.int64)
+            counts[self.offset - new_offset:self.offset - new_offset + len(self.counts)] = self.counts
+            self.offset, self.counts = new_offset, counts
+
+        self.counts += np.bincount(codes - self.offset, minlength=len(self.counts))
+
+    def at_ranks(self, ranks):
+
+        # the level at each 0-based rank: the first bin whose cumulative count exceeds it
+        cumulative = np.cumsum(self.counts)
+        return (np.searchsorted(cumulative, ranks, side="right") + self.offset)/10.
+
+
+
+def _wilson(p, n, z):
+
+    # Wilson score interval for a proportion; unlike the normal (Wald) interval it keeps a non-zero width at p = 0 or 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        center = (p + z**2/(2*n))/(1 + z**2/n)
+        half = z/(1 + z**2/n)*np.sqrt(p*(1 - p)/n + z**2/(4*n**2))
+
+    return center - half, center + half
+
+
+
+def _passes_order(passes, seed):
+
+    # offsets in random order, so every prefix of passes is a systematic sample spread over the record
+    return np.random.default_rng(seed).permutation(passes)
+
+
+
+def progressive_Lx(nvspl, x, bands = None, passes = 64, confidence = 0.95, seed = 0):
+    """
+    Exceedance levels refined pass by pass, from a systematic sample of rows up to the exact result.
+
+    Parameters
+    ----------
+    nvspl: pandas dataframe representing NPS NSNSD NVSPL file, formatted by soundDB library, an ArrowDtype-backed frame or pyarrow Table, or an NVSPLStore (see nvspl_store.py).
+    x: float, the exceedance level = (100 - percentile), such that x = 10 is the 90th percentile.
+    bands: list of str, optional.  The columns to include.  Defaults to every band and dbA present.
+    passes: int, optional.  The number of passes; the first counts one row in every `passes`.  Defaults to 64.
+    confidence: float, optional.  The confidence level of the bounds.  Defaults to 0.95.
+    seed: int, optional.  Seed for the order of the passes.  Defaults to 0.
+
+    Yields
+    ------
+    ProgressiveEstimate, with estimate named "L<x>"; the last one is exact and equals np.nanquantile on the full columns
+    """
+
+    bands, readers, total = _band_reader(nvspl, bands)
+    if(not bands):
+        raise ValueError("none of the requested bands are in the NVSPL")
+
+    q = (100 - x)/100
+    z = NormalDist().inv_cdf(0.5 + confidence/2)
+    passes = max(1, min(passes, total))
+    histograms = [_Histogram() for b in bands]
+    counted = 0
+
+    for step, offset in enumerate(_passes_order(passes, seed)):
+
+        for histogram, read in zip(histograms, readers):
+            histogram.add(read(offset, passes))
+
+        exact = step == passes - 1
+        counted += len(range(offset, total, passes))
+
+        estimate, lower, upper = np.full(len(bands), np.nan), np.full(len(bands), np.nan), np.full(len(bands), np.nan)
+        for k, histogram in enumerate(histograms):
+            n = int(histogram.counts.sum())
+            if(n == 0):
+                continue
+
+            if(exact and not histogram.on_grid):
+                # levels off the 0.1 dB grid: finish with the exact quantile of the full column
+                estimate[k] = lower[k] = upper[k] = np.nanquantile(readers[k](0, 1), q)
+                continue
+
+            # the sample quantile, interpolated between ranks as np.nanquantile does
+            position = (n - 1)*q
+            below = int(np.floor(position))
+            low_value, high_value = histogram.at_ranks([below, min(below + 1, n - 1)])
+            estimate[k] = low_value + (high_value - low_value)*(position - below)
+
+            # distribution-free bound from the ranks either side, narrowed by the share of rows already counted;
+            # ranks beyond the sample leave that side open, and a bound never closes inside a single 0.1 dB bin
+            if(exact):
+                lower[k] = upper[k] = estimate[k]
+            else:
+                low_q, high_q = _wilson(q, n, z*np.sqrt(max(0., 1 - counted/total)))
+                low_rank, high_rank = int(np.floor(low_q*(n - 1))), int(np.ceil(high_q*(n - 1)))
+                lower[k], upper[k] = histogram.at_ranks([max(0, low_rank), min(n - 1, high_rank)])
+                if(low_q*n < 1):
+                    lower[k] = -np.inf
+                if((1 - high_q)*n < 1):
+                    upper[k] = np.inf
+                lower[k], upper[k] = min(lower[k], estimate[k] - 0.1), max(upper[k], estimate[k] + 0.1)
+
+        name = "L" + str(x)
+        yield ProgressiveEstimate(pd.Series(estimate, index=bands, name=name), pd.Series(lower, index=bands, name=name),
+                                  pd.Series(upper, index=bands, name=name), counted, total, exact)
+
+
+
+def progressive_percent_time_above(nvspl, threshold, bands = ("dbA",), passes = 64, confidence = 0.95, seed = 0):
+    """
+    The percentage of seconds with a level above a threshold, refined pass by pass up to the exact result.
+
+    Parameters
+    ----------
+    nvspl: pandas dataframe representing NPS NSNSD NVSPL file, formatted by soundDB library, an ArrowDtype-backed frame or pyarrow Table, or an NVSPLStore (see nvspl_store.py).
+    threshold: float, the level in dB.  Seconds strictly above it count as exceeding.
+    bands: list of str, optional.  The columns to include.  Defaults to dbA.
+    passes: int, optional.  The number of passes; the first counts one row in every `passes`.  Defaults to 64.
+    confidence: float, optional.  The confidence level of the bounds.  Defaults to 0.95.
+    seed: int, optional.  Seed for the order of the passes.  Defaults to 0.
+
+    Yields
+    ------
+    ProgressiveEstimate of percentages of the non-missing seconds, named "percentTimeAbove<threshold>"
+    """
+
+    bands, readers, total = _band_reader(nvspl, None if bands is None else list(bands))
+    if(not bands):
+        raise ValueError("none of the requested bands are in the NVSPL")
+
+    z = NormalDist().inv_cdf(0.5 + confidence/2)
+    passes = max(1, min(passes, total))
+    above = np.zeros(len(bands), dtype=np.int64)
+    valid = np.zeros(len(bands), dtype=np.int64)
+    counted = 0
+
+    for step, offset in enumerate(_passes_order(passes, seed)):
+
+        for k, read in enumerate(readers):
+            values = read(offset, passes)
+            above[k] += np.count_nonzero(values > threshold)
+            valid[k] += np.count_nonzero(~np.isnan(values))
+
+        exact = step == passes - 1
+        counted += len(range(offset, total, passes))
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            p = above/valid
+
+        # Wilson bounds, narrowed by the share of rows already counted, so a sample without exceedances is not "exact"
+        low, high = _wilson(p, valid, z*np.sqrt(max(0., 1 - counted/total)))
+        if(exact):
+            low, high = p, p
+
+        name = "percentTimeAbove" + str(threshold)
+        yield ProgressiveEstimate(pd.Series(100*p, index=bands, name=name),
+                                  pd.Series(100*np.clip(low, 0, 1), index=bands, name=name),
+                                  pd.Series(100*np.clip(high, 0, 1), index=bands, name=name), counted, total, exact)
+
+
+
+def until(estimates, tolerance = None, callback = None):
+    """
+    Consume a progressive generator until the confidence interval is narrow enough, or the result is exact.
+
+    Parameters
+    ----------
+    estimates: generator from progressive_Lx() or progressive_percent_time_above().
+    tolerance: float, optional.  Stop once every band's interval is at most this wide (dB, or percentage points).  Defaults to running to the exact result.
+    callback: callable, optional.  Called with every ProgressiveEstimate as it arrives, e.g. to update a plot.
+
+    Returns
+    -------
+    ProgressiveEstimate, the last one computed
+    """
+
+    estimate = None
+    for estimate in estimates:
+        if(callback is not None):
+            callback(estimate)
+        if(tolerance is not None and estimate.width <= tolerance):
+            break
+
+    return estimate
@@ -0,0 +1,303 @@
+import struct
+import zlib
+
+import pandas as pd
+import numpy as np
+
+import _core
+
+#------------------------------------------------------------------------------------------------------------------
+# ### MERGEABLE QUANTILE SKETCHES FOR CROSS-SITE AND CROSS-SEASON AGGREGATION
+#
+# The derived data are quantized: levels to 0.1 dB, durations and noise free intervals to whole seconds, and
+# daily event counts to whole events.  A sparse fixed-bin histogram at that resolution is therefore an exact
+# sketch: merging is a sum of counts (associative and commutative), and quantiles taken from a merged sketch
+# equal the quantiles of the concatenated raw data.  Build one per site-season, store .to_bytes(), and get
+# park- or region-wide quantiles from merge_sketches() without reloading any raw data.
+
+
+_MAGIC = b"DDQS"
+_VERSION = 1
+
+
+def _smallest_uint(values):
+
+    top = values.max() if len(values) else 0
+    for dtype in [np.uint8, np.uint16, np.uint32]:
+        if(top <= np.iinfo(dtype).max):
+            return dtype
+    return np.uint64
+
+
+
+class QuantileSketch(object):
+    """
+    An exact, mergeable histogram sketch of quantized values.
+
+    Parameters
+    ----------
+    values: array-like of floats, optional.  Values to add; NaNs are ignored.
+    scale: int, optional.  Bins per unit, i.e. 1/resolution: 10 for 0.1 dB levels, 1 for whole seconds or counts.  Defaults to 10.
+    """
+
+    def __init__(self, values = None, scale = 10):
+
+        self.scale = scale
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+
+        if(values is not None):
+            values = np.asarray(values, dtype=float)
+            values = values[~np.isnan(values)]
+            self.keys, self.counts = np.unique(np.round(values*scale).astype(np.int64), return_counts=True)
+
+    @classmethod
+    def _from_bins(cls, keys, counts, scale):
+
+        sketch = cls(scale = scale)
+        sketch.keys = keys
+        sketch.counts = counts
+
+        return sketch
+
+    def __len__(self):
+        return int(self.counts.sum())
+
+    def __add__(self, other):
+        return self.merge(other)
+
+    def __eq__(self, other):
+        return (isinstance(other, QuantileSketch) and self.scale == other.scale and
+                np.array_equal(self.keys, other.keys) and np.array_equal(self.counts, other.counts))
+
+    def merge(self, other):
+        """
+        Combine two sketches into a new one, as if their raw values had been concatenated.
+
+        Returns
+        -------
+        QuantileSketch
+        """
+
+        if(self.scale != other.scale):
+            raise ValueError("sketches with different scales cannot be merged")
+
+        keys, inverse = np.unique(np.concatenate([self.keys, other.keys]), return_inverse=True)
+        counts = np.bincount(inverse, weights=np.concatenate([self.counts, other.counts]), minlength=len(keys))
+
+        return QuantileSketch._from_bins(keys, counts.astype(np.int64), self.scale)
+
+    def values(self):
+        """
+        The distinct values held by the sketch, in ascending order.
+        """
+
+        return self.keys/self.scale
+
+    def quantile(self, q):
+        """
+        Quantile(s) of the sketched values, interpolated linearly between ranks exactly as pandas.Series.quantile does.
+
+        Parameters
+        ----------
+        q: float or array-like of floats, from 0.0 (minimum) to 1.0 (maximum.)
+
+        Returns
+        -------
+        float, or numpy array of floats if q is an array
+        """
+
+        q_array = np.atleast_1d(np.asarray(q, dtype=float))
+        n = len(self)
+        if(n == 0):
+            out = np.full(len(q_array), np.nan)
+            return out if np.ndim(q) else out[0]
+
+        # the value at 0-based rank r is the first bin whose cumulative count exceeds r
+        cumulative = np.cumsum(self.counts)
+        position = (n - 1)*q_array
+        below = np.floor(position).astype(np.int64)
+        above = np.minimum(below + 1, n - 1)
+
+        values = self.values()
+        lower = values[np.searchsorted(cumulative, below, side="right")]
+        upper = values[np.searchsorted(cumulative, above, side="right")]
+        out = lower + (upper - lower)*(position - below)
+
+        return out if np.ndim(q) else float(out[0])
+
+    def mean(self):
+        return float((self.values()*self.counts).sum()/len(self)) if len(self) else np.nan
+
+    def to_bytes(self):
+        """
+        Serialize to a compact byte string: delta-encoded bin keys and counts in the narrowest
+        unsigned integer types that hold them, zlib-compressed.
+
+        Returns
+        -------
+        bytes
+        """
+
+        deltas = np.diff(self.keys).astype(np.uint64) if len(self.keys) else np.zeros(0, dtype=np.uint64)
+        delta_type = _smallest_uint(deltas)
+        count_type = _smallest_uint(self.counts)
+        first = int(self.keys[0]) if len(self.keys) else 0
+
+        header = struct.pack("<4sBdqIcc", _MAGIC, _VERSION, float(self.scale), first, len(self.keys),
+                             np.dtype(delta_type).char.encode(), np.dtype(count_type).char.encode())
+        body = deltas.astype(delta_type).tobytes() + self.counts.astype(count_type).tobytes()
+
+        return header + zlib.compress(body)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Rebuild a sketch written by to_bytes().
+
+        Returns
+        -------
+        QuantileSketch
+        """
+
+        size = struct.calcsize("<4sBdqIcc")
+        magic, version, scale, first, n, delta_char, count_char = struct.unpack("<4sBdqIcc", data[:size])
+        if(magic != _MAGIC or version != _VERSION):
+            raise ValueError("not a serialized QuantileSketch")
+
+        body = zlib.decompress(data[size:])
+        delta_type = np.dtype(delta_char.decode())
+        count_type = np.dtype(count_char.decode())
+
+        split = max(n - 1, 0)*delta_type.itemsize
+        deltas = np.frombuffer(body[:split], dtype=delta_type).astype(np.int64)
+        counts = np.frombuffer(body[split:], dtype=count_type).astype(np.int64)
+
+        keys = first + np.concatenate([[0], np.cumsum(deltas)]).astype(np.int64) if n else np.zeros(0, dtype=np.int64)
+        scale = int(scale) if float(scale).is_integer() else scale
+
+        return cls._from_bins(keys, counts, scale)
+
+
+
+def merge_sketches(sketches):
+    """
+    Merge any number of sketches, e.g. every site-season sketch for a park.
+
+    Parameters
+    ----------
+    sketches: iterable of QuantileSketch (or of bytes from QuantileSketch.to_bytes()).
+
+    Returns
+    -------
+    QuantileSketch
+    """
+
+    sketches = [QuantileSketch.from_bytes(s) if isinstance(s, bytes) else s for s in sketches]
+    if(not sketches):
+        raise ValueError("at least one sketch is required")
+
+    # one concatenation is cheaper than a chain of pairwise merges
+    scale = sketches[0].scale
+    if(any(s.scale != scale for s in sketches)):
+        raise ValueError("sketches with different scales cannot be merged")
+
+    keys, inverse = np.unique(np.concatenate([s.keys for s in sketches]), return_inverse=True)
+    counts = np.bincount(inverse, weights=np.concatenate([s.counts for s in sketches]), minlength=len(keys))
+
+    return QuantileSketch._from_bins(keys, counts.astype(np.int64), scale)
+
+
+
+#------------------------------------------------------------------------------------------------------------------
+# ### SKETCH BUILDERS
+
+
+def amplitude_sketch(srcid, metric = "Lmax", weight = "A", source = "all"):
+    """
+    Sketch the amplitude values of SPLAT-annotated sources at a site, at 0.1 dB resolution.
+    quantile_amplitude(srcid, q) equals amplitude_sketch(srcid).quantile(q), rounded to 0.1 dB.
+
+    Parameters
+    ----------
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
+    metric: str, optional.  The amplitude metric to use when preforming the calculation, either "Lmax" or "SEL". Defaults to "Lmax" if unspecified.
+    weight: str, optional.  The acoustic weighting used to calculate Lmax, either "A" or "T". Defaults to "A" if unspecified.
+    source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
+
+    Returns
+    -------
+    QuantileSketch
+    """
+
+    return QuantileSketch(_core.levels(srcid, metric, weight, source), scale = 10)
+
+
+
+def duration_sketch(srcid, source = "all"):
+    """
+    Sketch the durations (in seconds) of SPLAT-annotated sources at a site, at 1 second resolution.
+
+    Parameters
+    ----------
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
+    source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
+
+    Returns
+    -------
+    QuantileSketch of seconds
+    """
+
+    return QuantileSketch(_core.durations_s(srcid, source), scale = 1)
+
+
+
+def NFI_sketch(srcid, source = "all"):
+    """
+    Sketch the noise free intervals (in seconds) for a selected source type, at 1 second resolution.
+    Divide quantiles by 60, 3600 or 86400 for minutes, hours or days.
+
+    Parameters
+    ----------
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
+    source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
+
+    Returns
+    -------
+    QuantileSketch of seconds
+    """
+
+    # the same intervals as NFI_list: positive differences between consecutive event starts
+    starts, _ = _core.events_ns(srcid, source)
+
+    return QuantileSketch(_core.nfi_between_starts(starts), scale = 1)
+
+
+
+def eventsPerDay_sketch(dailypa, source = "all"):
+    """
+    Sketch the daily event counts for a source type.
+
+    Parameters
+    ----------
+    dailypa: pandas dataframe representing NPS NSNSD dailypa file, formatted by soundDB library.
+    source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
+
+    Returns
+    -------
+    QuantileSketch of events per day
+    """
+
+    if(type(source) == str):
+        if(source.lower() == "all"):
+            counts = dailypa.loc[(slice(None), "Total_All"), "nEvents_24Hr"]
+
+        elif(source.lower() == "air"):
+            counts = dailypa.loc[(slice(None), "Total_1"), "nEvents_24Hr"]
+
+        else:
+            raise ValueError('source must be "all", "air", or a list of srcID codes')
+    else:
+        counts = dailypa.loc[(slice(None), [str(s) for s in source]), "nEvents_24Hr"]
+
+    return QuantileSketch(pd.to_numeric(counts), scale = 1)
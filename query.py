@@ -0,0 +1,495 @@
+import inspect
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+import numpy as np
+
+import _core
+from arrow_backend import to_pandas
+from function_catalog import data_product
+from report_planner import FUNCTIONS, plan_report
+from srcid_compact import COMPACT_SRCID_SCHEMA, compact_srcid, is_compact, source_mask, srcid_codes, srcid_starts_ns
+
+#------------------------------------------------------------------------------------------------------------------
+# ### LAZY SRCID QUERIES WITH PREDICATE PUSHDOWN
+#
+# Every metric function receives a fully materialized srcid, even when the question is "air events in July 2019,
+# hours 7 - 19".  A Query records its filters and reads nothing until a metric is asked for; then the time range,
+# hours, sources and the columns the metrics need are pushed down into the reader:
+#
+#     Query(site).srcid().source("air").between("2019-07-01", "2019-08-01").hours(7, 19).quantile_amplitude(0.5)
+#
+#     query = Query("SRCID_DENAUWBT_parts").source("air").between("2019-07-01", "2019-08-01")
+#     query.compute([("median Lmax", "quantile_amplitude", {"q": 0.5}),       # one scan for all three metrics,
+#                    ("mean NFI", "mean_NFI", {}),                             # shared intermediates as in
+#                    ("events", "total_count", {})])                           # report_planner.plan_report()
+#
+# A site is a dict of data products, as in sites.json for metrics_service.py, or the srcid alone.  The srcid may be:
+#
+#     a partitioned directory written by write_srcid_partitions(): one directory per month of compact columns,
+#         so only the months overlapping the time range, and holding a matching source, are opened, and only the
+#         needed columns of the matching rows are read from them (memory-mapped, one binary search per month)
+#     a pickle file, loaded once into a cache (compacted), after which queries select rows and columns from memory
+#     a dataframe in either srcid form, or an Arrow table
+#
+# For a srcid in memory whose events are not in time order, pass a SRCIDIntervalIndex (srcid_index.py) built over it
+# with source "all" as index=, and between() becomes two binary searches on the index instead of a scan of every start.
+
+
+_PARTITIONS_META = "partitions.json"
+_STARTS = "starts"
+_HOUR_NS = 3600*10**9
+
+# the srcid functions that read a level column: those taking metric and weight, and those counting Lmax values
+_AMPLITUDE_FUNCTIONS = ["quantile_amplitude", "mad_amplitude", "iqr_amplitude", "mean_amplitude", "stdev_amplitude",
+                        "stderr_amplitude", "SPL_exceedance_curve"]
+_MAXSPL_FUNCTIONS = ["total_count", "percentageOfAll_bySource", "percentageOfAir_bySource", "propJetRatio",
+                     "DENABCMP_SPL_exceedance", "DENABCMP_SPL_exceedanceRate"]
+
+_SRCID_FUNCTIONS = {name: function for name, function in FUNCTIONS.items()
+                    if data_product(function) == "srcid"}
+
+# pickled srcid files already loaded by this process
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_CACHE_SIZE = 8
+
+
+
+#------------------------------------------------------------------------------------------------------------------
+# ### MONTHLY PARTITIONED SRCID ON DISK
+
+
+def write_srcid_partitions(srcid, path):
+    """
+    Write a srcid as one directory per calendar month of compact columns (see srcid_compact.py), for Query to read selectively.
+
+    Parameters
+    ----------
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).  May also be an Arrow table.
+    path: str, the directory to create (must not already hold partitions).
+
+    Returns
+    -------
+    SRCIDPartitions
+    """
+
+    if(os.path.exists(os.path.join(path, _PARTITIONS_META))):
+        raise ValueError("srcid partitions already exist at " + path)
+
+    compact = compact_srcid(to_pandas(srcid))
+    starts = srcid_starts_ns(compact)
+    order = np.argsort(starts, kind="stable")
+    starts = starts[order]
+    months = starts.view("datetime64[ns]").astype("datetime64[M]")
+    columns = [c for c in COMPACT_SRCID_SCHEMA if c in compact.columns]
+
+    os.makedirs(path, exist_ok=True)
+    meta = {"index_name": compact.index.name, "columns": {c: COMPACT_SRCID_SCHEMA[c] for c in columns}, "partitions": []}
+
+    for month in np.unique(months):
+        rows = order[months == month]
+        name = str(month)
+        os.makedirs(os.path.join(path, name), exist_ok=True)
+
+        np.save(os.path.join(path, name, _STARTS + ".npy"), starts[months == month])
+        for column in columns:
+            np.save(os.path.join(path, name, column + ".npy"), compact[column].to_numpy()[rows])
+
+        # the time span and source codes of each month, so queries can skip it without opening it
+        meta["partitions"].append({"name": name, "rows": len(rows), "first": int(starts[months == month][0]),
+                                   "last": int(starts[months == month][-1]),
+                                   "codes": sorted(int(c) for c in np.unique(compact["srcCode"].to_numpy()[rows]))})
+
+    with open(os.path.join(path, _PARTITIONS_META), "w") as f:
+        json.dump(meta, f)
+
+    return SRCIDPartitions(path)
+
+
+
+class SRCIDPartitions(object):
+    """
+    A read-only view of a srcid written by write_srcid_partitions().
+
+    Parameters
+    ----------
+    path: str, the partition directory.
+
+    Attributes
+    ----------
+    partitions: list of dict, one per month: name, rows, first and last event start (ns), and the srcCodes present.
+    columns: list of str, the stored compact columns.
+    """
+
+    def __init__(self, path):
+
+        self.path = path
+        with open(os.path.join(path, _PARTITIONS_META)) as f:
+            meta = json.load(f)
+
+        self.partitions = meta["partitions"]
+        self.columns = list(meta["columns"])
+        self._index_name = meta["index_name"]
+
+    def __len__(self):
+
+        return sum(p["rows"] for p in self.partitions)
+
+    def __repr__(self):
+
+        return "SRCIDPartitions(" + repr(self.path) + ", " + str(len(self)) + " events in " + str(len(self.partitions)) + " months)"
+
+    def _array(self, partition, column):
+
+        return np.load(os.path.join(self.path, partition["name"], column + ".npy"), mmap_mode="r")
+
+    def read(self, t0 = None, t1 = None, hours = None, sources = (), columns = None, stats = None):
+        """
+        Read the events matching a set of predicates, opening only the months and columns they involve.
+
+        Parameters
+        ----------
+        t0, t1: int, optional.  Event starts in [t0, t1), as nanoseconds since the epoch.  Defaults to no bound.
+        hours: numpy array of 24 booleans, optional.  The hours of day to keep, by event start.  Defaults to every hour.
+        sources: list, optional.  Source subsets ("all", "air", or lists of srcID codes as float); events must belong to every one.
+        columns: list of str, optional.  The columns to read.  Defaults to every stored column.
+        stats: dict, optional.  Updated with the partitions opened and the columns read.
+
+        Returns
+        -------
+        pandas dataframe in the compact srcid form
+        """
+
+        columns = self.columns if columns is None else [c for c in self.columns if c in columns]
+        lo = np.iinfo(np.int64).min if t0 is None else t0
+        hi = np.iinfo(np.int64).max if t1 is None else t1
+
+        starts, parts = [], {c: [] for c in columns}
+        opened = 0
+        for partition in self.partitions:
+
+            # prune on the stored span and source codes before touching any file
+            if(partition["last"] < lo or partition["first"] >= hi):
+                continue
+            if(sources and not np.any(_source_codes_mask(np.asarray(partition["codes"], dtype=np.int16), sources))):
+                continue
+            opened += 1
+
+            month_starts = self._array(partition, _STARTS)
+            a, b = np.searchsorted(month_starts, [lo, hi], side="left")
+            rows = np.arange(a, b)
+            if(hours is not None):
+                rows = rows[hours[(month_starts[a:b]//_HOUR_NS) % 24]]
+            if(sources):
+                rows = rows[_source_codes_mask(self._array(partition, "srcCode")[rows], sources)]
+
+            starts.append(np.asarray(month_starts[rows]))
+            for column in columns:
+                parts[column].append(np.asarray(self._array(partition, column)[rows]))
+
+        if(stats is not None):
+            stats.update(partitions=len(self.partitions), partitions_read=opened, columns_read=columns)
+
+        index = pd.DatetimeIndex(np.concatenate(starts if starts else [np.empty(0, dtype=np.int64)]).view("datetime64[ns]"), name=self._index_name)
+        return pd.DataFrame({c: np.concatenate(parts[c]) if parts[c] else np.empty(0, dtype=COMPACT_SRCID_SCHEMA[c])
+                             for c in columns}, index=index)
+
+
+
+def _source_codes_mask(codes, sources):
+
+    # rows whose srcCode belongs to every source subset
+    frame = pd.DataFrame({"srcCode": codes})
+    mask = np.ones(len(codes), dtype=bool)
+    for source in sources:
+        mask &= source_mask(frame, source)
+
+    return mask
+
+
+
+def _cached_srcid(path, load):
+
+    # load a pickled srcid once, and again only when the file changes
+    stamp = os.stat(path).st_mtime_ns
+    with _cache_lock:
+        entry = _cache.get(path)
+        if(entry is None or entry[0] != stamp):
+            entry = (stamp, compact_srcid(to_pandas(load(path))))
+            _cache[path] = entry
+        _cache.move_to_end(path)
+
+        while(len(_cache) > _CACHE_SIZE):
+            _cache.popitem(last=False)
+
+        return entry[1]
+
+
+
+#------------------------------------------------------------------------------------------------------------------
+# ### QUERIES
+
+
+def _to_ns(t):
+
+    return None if t is None else int(pd.Timestamp(t).as_unit("ns").value)
+
+
+def _needed_columns(name, params):
+    """
+    The compact srcid columns a derivedDataFunctions srcid function reads.
+    """
+
+    columns = {"len", "srcCode"}
+    if(name in _AMPLITUDE_FUNCTIONS):
+        bound = inspect.signature(_SRCID_FUNCTIONS[name]).bind(None, **params)
+        bound.apply_defaults()
+        columns.add(_core.amplitude_column(bound.arguments["metric"], bound.arguments["weight"]))
+    elif(name in _MAXSPL_FUNCTIONS):
+        columns.add("MaxSPL")
+
+    return columns
+
+
+
+class Query(object):
+    """
+    A lazy, chainable query on one site's srcid.  Filters return a new Query and read nothing; metrics (the srcid functions of
+    derivedDataFunctions, as methods without the srcid argument), compute() and collect() run a single scan with every
+    filter pushed down into the reader.
+
+    Parameters
+    ----------
+    site: dict of {product name: path or data}, as in sites.json for metrics_service.py; or the srcid alone, as a path to
+    partitions written by write_srcid_partitions(), a pickle file, SRCIDPartitions, a dataframe in either srcid form, or an Arrow table.
+    load: callable, optional.  Reads a srcid file that is not partitioned.  Defaults to pandas.read_pickle.
+    index: SRCIDIntervalIndex, optional.  An index over the whole srcid (source "all") of a site held in memory or in a pickle file,
+    used to find the events in the time range.  Partitioned directories keep their own sorted starts and do not use it.  Defaults to None.
+    """
+
+    def __init__(self, site, load = pd.read_pickle, index = None):
+
+        self._site = site
+        self._load = load
+        self._index = index
+        self._t0 = None
+        self._t1 = None
+        self._hours = None
+        self._sources = []
+        self._columns = None
+
+        for name, function in _SRCID_FUNCTIONS.items():
+            setattr(self, name, self._method(name, function))
+
+    def _copy(self):
+
+        query = Query(self._site, self._load, self._index)
+        query._t0, query._t1, query._hours = self._t0, self._t1, self._hours
+        query._sources, query._columns = list(self._sources), self._columns
+
+        return query
+
+    def __repr__(self):
+
+        filters = []
+        if(self._t0 is not None or self._t1 is not None):
+            filters.append("between(" + str(None if self._t0 is None else pd.Timestamp(self._t0)) + ", " +
+                           str(None if self._t1 is None else pd.Timestamp(self._t1)) + ")")
+        if(self._hours is not None):
+            filters.append("hours(" + str([int(h) for h in np.flatnonzero(self._hours)]) + ")")
+        filters += ["source(" + repr(s) + ")" for s in self._sources]
+        if(self._columns is not None):
+            filters.append("columns(" + ", ".join(self._columns) + ")")
+
+        return "Query(" + ".".join(["srcid()"] + filters) + ")"
+
+    def srcid(self):
+        """
+        Query the site's srcid (currently the only product with pushdown).
+        """
+
+        return self._copy()
+
+    def source(self, source):
+        """
+        Keep the events of a source subset: "all", "air", or a list of srcID codes as float.  Repeated calls intersect.
+        """
+
+        source_mask(pd.DataFrame({"srcCode": np.zeros(0, dtype=np.int16)}), source)     # validate now, not at the scan
+
+        query = self._copy()
+        query._sources.append(source)
+        return query
+
+    def between(self, t0 = None, t1 = None):
+        """
+        Keep the events starting in [t0, t1).  Either bound may be None; repeated calls intersect.
+        """
+
+        query = self._copy()
+        t0, t1 = _to_ns(t0), _to_ns(t1)
+        if(t0 is not None):
+            query._t0 = t0 if query._t0 is None else max(query._t0, t0)
+        if(t1 is not None):
+            query._t1 = t1 if query._t1 is None else min(query._t1, t1)
+
+        return query
+
+    def hours(self, first_hour, last_hour):
+        """
+        Keep the events starting in hours of day first_hour to last_hour, inclusive, wrapping past midnight when
+        first_hour > last_hour (e.g. hours(19, 6)).  Repeated calls intersect.
+        """
+
+        keep = np.zeros(24, dtype=bool)
+        if(first_hour <= last_hour):
+            keep[first_hour:last_hour + 1] = True
+        else:
+            keep[first_hour:] = True
+            keep[:last_hour + 1] = True
+
+        query = self._copy()
+        query._hours = keep if query._hours is None else query._hours & keep
+        return query
+
+    def columns(self, *columns):
+        """
+        Read only these compact srcid columns in collect() (metrics choose their own columns).
+        """
+
+        query = self._copy()
+        query._columns = list(columns)
+        return query
+
+    def _source(self):
+
+        site = self._site
+        if(isinstance(site, dict)):
+            site = site["srcid"]
+
+        if(isinstance(site, str)):
+            path = os.path.abspath(os.path.expanduser(site))
+            if(os.path.isdir(path)):
+                return SRCIDPartitions(path)
+            return _cached_srcid(path, self._load)
+
+        if(isinstance(site, SRCIDPartitions)):
+            return site
+
+        return to_pandas(site)
+
+    def _scan(self, columns, stats = None):
+
+        source = self._source()
+        if(isinstance(source, SRCIDPartitions)):
+            return source.read(self._t0, self._t1, self._hours, self._sources, columns, stats)
+
+        # a frame in memory: the same predicates, evaluated on the index and the code column only
+        starts = srcid_starts_ns(source)
+        rows = np.arange(len(source))
+        if(self._t0 is not None or self._t1 is not None):
+            lo = np.iinfo(np.int64).min if self._t0 is None else self._t0
+            hi = np.iinfo(np.int64).max if self._t1 is None else self._t1
+            if(source.index.is_monotonic_increasing):
+                rows = rows[np.searchsorted(starts, lo, side="left"):np.searchsorted(starts, hi, side="left")]
+            elif(self._index is not None):
+                if(not self._index.matches(source, "all")):
+                    raise ValueError('index was built over a different srcid or source; build it with SRCIDIntervalIndex(srcid, "all")')
+                # the index holds the starts sorted; its positions go back into file order
+                rows = np.sort(self._index.starting(self._t0, self._t1))
+            else:
+                rows = rows[(starts >= lo) & (starts < hi)]
+        if(self._hours is not None):
+            rows = rows[self._hours[(starts[rows]//_HOUR_NS) % 24]]
+        if(self._sources):
+            rows = rows[_source_codes_mask(srcid_codes(source)[rows], self._sources)]
+
+        if(columns is not None):
+            # soundDB-form frames name the codes srcID
+            names = ["srcID" if c == "srcCode" and not is_compact(source) else c for c in columns]
+            source = source[[c for c in source.columns if c in names]]
+        if(stats is not None):
+            stats.update(partitions=1, partitions_read=1, columns_read=list(source.columns))
+
+        return source.iloc[rows]
+
+    def collect(self):
+        """
+        Read the matching events.
+
+        Returns
+        -------
+        pandas dataframe, in the compact srcid form when read from partitions or a cached file, otherwise in the form given
+        """
+
+        return self._scan(self._columns)
+
+    def explain(self, spec = None):
+        """
+        What a scan reads: partitions (months) opened out of the total, columns, and matching events.
+
+        Parameters
+        ----------
+        spec: list of (label, metric, params) tuples, optional.  The metrics whose columns to read, as in compute().  Defaults to collect().
+
+        Returns
+        -------
+        dict
+        """
+
+        stats = {}
+        events = len(self._scan(self._columns if spec is None else _spec_columns(spec), stats))
+        stats["events"] = events
+
+        return stats
+
+    def compute(self, spec, threads = 1):
+        """
+        Evaluate several metrics on the matching events with one scan, reading the union of the columns they need and
+        sharing intermediates between them as report_planner.plan_report() does.
+
+        Parameters
+        ----------
+        spec: list of (label, metric, params) tuples; metric is a srcid function of derivedDataFunctions, params its other arguments.
+        threads: int, optional.  Worker threads for independent intermediates.  Defaults to 1.
+
+        Returns
+        -------
+        dict of {label: result}, in spec order
+        """
+
+        plan = plan_report(spec)
+        return plan.run({"srcid": self._scan(_spec_columns(spec))}, threads)
+
+    def _method(self, name, function):
+
+        signature = inspect.signature(function)
+        first = list(signature.parameters)[0]
+
+        def method(*args, **kwargs):
+            bound = signature.bind(None, *args, **kwargs)
+            params = {k: v for k, v in bound.arguments.items() if k != first}
+            return self.compute([(name, name, params)])[name]
+
+        method.__name__ = name
+        method.__doc__ = function.__doc__
+        method.__signature__ = signature.replace(parameters=list(signature.parameters.values())[1:])
+        return method
+
+
+
+def _spec_columns(spec):
+
+    columns = set()
+    for label, metric, params in spec:
+        name = metric if type(metric) == str else metric.__name__
+        if(name not in _SRCID_FUNCTIONS):
+            raise ValueError(name + " is not a srcid metric")
+
+        columns |= _needed_columns(name, params)
+
+    return [c for c in COMPACT_SRCID_SCHEMA if c in columns]
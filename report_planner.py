@@ -0,0 +1,378 @@
+import datetime
+import inspect
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import pandas as pd
+import numpy as np
+
+import _core
+import derivedDataFunctions
+from arrow_backend import to_pandas
+from derivedDataFunctions import NFI_UNITS, PA_ZONES, SPL_ZONES
+from function_catalog import data_product, public_functions
+from srcid_compact import source_mask, srcid_durations_s, srcid_levels, srcid_starts_ns
+
+#------------------------------------------------------------------------------------------------------------------
+# ### REPORT PLANNER: SHARED INTERMEDIATES ACROSS METRICS
+#
+# A site report calls dozens of functions that repeat the same work: the same source mask, the same parsed
+# level column, the same chronologically sorted events for every NFI metric, the same dailypa row selection.
+# A report is declared as a list of (label, metric, params); plan_report() expands each metric into the
+# intermediates it needs, keyed by what they compute (so identical keys from different metrics are one node),
+# and ReportPlan.run() evaluates the resulting DAG once per site, running independent branches in a thread pool:
+#
+#     spec = [("median Lmax air", "quantile_amplitude", {"q": 0.5, "source": "air"}),
+#             ("mean NFI air", "mean_NFI", {"source": "air"}),
+#             ("L90 dailypa 07h", "quantile_hourlyPA", {"q": 0.9, "hour": 7})]
+#     plan = plan_report(spec)
+#     results = plan.run({"srcid": srcid, "dailypa": dailypa})
+#
+# Metrics without a decomposition here are still planned: each distinct (function, parameters) call becomes
+# a single node on its data product.  Results equal the derivedDataFunctions functions called one by one.
+
+
+# the metrics a spec may name: every public function in derivedDataFunctions
+FUNCTIONS = dict(public_functions(derivedDataFunctions))
+
+
+def _hashable(value):
+
+    # parameters become part of node keys, so lists and arrays are turned into tuples
+    if(isinstance(value, (list, tuple))):
+        return tuple(_hashable(v) for v in value)
+    if(isinstance(value, dict)):
+        return tuple(sorted((k, _hashable(v)) for k, v in value.items()))
+    if(isinstance(value, np.ndarray)):
+        return tuple(value.tolist())
+
+    return value
+
+
+def _source(source):
+
+    return source.lower() if type(source) == str else tuple(float(s) for s in source)
+
+
+def _as_source(key):
+
+    return key if type(key) == str else list(key)
+
+
+def _dailypa_query(source):
+
+    if(type(source) == str):
+        return {"all": "Total_All", "air": "Total_1"}.get(source.lower())
+
+    return tuple(str(s) for s in source)
+
+
+
+#------------------------------------------------------------------------------------------------------------------
+# ### INTERMEDIATES
+#
+# Each builder returns a node (key, function, dependency nodes); function receives the data products and the dependency values.
+
+
+def _mask(source):
+    return (("srcid", "mask", source), lambda data: source_mask(data["srcid"], _as_source(source)), [])
+
+def _column(column):
+    return (("srcid", "column", column), lambda data: srcid_levels(data["srcid"], column), [])
+
+def _levels(column, source):
+    mask, col = _mask(source), _column(column)
+    return (("srcid", "levels", column, source), lambda data, m, c: c[m], [mask, col])
+
+def _all_durations():
+    return (("srcid", "durations"), lambda data: srcid_durations_s(data["srcid"]), [])
+
+def _durations(source):
+    return (("srcid", "durations", source), lambda data, m, d: d[m].astype(np.float64), [_mask(source), _all_durations()])
+
+def _starts():
+    return (("srcid", "starts"), lambda data: srcid_starts_ns(data["srcid"]), [])
+
+def _days():
+    return (("srcid", "days"), lambda data, s: _core.event_days(s), [_starts()])
+
+def _events(source):
+    # as _core.events_ns: chronologically sorted starts and ends, in integer nanoseconds
+    return (("srcid", "events", source), lambda data, m, s, d: _core.sorted_events(s[m], d[m]), [_mask(source), _starts(), _all_durations()])
+
+def _nfi_starts(source, unit):
+    return (("srcid", "nfi_starts", source, unit), lambda data, e: _core.nfi_between_starts(e[0], unit), [_events(source)])
+
+def _nfi_events(source, unit):
+    return (("srcid", "nfi_events", source, unit), lambda data, e: _core.nfi_between_events(e[0], e[1], unit), [_events(source)])
+
+def _pa_rows(query):
+    return (("dailypa", "rows", query), lambda data: data["dailypa"].loc[(slice(None), query if type(query) == str else list(query)), :], [])
+
+def _pa_block(query, hs, hf):
+    return (("dailypa", "block", query, hs, hf), lambda data, rows: rows.loc[:, hs:hf].to_numpy(dtype=float).ravel(), [_pa_rows(query)])
+
+
+
+#------------------------------------------------------------------------------------------------------------------
+# ### METRIC RECIPES
+#
+# Each recipe maps a metric's full parameters to (dependencies, finishing function of their values), making the same
+# _core calls as the function in derivedDataFunctions; None means the metric is planned as a single call.
+
+
+_AMPLITUDE = {"quantile_amplitude": lambda v, p: _core.quantile(v, p["q"]),
+              "mad_amplitude": lambda v, p: _core.mad(v),
+              "iqr_amplitude": lambda v, p: _core.iqr(v),
+              "mean_amplitude": lambda v, p: _core.mean(v),
+              "stdev_amplitude": lambda v, p: _core.std(v),
+              "stderr_amplitude": lambda v, p: _core.stderr(v)}
+
+_DURATION = {"quantile_event_duration": lambda v, p: _core.quantile(v, p["q"]),
+             "mad_event_duration": lambda v, p: _core.mad(v),
+             "iqr_event_duration": lambda v, p: _core.iqr(v),
+             "mean_event_duration": lambda v, p: _core.mean(v),
+             "stdev_event_duration": lambda v, p: _core.std(v),
+             "stderr_event_duration": lambda v, p: _core.stderr(v)}
+
+
+def _recipe(name, p):
+
+    if(name in _AMPLITUDE):
+        reduce = _AMPLITUDE[name]
+        return [_levels(_core.amplitude_column(p["metric"], p["weight"]), _source(p["source"]))], lambda v: _core.round_level(reduce(v, p))
+
+    if(name == "total_event_duration"):
+        return [_durations(_source(p["source"]))], lambda v: pd.Timedelta(seconds = _core.total(v))
+
+    if(name in _DURATION):
+        reduce = _DURATION[name]
+        return [_durations(_source(p["source"]))], lambda v: datetime.timedelta(seconds = reduce(v, p))
+
+    if(name == "total_count"):
+        return [_levels("MaxSPL", _source(p["source"]))], _core.count
+
+    if(name in ["percentageOfAll_bySource", "percentageOfAir_bySource"]):
+        base = "all" if name == "percentageOfAll_bySource" else "air"
+        return [_levels("MaxSPL", (float(p["id_code"]),)), _levels("MaxSPL", base)], _core.percent_of
+
+    if(name == "propJetRatio"):
+        return [_levels("MaxSPL", (1.2,)), _levels("MaxSPL", (1.1,))], _core.count_ratio
+
+    if(name == "DENABCMP_SPL_exceedance"):
+        threshold = SPL_ZONES[p["zone"].lower()]
+        return [_levels("MaxSPL", _source(p["source"]))], lambda v: _core.percent_above(v, threshold)
+
+    if(name == "DENABCMP_SPL_exceedanceRate"):
+        threshold = SPL_ZONES[p["zone"].lower()]
+        return [_levels("MaxSPL", _source(p["source"])), _days()], lambda v, days: _core.rate_above(v, threshold, days)
+
+    if(name == "mean_NFI"):
+        return [_nfi_events(_source(p["source"]), NFI_UNITS[p["unit"]])], _core.mean
+
+    if(name == "NFI_list"):
+        return [_nfi_starts(_source(p["source"]), NFI_UNITS[p["unit"]])], pd.Series
+
+    if(name == "quantile_NFI"):
+        return [_nfi_starts(_source(p["source"]), NFI_UNITS[p["unit"]])], lambda v: pd.Series(v).quantile(p["q"])
+
+    # dailypa metrics share the row selection for a source, and the flattened hour block for a range of hours
+    if(name in ["quantile_hourlyPA", "quantile_eventsPerDay", "total_events", "DENABCMP_PA_exceedance", "overall_PA", "quantile_dailyPA"]):
+        query = _dailypa_query(p["source"])
+        if(query is None or (name == "quantile_dailyPA" and type(query) == tuple and len(query) != 1)):
+            return None
+
+        # DENABCMP_PA_exceedance looks a source list up by its string form, so lists go through the function itself
+        if(name == "DENABCMP_PA_exceedance" and type(query) == tuple):
+            return None
+
+        if(name == "quantile_hourlyPA"):
+            h = str(p["hour"]).zfill(2) + "h"
+            return [_pa_rows(query)], lambda rows: rows[h].quantile(p["q"])
+
+        if(name == "quantile_dailyPA"):
+            hs, hf = [str(h).zfill(2) + "h" for h in p["hour_range"]]
+            return [_pa_rows(query)], lambda rows: rows.loc[:, hs:hf].quantile(p["q"])
+
+        if(name == "quantile_eventsPerDay"):
+            return [_pa_rows(query)], lambda rows: rows["nEvents_24Hr"].quantile(p["q"])
+
+        if(name == "total_events"):
+            return [_pa_rows(query)], lambda rows: rows["nEvents_24Hr"].sum()
+
+        if(name == "DENABCMP_PA_exceedance"):
+            threshold = PA_ZONES[p["zone"].lower()]
+            block = _pa_block(query, str(p["start_hour"]).zfill(2) + "h", str(p["end_hour"]).zfill(2) + "h")
+            return [block], lambda d: _core.percent_above(d, threshold)
+
+        # overall_PA: every hour of the Total_All rows counts as sampled
+        block = _pa_block(query, "00h", "23h")
+        total = _pa_block("Total_All", "00h", "23h")
+        return [block, total], lambda d, tot: _core.percent_time_audible(d, len(tot))
+
+    return None
+
+
+
+#------------------------------------------------------------------------------------------------------------------
+# ### PLANNING AND EXECUTION
+
+
+class ReportPlan(object):
+    """
+    The DAG of intermediates and finishing steps for a report spec, built by plan_report().  A plan depends only on the spec,
+    so one plan can be run on every site.
+
+    Attributes
+    ----------
+    labels: list of str, the metric labels in spec order.
+    nodes: dict of {key: (function, dependency keys)}, every unique intermediate and metric, in dependency order.
+    """
+
+    def __init__(self):
+
+        self.labels = []
+        self.nodes = {}
+        self._references = 0
+
+    def _add(self, node):
+
+        key, function, dependencies = node
+        self._references += 1
+        for dependency in dependencies:
+            self._add(dependency)
+
+        if(key not in self.nodes):
+            self.nodes[key] = (function, [d[0] for d in dependencies])
+
+        return key
+
+    def summary(self):
+        """
+        The size of the plan: metrics, unique nodes, and node references before deduplication.
+
+        Returns
+        -------
+        dict
+        """
+
+        return {"metrics": len(self.labels), "nodes": len(self.nodes), "references": self._references}
+
+    def run(self, data, threads = None, cache = None):
+        """
+        Evaluate the plan on one site's data, computing every intermediate once.
+
+        Parameters
+        ----------
+        data: dict of {product name: data}, e.g. {"srcid": srcid, "dailypa": dailypa}.  Only the products the spec needs are required.
+        threads: int, optional.  Worker threads for independent nodes; 1 runs serially.  Defaults to the number of CPUs.
+        cache: dict, optional.  Intermediates kept between runs on the same, unchanged data: read from, and filled with the
+        intermediates this run computes (masks, level columns, sorted events, dailypa rows; not metric results).
+
+        Returns
+        -------
+        dict of {label: result}, in spec order
+        """
+
+        data = {product: to_pandas(value) for product, value in data.items()}
+        threads = threads or os.cpu_count() or 1
+
+        values = {}
+        if(cache is not None):
+            values.update((key, cache[key]) for key in self.nodes if key in cache)
+        waiting = {key: set(d for d in dependencies if d not in values) for key, (function, dependencies) in self.nodes.items()
+                   if key not in values}
+        dependents = {}
+        for key, (function, dependencies) in self.nodes.items():
+            for dependency in set(dependencies):
+                dependents.setdefault(dependency, []).append(key)
+
+        def evaluate(key):
+            function, dependencies = self.nodes[key]
+            return function(data, *[values[d] for d in dependencies])
+
+        if(threads == 1):
+            # nodes were added in dependency order
+            for key in waiting:
+                values[key] = evaluate(key)
+        else:
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                running = {pool.submit(evaluate, key): key for key, pending in waiting.items() if not pending}
+                while(running):
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        key = running.pop(future)
+                        values[key] = future.result()
+                        for dependent in dependents.get(key, []):
+                            waiting[dependent].discard(key)
+                            if(not waiting[dependent]):
+                                running[pool.submit(evaluate, dependent)] = dependent
+
+        if(cache is not None):
+            cache.update((key, value) for key, value in values.items() if key[0] not in ["metric", "call"])
+
+        return {label: values[("metric", label)] for label in self.labels}
+
+
+
+def plan_report(spec):
+    """
+    Plan a report: expand every metric into the intermediates it needs and merge identical ones into a single DAG.
+
+    Parameters
+    ----------
+    spec: list of (label, metric, params) tuples.  metric is the name of a function in derivedDataFunctions (or the function itself),
+    and params its keyword arguments other than the data, e.g. ("median Lmax air", "quantile_amplitude", {"q": 0.5, "source": "air"}).
+
+    Returns
+    -------
+    ReportPlan
+    """
+
+    plan = ReportPlan()
+    for label, metric, params in spec:
+
+        name = metric if type(metric) == str else metric.__name__
+        if(name not in FUNCTIONS):
+            raise ValueError("unknown metric: " + name)
+        if(label in plan.labels):
+            raise ValueError("duplicate report label: " + label)
+
+        # bind against the real signature, so defaults are explicit and equivalent calls share nodes
+        function = FUNCTIONS[name]
+        signature = inspect.signature(function)
+        product = data_product(function)
+        bound = signature.bind(None, **params)
+        bound.apply_defaults()
+        p = dict(list(bound.arguments.items())[1:])
+
+        recipe = _recipe(name, p)
+        if(recipe is None):
+            call = (("call", name, _hashable(p)), lambda data, f=function, product=product, p=p: f(data[product], **p), [])
+            dependencies, finish = [call], lambda value: value
+        else:
+            dependencies, finish = recipe
+
+        plan.labels.append(label)
+        plan._add((("metric", label), lambda data, *values, finish=finish: finish(*values), dependencies))
+
+    return plan
+
+
+
+def run_report(spec, data, threads = None):
+    """
+    Plan and run a report on one site's data.
+
+    Parameters
+    ----------
+    spec: list of (label, metric, params) tuples, see plan_report().
+    data: dict of {product name: data}, e.g. {"srcid": srcid, "dailypa": dailypa}.
+    threads: int, optional.  Worker threads for independent nodes.  Defaults to the number of CPUs.
+
+    Returns
+    -------
+    dict of {label: result}, in spec order
+    """
+
+    return plan_report(spec).run(data, threads)
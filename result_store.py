@@ -0,0 +1,478 @@
+import argparse
+import ast
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+
+import pandas as pd
+
+import instrumentation
+
+# fcntl is POSIX only: without it, processes sharing a store are not serialized when saving the index
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+#------------------------------------------------------------------------------------------------------------------
+# ### PERSISTENT CONTENT-ADDRESSED RESULT STORE
+#
+# Metric results are persisted under a key hashed from (input file contents, function, parameters, the source of
+# the library modules the function depends on), so a quarterly report rebuild only recomputes the sites and
+# metrics whose inputs changed:
+#
+#     store = ResultStore("~/.ddf_results", max_bytes=2*2**30)
+#     table = rebuild_report(store, sites, [("L50 air", derivedDataFunctions.quantile_amplitude, "srcid", {"q": 0.5, "source": "air"})])
+#
+# Entries are evicted least-recently-used once the store exceeds max_bytes.  Several processes may share a store:
+# every save takes an exclusive lock on index.lock, re-reads index.json and merges this process's new entries and
+# access times into it, so no process overwrites another's results.  From the command line:
+#
+#     python result_store.py ~/.ddf_results list
+#     python result_store.py ~/.ddf_results prune --max-bytes 1000000000 --older-than 90
+
+
+_INDEX = "index.json"
+_INDEX_LOCK = "index.lock"
+
+# the modules every result depends on; a function from another module of this library adds that module
+_DEFAULT_MODULES = ("derivedDataFunctions", "merge_SRCID")
+_library_versions = {}
+
+# opt-in profiling wraps functions without changing their results, so it is not a dependency
+_PROFILING_MODULES = ("instrumentation",)
+
+
+def _source_path(name):
+
+    # the source file of one of this library's modules, or None for any other module
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), str(name) + ".py")
+    return path if os.path.isfile(path) else None
+
+
+def _dependencies(names):
+
+    # this library's modules reachable from the named ones through their import statements
+    found = set()
+    pending = [name for name in names if _source_path(name) is not None]
+    while(pending):
+        name = pending.pop()
+        if(name in found):
+            continue
+        found.add(name)
+
+        with open(_source_path(name), "rb") as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if(isinstance(node, ast.Import)):
+                imported = [alias.name for alias in node.names]
+            elif(isinstance(node, ast.ImportFrom) and node.level == 0):
+                imported = [node.module]
+            else:
+                continue
+            pending += [module for module in imported
+                        if _source_path(module) is not None and module not in found and module not in _PROFILING_MODULES]
+
+    return sorted(found)
+
+
+def library_version(function = None):
+    """
+    A fingerprint of the library source a function depends on: derivedDataFunctions, merge_SRCID, the function's own module,
+    and every module of this library they import, directly or indirectly.  Editing any of them changes the keys of the
+    function's results, so stale results computed by older code are never returned; editing unrelated modules does not.
+
+    Parameters
+    ----------
+    function: callable or str, optional.  The cached function.  A name, or a function defined outside this library, adds no module.
+
+    Returns
+    -------
+    str, hexadecimal digest
+    """
+
+    module = getattr(function, "__module__", None)
+    names = _DEFAULT_MODULES
+    if(callable(function) and _source_path(module) is not None and module not in names):
+        names = names + (module,)
+
+    if(names not in _library_versions):
+        digest = hashlib.sha256()
+        for name in _dependencies(names):
+            digest.update(name.encode())
+            with open(_source_path(name), "rb") as f:
+                digest.update(f.read())
+        _library_versions[names] = digest.hexdigest()[:16]
+
+    return _library_versions[names]
+
+
+
+def _absolute(path):
+
+    return os.path.abspath(os.path.expanduser(path))
+
+
+def _canonical(value):
+
+    # a stable text form for parameters: sorted dicts, lists for tuples, repr for anything else
+    if(isinstance(value, dict)):
+        return {str(k): _canonical(v) for k, v in sorted(value.items(), key=lambda item: str(item[0]))}
+    if(isinstance(value, (list, tuple))):
+        return [_canonical(v) for v in value]
+    if(isinstance(value, (str, int, float, bool)) or value is None):
+        return value
+
+    return repr(value)
+
+
+
+class ResultStore(object):
+    """
+    A size-bounded, least-recently-used store of metric results on local disk.
+
+    Parameters
+    ----------
+    root: str, the directory holding the store (created if needed).
+    max_bytes: int, optional.  Evict least-recently-used entries beyond this total size.  Defaults to 1 GiB.
+    """
+
+    def __init__(self, root, max_bytes = 2**30):
+
+        self.root = os.path.expanduser(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.join(self.root, "objects"), exist_ok=True)
+
+        self._index = self._read_index()
+
+        # entries put or read, and files hashed, since the index was last saved
+        self._changed = set()
+        self._hashed = set()
+
+    def _read_index(self):
+
+        if(not os.path.exists(os.path.join(self.root, _INDEX))):
+            return {"entries": {}, "fingerprints": {}}
+
+        with open(os.path.join(self.root, _INDEX)) as f:
+            return json.load(f)
+
+    def _merged(self, saved):
+
+        # the saved index holds every other process's work; add ours on top.  An entry read here but evicted
+        # elsewhere since is only kept if its object is still on disk.
+        entries = saved["entries"]
+        for key in self._changed:
+            entry = self._index["entries"].get(key)
+            if(entry is None or (key not in entries and not os.path.exists(self._object_path(key)))):
+                continue
+            if(key in entries):
+                entry["last_access"] = max(entry["last_access"], entries[key]["last_access"])
+            entries[key] = entry
+
+        fingerprints = saved["fingerprints"]
+        fingerprints.update({path: self._index["fingerprints"][path] for path in self._hashed})
+
+        return {"entries": entries, "fingerprints": fingerprints}
+
+    def _save_index(self, max_bytes = None, older_than = None):
+
+        # one process at a time: re-read the index, merge, evict, then write-then-rename, so a crash never leaves a
+        # half-written index behind.  The lock is released when the lock file is closed.
+        path = os.path.join(self.root, _INDEX)
+        with open(os.path.join(self.root, _INDEX_LOCK), "a") as lock:
+            if(fcntl is not None):
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+
+            self._index = self._merged(self._read_index())
+            self._changed, self._hashed = set(), set()
+            removed = self._evict(max_bytes, older_than)
+
+            # fingerprints are only worth keeping for files some entry was computed from
+            inputs = set(p for entry in self._index["entries"].values() for p in entry.get("inputs", []))
+            self._index["fingerprints"] = {p: f for p, f in self._index["fingerprints"].items() if p in inputs}
+
+            with open(path + ".tmp", "w") as f:
+                json.dump(self._index, f)
+            os.replace(path + ".tmp", path)
+
+        return removed
+
+    def _object_path(self, key):
+        return os.path.join(self.root, "objects", key[:2], key + ".pkl")
+
+    def fingerprint(self, path):
+        """
+        The sha256 of a file's contents, remembered by (path, size, modification time) so unchanged files are hashed only once.
+
+        Returns
+        -------
+        str, hexadecimal digest
+        """
+
+        path = _absolute(path)
+        stat = os.stat(path)
+        stamp = [stat.st_size, stat.st_mtime_ns]
+
+        known = self._index["fingerprints"].get(path)
+        if(known is not None and known[0] == stamp):
+            return known[1]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(2**20), b""):
+                digest.update(block)
+
+        with self._lock:
+            self._index["fingerprints"][path] = [stamp, digest.hexdigest()]
+            self._hashed.add(path)
+
+        return digest.hexdigest()
+
+    def key(self, function, inputs, params):
+        """
+        The content address of one result.
+
+        Parameters
+        ----------
+        function: callable or str, the metric function (or a name for it).
+        inputs: list of str, paths of the input files.
+        params: dict, the remaining arguments.
+
+        Returns
+        -------
+        str, hexadecimal digest
+        """
+
+        name = function if isinstance(function, str) else function.__module__ + "." + function.__qualname__
+        payload = json.dumps({"function": name,
+                              "inputs": [self.fingerprint(p) for p in inputs],
+                              "params": _canonical(params),
+                              "version": library_version(function)}, sort_keys=True)
+
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key):
+        """
+        Look up a result.
+
+        Returns
+        -------
+        tuple: (found, value)
+        """
+
+        entry = self._index["entries"].get(key)
+        if(entry is None or not os.path.exists(self._object_path(key))):
+            instrumentation.record_cache("result_store", False)
+            return False, None
+
+        # another process may evict the entry in the meantime
+        try:
+            with open(self._object_path(key), "rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            instrumentation.record_cache("result_store", False)
+            return False, None
+
+        # access times are flushed with the next put() or flush(), not on every hit
+        with self._lock:
+            entry["last_access"] = time.time()
+            self._changed.add(key)
+
+        instrumentation.record_cache("result_store", True)
+        return True, value
+
+    def flush(self):
+        """
+        Merge recorded access times (and file fingerprints) into the index on disk.
+        """
+
+        with self._lock:
+            self._save_index()
+
+    def put(self, key, value, description = None):
+        """
+        Persist a result, then evict least-recently-used entries if the store is over its size bound.
+        """
+
+        path = self._object_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+
+        now = time.time()
+        with self._lock:
+            self._index["entries"][key] = dict(description or {}, size=os.path.getsize(path),
+                                               created=now, last_access=now)
+            self._changed.add(key)
+            self._save_index(self.max_bytes)
+
+    def compute(self, function, inputs, load, params = None):
+        """
+        Return a stored result, or compute and store it.
+
+        Parameters
+        ----------
+        function: callable, called as function(*[load(p) for p in inputs], **params).
+        inputs: list of str, paths of the input files (hashed for the key, loaded only on a miss).
+        load: callable, reads one input file, e.g. pandas.read_pickle.
+        params: dict, optional.  Keyword arguments for function.
+
+        Returns
+        -------
+        the function's result
+        """
+
+        params = params or {}
+        key = self.key(function, inputs, params)
+
+        found, value = self.get(key)
+        if(found):
+            self.flush()
+            return value
+
+        value = function(*[load(p) for p in inputs], **params)
+        self.put(key, value, {"function": getattr(function, "__name__", str(function)),
+                              "params": _canonical(params),
+                              "inputs": [_absolute(p) for p in inputs]})
+
+        return value
+
+    def _evict(self, max_bytes = None, older_than = None):
+
+        entries = self._index["entries"]
+        removed = []
+
+        # least recently used first
+        order = sorted(entries, key=lambda k: entries[k]["last_access"])
+        total = sum(e["size"] for e in entries.values())
+
+        for key in order:
+            stale = older_than is not None and entries[key]["last_access"] < older_than
+            if(not stale and (max_bytes is None or total <= max_bytes)):
+                continue
+
+            total = total - entries[key]["size"]
+            try:
+                os.remove(self._object_path(key))
+            except FileNotFoundError:
+                pass
+            del entries[key]
+            removed.append(key)
+
+        return removed
+
+    def prune(self, max_bytes = None, older_than_days = None):
+        """
+        Remove entries: least-recently-used ones until the store fits in max_bytes, and any not used for older_than_days.
+
+        Returns
+        -------
+        list of removed keys
+        """
+
+        cutoff = time.time() - older_than_days*86400 if older_than_days is not None else None
+
+        with self._lock:
+            return self._save_index(max_bytes, cutoff)
+
+    def entries(self):
+        """
+        List the stored results.
+
+        Returns
+        -------
+        pandas DataFrame indexed by key, most recently used first
+        """
+
+        frame = pd.DataFrame.from_dict(self._index["entries"], orient="index")
+        if(frame.empty):
+            return frame
+
+        for column in ["created", "last_access"]:
+            frame[column] = pd.to_datetime(frame[column], unit="s")
+
+        return frame.sort_values("last_access", ascending=False)
+
+    def total_bytes(self):
+        return sum(e["size"] for e in self._index["entries"].values())
+
+
+
+def rebuild_report(store, sites, metrics, load = pd.read_pickle):
+    """
+    Build a site x metric report, recomputing only the results whose inputs, parameters or code changed.
+
+    Parameters
+    ----------
+    store: ResultStore.
+    sites: dict of {site name: {product name: path}}, e.g. {"DENAUWBT": {"srcid": ".../SRCID_DENAUWBT.pkl", "dailypa": ...}}.
+    metrics: list of (label, function, product, params) tuples, e.g. ("median Lmax air", quantile_amplitude, "srcid", {"q": 0.5, "source": "air"}).
+    load: callable, optional.  Reads one input file.  Defaults to pandas.read_pickle.  Each file is read at most once per rebuild, and only if needed.
+
+    Returns
+    -------
+    tuple: (pandas DataFrame of results indexed by site with one column per metric label, dict of hit / miss counts)
+    """
+
+    results = {}
+    counts = {"hits": 0, "misses": 0}
+
+    for site, products in sites.items():
+
+        loaded = {}
+        def cached_load(path):
+            if(path not in loaded):
+                loaded[path] = load(path)
+            return loaded[path]
+
+        row = {}
+        for label, function, product, params in metrics:
+            if(product not in products):
+                continue
+
+            key = store.key(function, [products[product]], params)
+            found, value = store.get(key)
+            if(not found):
+                value = function(cached_load(products[product]), **params)
+                store.put(key, value, {"function": function.__name__, "site": site, "label": label,
+                                       "params": _canonical(params), "inputs": [_absolute(products[product])]})
+
+            counts["hits" if found else "misses"] += 1
+            row[label] = value
+
+        results[site] = row
+
+    store.flush()
+
+    return pd.DataFrame.from_dict(results, orient="index"), counts
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="List or prune a derivedDataFunctions result store.")
+    parser.add_argument("root", help="store directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list stored results, most recently used first")
+    prune = commands.add_parser("prune", help="evict entries")
+    prune.add_argument("--max-bytes", type=int, help="evict least-recently-used entries beyond this size")
+    prune.add_argument("--older-than", type=float, help="evict entries unused for this many days")
+    options = parser.parse_args()
+
+    store = ResultStore(options.root)
+
+    if(options.command == "list"):
+        with pd.option_context("display.width", 200, "display.max_colwidth", 60):
+            print(store.entries().to_string())
+        print("{0} entries, {1} bytes".format(len(store.entries()), store.total_bytes()))
+
+    else:
+        removed = store.prune(options.max_bytes, options.older_than)
+        print("removed {0} entries; {1} bytes remain".format(len(removed), store.total_bytes()))
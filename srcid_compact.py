@@ -0,0 +1,200 @@
+import pandas as pd
+import numpy as np
+
+#------------------------------------------------------------------------------------------------------------------
+# ### COMPACT-DTYPE SRCID REPRESENTATION
+#
+# A SRCID as loaded by soundDB carries `len` as timedelta64 objects, srcID as float64 and levels as float64
+# (or, in SRCIDs merged by older versions of merge_SRCID, as strings).  The compact form below holds the same
+# events in about a quarter of the memory and lets the amplitude and duration metrics work on plain numeric arrays:
+#
+#     index    datetime64[ns]  event start (an int64 nanosecond buffer)
+#     len      int32           duration in whole seconds
+#     srcCode  int16           srcID x 100, e.g. 1.1 -> 110
+#     MaxSPL, SEL, MaxSPLt, SELt, Hz_L, Hz_U   float32
+#
+# float32 keeps about 7 significant digits, so a level such as 42.85 dB is stored as 42.849998.  The accessors
+# below round float32 columns back to COMPACT_DECIMALS places as they widen them to float64, which gives exactly the
+# values of the soundDB form for levels recorded to 0.1 dB (and band edges in whole or hundredths of Hz).  Every
+# function in derivedDataFunctions that takes a srcid accepts either form, with identical results.
+
+
+COMPACT_SRCID_SCHEMA = {"len": "int32",
+                        "srcCode": "int16",
+                        "Hz_L": "float32",
+                        "Hz_U": "float32",
+                        "MaxSPL": "float32",
+                        "SEL": "float32",
+                        "MaxSPLt": "float32",
+                        "SELt": "float32"}
+
+# srcID codes carry at most two decimal places, so x100 is lossless
+SOURCE_CODE_SCALE = 100
+
+# the decimal places float32 columns are rounded to when widened to float64
+COMPACT_DECIMALS = 2
+
+
+def is_compact(srcid):
+    """
+    True if srcid is in the compact form produced by compact_srcid().
+    """
+
+    return "srcCode" in srcid.columns
+
+
+def compact_srcid(srcid, keep_annotations = False):
+    """
+    Convert a srcid into the compact-dtype representation described by COMPACT_SRCID_SCHEMA.
+
+    Parameters
+    ----------
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library (or the output of merge_SRCID).
+    keep_annotations: bool, optional.  Keep the userName and tagDate columns.  Defaults to False, since they dominate memory use.
+
+    Returns
+    -------
+    pandas dataframe in the compact form
+    """
+
+    if(is_compact(srcid)):
+        return srcid
+
+    compact = pd.DataFrame(index=pd.DatetimeIndex(srcid.index.values.astype("datetime64[ns]"), name=srcid.index.name))
+
+    compact["len"] = np.round(srcid_durations_s(srcid)).astype("int32")
+    compact["srcCode"] = srcid_codes(srcid)
+
+    # older versions of merge_SRCID wrote joined levels as formatted strings, so parse rather than cast
+    for column, dtype in COMPACT_SRCID_SCHEMA.items():
+        if(column in srcid.columns and column not in compact.columns):
+            compact[column] = pd.to_numeric(srcid[column], errors="coerce").to_numpy().astype(dtype)
+
+    if(keep_annotations):
+        for column in ["userName", "tagDate"]:
+            if(column in srcid.columns):
+                compact[column] = srcid[column].to_numpy()
+
+    return compact
+
+
+def expand_srcid(compact):
+    """
+    Convert a compact srcid back to the soundDB layout (timedelta len, float srcID, float64 levels).
+
+    Returns
+    -------
+    pandas dataframe
+    """
+
+    if(not is_compact(compact)):
+        return compact
+
+    srcid = pd.DataFrame(index=compact.index)
+    srcid["len"] = pd.to_timedelta(compact["len"].to_numpy(), unit="s")
+    srcid["srcID"] = compact["srcCode"].to_numpy()/SOURCE_CODE_SCALE
+
+    for column in ["Hz_L", "Hz_U", "MaxSPL", "SEL", "MaxSPLt", "SELt", "userName", "tagDate"]:
+        if(column in compact.columns):
+            srcid[column] = _widen(compact[column].to_numpy())
+
+    return srcid
+
+
+
+def _widen(values):
+
+    # float32 -> float64, rounded back to the stored precision so that 42.85 reads as 42.85 and not 42.849998
+    if(values.dtype == np.float32):
+        return np.round(values.astype(np.float64), COMPACT_DECIMALS)
+
+    return values
+
+
+
+#------------------------------------------------------------------------------------------------------------------
+# ### ARRAY ACCESSORS FOR EITHER SRCID FORM
+
+
+def srcid_starts_ns(srcid):
+    """
+    Event start times as int64 nanoseconds since the epoch.
+    """
+
+    return np.asarray(srcid.index.values).astype("datetime64[ns]").view("int64")
+
+
+def srcid_durations_s(srcid):
+    """
+    Event durations in seconds: the int32 column itself for a compact srcid, float64 otherwise.
+    """
+
+    if(is_compact(srcid)):
+        return srcid["len"].to_numpy()
+
+    return np.asarray(srcid["len"].values).astype("timedelta64[ns]").view("int64")/1e9
+
+
+def srcid_codes(srcid):
+    """
+    Source codes as int16 (srcID x 100).
+    """
+
+    if(is_compact(srcid)):
+        return srcid["srcCode"].to_numpy()
+
+    return np.round(srcid["srcID"].to_numpy(dtype=float)*SOURCE_CODE_SCALE).astype("int16")
+
+
+def srcid_levels(srcid, column):
+    """
+    One level column (MaxSPL, SEL, MaxSPLt or SELt; or Hz_L, Hz_U) as a float64 array, parsing string-formatted levels
+    and rounding compact float32 columns back to COMPACT_DECIMALS places.
+    """
+
+    values = srcid[column]
+    if(values.dtype == object):
+        values = pd.to_numeric(values, errors="coerce")
+
+    if(values.dtype == np.float32):
+        return _widen(values.to_numpy())
+
+    return values.to_numpy(dtype=float)
+
+
+def source_mask(srcid, source = "all"):
+    """
+    Boolean mask selecting the rows of a srcid (in either form) that belong to a source subset.
+
+    Parameters
+    ----------
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form.
+    source: str or list of floats, optional.  Which subset of srcid codes to select - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
+
+    Returns
+    -------
+    numpy array of booleans
+    """
+
+    if(type(source) == str):
+        if(source.lower() == "all"):
+            return np.ones(len(srcid), dtype=bool)
+
+        elif(source.lower() == "air"):
+            # aviation sources have source ID codes starting with 1: (1., 1.1, 1.2, 1.3, etc.)
+            if(is_compact(srcid)):
+                codes = srcid_codes(srcid)
+                return (codes > 0) & (codes < 2*SOURCE_CODE_SCALE)
+
+            codes = srcid["srcID"].to_numpy(dtype=float)
+            return (codes > 0) & (codes < 2.)
+
+        else:
+            raise ValueError('source must be "all", "air", or a list of srcID codes')
+
+    else:
+        if(is_compact(srcid)):
+            wanted = np.round(np.asarray(source, dtype=float)*SOURCE_CODE_SCALE).astype("int16")
+            return np.isin(srcid_codes(srcid), wanted)
+
+        return srcid["srcID"].isin(source).to_numpy()
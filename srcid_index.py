@@ -0,0 +1,256 @@
+import pandas as pd
+import numpy as np
+
+from srcid_compact import source_mask, srcid_starts_ns, srcid_durations_s
+
+#------------------------------------------------------------------------------------------------------------------
+# ### INTERVAL INDEX FOR TIME-WINDOW OVERLAP QUERIES ON SRCID
+#
+# Built once per (srcid, source), an index holds that source's events sorted by start.  srcid_between() uses it to
+# cut time windows out of a srcid for any SRCID metric; concurrency.py, audibility_timeline.py, episodes.py and
+# query.Query accept one as index= and take their chronologically sorted events from it instead of re-sorting:
+#
+#     index = SRCIDIntervalIndex(srcid, source = "air")
+#     for t0, t1 in windows:
+#         peaks = peak_concurrency(srcid_between(srcid, t0, t1, index = index), source = "air")
+#     timeline = audibility_timeline(srcid, source = "air", index = index)
+
+
+def _to_ns(t):
+    """
+    Convert a timestamp, string, datetime64 or an array of them into a 1-d int64 nanosecond array.
+    """
+
+    return pd.to_datetime(np.atleast_1d(t)).values.astype("datetime64[ns]").view("int64")
+
+
+
+class SRCIDIntervalIndex(object):
+    """
+    An interval index over SRCID events answering "which events overlap [t0, t1)" for
+    thousands of windows at once, without a boolean scan of the whole srcid per window.
+
+    Events are treated as half-open intervals [start, start + len).  The index holds the
+    event starts in sorted order together with a running maximum of the event ends, so a
+    window query reduces to two binary searches followed by a short filter of the candidates.
+
+    Parameters
+    ----------
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form.
+    source: str or list of floats, optional.  Which subset of srcid codes to index - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
+    """
+
+    def __init__(self, srcid, source = "all"):
+
+        # remember which rows of the original srcid we indexed
+        positions = np.flatnonzero(source_mask(srcid, source))
+        self.source = source
+        self.rows_indexed = len(srcid)
+
+        starts = srcid_starts_ns(srcid)[positions]
+        ends = starts + np.round(srcid_durations_s(srcid)[positions]*1e9).astype("int64")
+
+        # sort chronologically, but keep track of the original row positions
+        order = np.argsort(starts, kind="stable")
+
+        self.positions = positions[order]
+        self.starts = starts[order]
+        self.ends = ends[order]
+
+        # the running maximum end lets us skip every event that finished before a window opens,
+        # even when long events overlap shorter ones that started later
+        self.max_ends = np.maximum.accumulate(self.ends) if len(self.ends) else self.ends
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _pairs(self, t0, t1):
+
+        # events starting before the window closes...
+        hi = np.searchsorted(self.starts, t1, side="left")
+
+        # ...and not preceded only by events that already ended
+        lo = np.searchsorted(self.max_ends, t0, side="right")
+        n = np.maximum(hi - lo, 0)
+
+        # expand every window's candidate range [lo, hi) into one flat array of sorted event numbers
+        window = np.repeat(np.arange(len(t0)), n)
+        event = np.repeat(lo, n) + np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+
+        # candidates between lo and hi started early enough, but may have ended before t0
+        keep = self.ends[event] > t0[window]
+
+        return window[keep], event[keep]
+
+    def overlaps(self, t0, t1):
+        """
+        Find every (window, event) pair where an event overlaps a window [t0, t1).
+
+        Parameters
+        ----------
+        t0: timestamp or array-like of timestamps, the (inclusive) window starts.
+        t1: timestamp or array-like of timestamps, the (exclusive) window ends.
+
+        Returns
+        -------
+        tuple of numpy int arrays: (window_number, srcid_row_position)
+        """
+
+        window, event = self._pairs(_to_ns(t0), _to_ns(t1))
+
+        return window, self.positions[event]
+
+    def count(self, t0, t1):
+        """
+        Count the events overlapping each window [t0, t1).
+
+        Parameters
+        ----------
+        t0: timestamp or array-like of timestamps, the (inclusive) window starts.
+        t1: timestamp or array-like of timestamps, the (exclusive) window ends.
+
+        Returns
+        -------
+        numpy array of ints, one per window
+        """
+
+        t0 = _to_ns(t0)
+        window, _ = self._pairs(t0, _to_ns(t1))
+
+        return np.bincount(window, minlength=len(t0))
+
+    def overlap_seconds(self, t0, t1):
+        """
+        Sum the event time (in seconds) falling inside each window [t0, t1).
+        Overlapping events are counted once each, so this is an event duration and not an audible duration.
+
+        Parameters
+        ----------
+        t0: timestamp or array-like of timestamps, the (inclusive) window starts.
+        t1: timestamp or array-like of timestamps, the (exclusive) window ends.
+
+        Returns
+        -------
+        numpy array of floats, one per window
+        """
+
+        t0 = _to_ns(t0)
+        t1 = _to_ns(t1)
+
+        window, event = self._pairs(t0, t1)
+        clipped = np.minimum(self.ends[event], t1[window]) - np.maximum(self.starts[event], t0[window])
+
+        return np.bincount(window, weights=clipped/1e9, minlength=len(t0))
+
+    def rows(self, t0, t1):
+        """
+        Row positions (for use with .iloc) of the events overlapping a single window [t0, t1).
+
+        Returns
+        -------
+        numpy array of ints in chronological order
+        """
+
+        _, event = self.overlaps(t0, t1)
+        return event
+
+    def starting(self, t0 = None, t1 = None):
+        """
+        Row positions (for use with .iloc) of the events starting in [t0, t1), found by two binary searches.
+        Either bound may be None.
+
+        Returns
+        -------
+        numpy array of ints in chronological order
+        """
+
+        lo = 0 if t0 is None else np.searchsorted(self.starts, _to_ns(t0)[0], side="left")
+        hi = len(self.starts) if t1 is None else np.searchsorted(self.starts, _to_ns(t1)[0], side="left")
+
+        return self.positions[lo:hi]
+
+    def matches(self, srcid, source = "all"):
+        """
+        True if the index could have been built over this srcid and source subset (same row count, same source).
+        """
+
+        if(type(self.source) == str or type(source) == str):
+            same = type(self.source) == type(source) and self.source.lower() == source.lower()
+        else:
+            same = sorted(float(s) for s in self.source) == sorted(float(s) for s in source)
+
+        return same and self.rows_indexed == len(srcid)
+
+
+
+def build_interval_index(srcid, source = "all"):
+    """
+    Build a reusable interval index over SRCID events.
+
+    Parameters
+    ----------
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form.
+    source: str or list of floats, optional.  Which subset of srcid codes to index - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
+
+    Returns
+    -------
+    SRCIDIntervalIndex
+    """
+
+    return SRCIDIntervalIndex(srcid, source = source)
+
+
+
+def _checked(srcid, source, index):
+
+    if(index is None):
+        return SRCIDIntervalIndex(srcid, source = source)
+    if(not index.matches(srcid, source)):
+        raise ValueError("index was built over a different srcid or source; build it with SRCIDIntervalIndex(srcid, source)")
+
+    return index
+
+
+
+def indexed_events(srcid, source = "all", index = None):
+    """
+    The events of a source subset sorted by start, from a prebuilt index when one is given.
+
+    Parameters
+    ----------
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form.
+    source: str or list of floats, optional.  Which subset of srcid codes to select - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
+    index: SRCIDIntervalIndex, optional.  An index over the same srcid and source.
+
+    Returns
+    -------
+    tuple of numpy arrays: (int64 starts, int64 ends, srcid row positions), in chronological order
+    """
+
+    index = _checked(srcid, source, index)
+
+    return index.starts, index.ends, index.positions
+
+
+
+def srcid_between(srcid, t0, t1, source = "all", index = None):
+    """
+    Return the SRCID events overlapping the window [t0, t1), so that any SRCID metric
+    can be evaluated for a time range, e.g. total_count(srcid_between(srcid, t0, t1)).
+
+    Parameters
+    ----------
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library.
+    t0: timestamp, the (inclusive) start of the window.
+    t1: timestamp, the (exclusive) end of the window.
+    source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
+    index: SRCIDIntervalIndex, optional.  A prebuilt index over the same srcid; pass one when querying many windows.
+
+    Returns
+    -------
+    pandas dataframe, a chronological subset of srcid
+    """
+
+    index = _checked(srcid, source, index)
+
+    return srcid.iloc[index.rows(t0, t1)]
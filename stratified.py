@@ -0,0 +1,217 @@
+import re
+
+import pandas as pd
+import numpy as np
+
+from srcid_compact import source_mask, srcid_codes, srcid_durations_s, srcid_levels, SOURCE_CODE_SCALE
+
+#------------------------------------------------------------------------------------------------------------------
+# ### STRATIFIED METRIC ENGINE: ANY METRIC BY YEAR, MONTH, SEASON, WEEKDAY AND HOUR OF DAY
+#
+# Instead of slicing a srcid or dailypa by month and hour in nested loops and calling a metric on every slice,
+# derive the grouping keys once, group once, and let pandas' compiled group reductions fill every cell:
+#
+#     stratified_srcid(srcid, by=["month", "hour"], metrics=["count", "mean_Lmax", "p90_SEL"], source="air")
+#
+# Metrics are named "<statistic>_<quantity>".  Statistics: count, total, mean, median, std, min, max, energy
+# (the logarithmic sum, for SEL) and pNN (the NNth percentile).  srcid quantities: Lmax, SEL, duration (seconds).
+# dailypa quantities: PA (hourly percent time audible), audible (seconds audible), events (events per day).
+
+
+STRATA = ("year", "month", "season", "weekday", "hour", "source_group")
+
+# meteorological seasons, named as in the metrics files
+SEASON_OF_MONTH = {12: "Winter", 1: "Winter", 2: "Winter",
+                   3: "Spring", 4: "Spring", 5: "Spring",
+                   6: "Summer", 7: "Summer", 8: "Summer",
+                   9: "Fall", 10: "Fall", 11: "Fall"}
+
+# integer part of the srcID code
+SOURCE_GROUPS = {0: "unknown", 1: "air", 2: "vehicle", 3: "people", 4: "wildlife", 5: "natural"}
+
+_METRIC = re.compile(r"^(count|total|mean|median|std|min|max|energy|p\d{1,2}(?:\.\d+)?)_(\w+)$")
+
+
+def _time_keys(times, by):
+
+    # every key is derived from one DatetimeIndex in a single vectorized pass
+    times = pd.DatetimeIndex(times)
+    keys = {}
+
+    for key in by:
+        if(key == "year"):
+            keys[key] = times.year
+        elif(key == "month"):
+            keys[key] = times.month
+        elif(key == "season"):
+            keys[key] = pd.Index(times.month).map(SEASON_OF_MONTH)
+        elif(key == "weekday"):
+            keys[key] = times.weekday
+        elif(key == "hour"):
+            keys[key] = times.hour
+        elif(key != "source_group"):
+            raise ValueError("unknown stratum {0}; choose from {1}".format(key, ", ".join(STRATA)))
+
+    return keys
+
+
+def _parse_metric(metric, quantities):
+
+    if(metric == "count"):
+        return "count", None
+
+    match = _METRIC.match(metric)
+    if(match is None or match.group(2) not in quantities):
+        raise ValueError("unknown metric {0}; expected <statistic>_<quantity> with quantity in {1}".format(metric, ", ".join(quantities)))
+
+    return match.group(1), match.group(2)
+
+
+def _reduce(grouped, statistic, column):
+
+    # each statistic maps onto one compiled groupby reduction
+    if(statistic == "count"):
+        return grouped[column].count()
+    elif(statistic == "total"):
+        return grouped[column].sum()
+    elif(statistic in ["mean", "median", "std", "min", "max"]):
+        return getattr(grouped[column], statistic)()
+    elif(statistic == "energy"):
+        return 10*np.log10(grouped["_energy_" + column].sum())
+    else:
+        return grouped[column].quantile(float(statistic[1:])/100)
+
+
+def _long_form(results, by):
+
+    wide = pd.DataFrame(results)
+    wide.index.names = by
+    out = wide.reset_index().melt(id_vars=by, var_name="metric", value_name="value")
+
+    return out.sort_values(by + ["metric"], kind="stable").reset_index(drop=True)
+
+
+
+def stratified_srcid(srcid, by, metrics, source = "all", weight = "A"):
+    """
+    Compute SRCID metrics for every combination of the grouping keys in one grouped, vectorized pass.
+    Events are assigned to strata by their start time.
+
+    Parameters
+    ----------
+    srcid: pandas dataframe representing NPS NSNSD srcid file, formatted by soundDB library, or its compact form (see srcid_compact.py).
+    by: list of str, grouping keys from "year", "month", "season", "weekday" (0 = Monday), "hour" and "source_group".
+    metrics: list of str, e.g. ["count", "mean_Lmax", "p90_SEL", "energy_SEL", "median_duration", "total_duration"].
+    source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
+    weight: str, optional.  The acoustic weighting used for Lmax and SEL, either "A" or "T". Defaults to "A" if unspecified.
+
+    Returns
+    -------
+    long-form pandas DataFrame with one column per key plus "metric" and "value", ready for plotting
+    """
+
+    by = list(by)
+    if(not by):
+        raise ValueError("at least one grouping key is required")
+    mask = source_mask(srcid, source)
+    w = weight.upper()
+
+    columns = {"Lmax": {"A": "MaxSPL", "T": "MaxSPLt"}[w], "SEL": {"A": "SEL", "T": "SELt"}[w]}
+    parsed = [(metric,) + _parse_metric(metric, ["Lmax", "SEL", "duration"]) for metric in metrics]
+
+    # one narrow frame holding only the keys and the quantities actually asked for
+    frame = pd.DataFrame(_time_keys(srcid.index[mask], by))
+    if("source_group" in by):
+        groups = srcid_codes(srcid)[mask]//SOURCE_CODE_SCALE
+        frame["source_group"] = pd.Series(groups).map(SOURCE_GROUPS).fillna(pd.Series(groups).astype(str)).to_numpy()
+
+    frame["_rows"] = 1
+    for _, statistic, quantity in parsed:
+        if(quantity == "duration"):
+            frame["duration"] = srcid_durations_s(srcid)[mask].astype(float)
+        elif(quantity is not None):
+            frame[quantity] = srcid_levels(srcid, columns[quantity])[mask]
+            if(statistic == "energy"):
+                frame["_energy_" + quantity] = np.power(10, frame[quantity]/10)
+
+    grouped = frame.groupby(by, sort=True, observed=True)
+
+    results = {}
+    for metric, statistic, quantity in parsed:
+        results[metric] = grouped["_rows"].sum() if quantity is None else _reduce(grouped, statistic, quantity)
+
+    return _long_form(results, by)
+
+
+
+def stratified_dailypa(dailypa, by, metrics, source = "all"):
+    """
+    Compute dailypa metrics for every combination of the grouping keys in one grouped, vectorized pass.
+
+    Parameters
+    ----------
+    dailypa: pandas dataframe representing NPS NSNSD dailypa file, formatted by soundDB library.
+    by: list of str, grouping keys from "year", "month", "season", "weekday" (0 = Monday) and "hour".
+    metrics: list of str, e.g. ["mean_PA", "p90_PA", "total_audible", "count_audible", "mean_events"].
+             "audible" is seconds audible per hour (count_audible counts audible hours); "events" is the
+             daily event count and cannot be combined with "hour".
+    source: str or list of floats, optional.  Which subset of srcid codes to summarize - choose either "all", "air", or specify a list of srcID codes as float.  Defaults to "all" if unspecified.
+
+    Returns
+    -------
+    long-form pandas DataFrame with one column per key plus "metric" and "value", ready for plotting
+    """
+
+    by = list(by)
+    if(not by):
+        raise ValueError("at least one grouping key is required")
+    if("source_group" in by):
+        raise ValueError("dailypa is already summarized by source; use the source argument instead")
+
+    if(type(source) == str):
+        labels = {"all": ["Total_All"], "air": ["Total_1"]}[source.lower()]
+    else:
+        labels = [str(s) for s in source]
+
+    parsed = [(metric,) + _parse_metric(metric, ["PA", "audible", "events"]) for metric in metrics]
+    hourly = any(quantity in ["PA", "audible"] for _, _, quantity in parsed)
+    if("hour" in by and any(quantity == "events" for _, _, quantity in parsed)):
+        raise ValueError("daily event counts cannot be stratified by hour")
+
+    rows = dailypa.loc[dailypa.index.get_level_values(1).isin(labels)]
+    dates = pd.to_datetime(rows.index.get_level_values(0))
+    hours = [str(h).zfill(2) + "h" for h in range(24)]
+
+    results = {}
+
+    if(hourly):
+        # one row per (day, hour): the 24 hour columns are flattened rather than iterated over
+        PA = rows.loc[:, hours].to_numpy(dtype=float).reshape(-1)
+        times = np.repeat(dates.values, 24) + np.tile(np.arange(24)*np.timedelta64(1, "h"), len(rows))
+        frame = pd.DataFrame(_time_keys(times, by))
+        frame["PA"] = PA
+        frame["audible"] = PA*36.
+        frame["_audible_hours"] = (PA > 0).astype(float)
+
+        grouped = frame.groupby(by, sort=True, observed=True)
+        for metric, statistic, quantity in parsed:
+            if(quantity is None):
+                results[metric] = grouped.size()
+            elif(statistic == "count" and quantity == "audible"):
+                results[metric] = grouped["_audible_hours"].sum()
+            elif(quantity != "events"):
+                results[metric] = _reduce(grouped, statistic, quantity)
+
+    if(not hourly or any(quantity == "events" for _, _, quantity in parsed)):
+        # daily event counts are grouped separately, one row per (day, source row)
+        frame = pd.DataFrame(_time_keys(dates, by))
+        frame["events"] = rows["nEvents_24Hr"].to_numpy(dtype=float)
+
+        grouped = frame.groupby(by, sort=True, observed=True)
+        for metric, statistic, quantity in parsed:
+            if(quantity == "events"):
+                results[metric] = _reduce(grouped, statistic, quantity)
+            elif(quantity is None and not hourly):
+                results[metric] = grouped.size()
+
+    return _long_form(results, by)
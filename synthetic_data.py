@@ -0,0 +1,243 @@
+import types
+
+import pandas as pd
+import numpy as np
+
+#------------------------------------------------------------------------------------------------------------------
+# ### SEEDED SYNTHETIC NPS NSNSD DERIVED DATA
+#
+# Generators for soundDB-shaped srcid, dailypa, loudevents, metrics and NVSPL objects.  Every generator
+# takes a seed, so a given (seed, size) always produces the same data and timings can be compared across versions.
+
+
+# srcID codes and their relative frequencies, loosely following a busy backcountry site
+SOURCE_CODES = np.array([0.0, 1.0, 1.1, 1.2, 1.3, 2.0, 2.1, 3.0, 4.0])
+SOURCE_WEIGHTS = np.array([0.05, 0.05, 0.35, 0.20, 0.10, 0.12, 0.05, 0.05, 0.03])
+
+NVSPL_BANDS = ['12.5', '15.8', '20', '25', '31.5', '40', '50', '63', '80',
+               '100', '125', '160', '200', '250', '315', '400', '500', '630', '800',
+               '1000', '1250', '1600', '2000', '2500', '3150', '4000', '5000', '6300',
+               '8000', '10000', '12500', '16000', '20000']
+
+SEASONS = ["Winter", "Spring", "Summer", "Fall"]
+
+
+def synthetic_srcid(days = 90, events_per_day = 40, start = "2019-06-01", seed = 0):
+    """
+    Generate a srcid-shaped dataframe of SPLAT annotations.
+
+    About 2% of events are split across hour breaks, as SPLAT writes them: a piece ending at hh:59:59
+    and a piece with the same srcID resuming at hh+1:00:00, so that merge_SRCID has real work to do.
+
+    Parameters
+    ----------
+    days: int, the number of days spanned by the annotations.
+    events_per_day: float, the average number of annotations per day.
+    start: str or timestamp, the first day of the record.
+    seed: int, seed for the random number generator.
+
+    Returns
+    -------
+    pandas dataframe indexed by event start time
+    """
+
+    rng = np.random.default_rng(seed)
+    n = max(int(days*events_per_day), 1)
+
+    begin = pd.Timestamp(start)
+    offsets = np.sort(rng.integers(0, days*86400, n))
+    starts = begin + pd.to_timedelta(offsets, unit="s")
+    lengths = np.clip(rng.lognormal(4.0, 0.9, n), 1, 3000).astype(int)
+
+    # move roughly 2% of events (of 3 seconds or more) to straddle the end of their hour: to_break seconds up to
+    # hh:59:59, then the rest from hh+1:00:00
+    split = (rng.random(n) < 0.02) & (lengths >= 3)
+    to_break = 3599 - (offsets % 3600)
+    to_break[split] = rng.integers(1, lengths[split] - 1)
+    offsets[split] = offsets[split]//3600*3600 + 3599 - to_break[split]
+    starts = begin + pd.to_timedelta(offsets, unit="s")
+    tail = lengths - to_break - 1
+
+    srcID = rng.choice(SOURCE_CODES, n, p=SOURCE_WEIGHTS)
+    Hz_L = rng.choice([12, 20, 50, 100, 200], n)
+    Hz_U = Hz_L + rng.choice([200, 500, 1000, 2000, 5000], n)
+    MaxSPL = np.round(rng.normal(38, 7, n), 1)
+    SEL = np.round(MaxSPL + 10*np.log10(lengths) - rng.uniform(2, 6, n), 1)
+
+    def frame(index, lens, pick):
+        return pd.DataFrame({"len": pd.to_timedelta(lens, unit="s"),
+                             "srcID": srcID[pick],
+                             "Hz_L": Hz_L[pick],
+                             "Hz_U": Hz_U[pick],
+                             "MaxSPL": MaxSPL[pick],
+                             "SEL": SEL[pick],
+                             "MaxSPLt": np.round(MaxSPL[pick] - 1.5, 1),
+                             "SELt": np.round(SEL[pick] - 1.5, 1),
+                             "userName": "synthetic",
+                             "tagDate": pd.Timestamp("2020-01-01")}, index=index)
+
+    whole = frame(starts, np.where(split, to_break, lengths), np.arange(n))
+
+    # the remainder of each split event starts on the following hour
+    pieces = np.flatnonzero(split)
+    resumed = starts[pieces] + pd.to_timedelta(to_break[pieces] + 1, unit="s")
+    rest = frame(resumed, tail[pieces], pieces)
+
+    srcid = pd.concat([whole, rest]).sort_index()
+    srcid.index.name = "t"
+
+    return srcid
+
+
+def synthetic_dailypa(days = 90, start = "2019-06-01", seed = 0):
+    """
+    Generate a dailypa-shaped dataframe of hourly percent time audible.
+
+    Parameters
+    ----------
+    days: int, the number of days in the record.
+    start: str or timestamp, the first day of the record.
+    seed: int, seed for the random number generator.
+
+    Returns
+    -------
+    pandas dataframe indexed by (date, source) with columns "00h" to "23h" and "nEvents_24Hr"
+    """
+
+    rng = np.random.default_rng(seed)
+
+    dates = pd.date_range(start, periods=days, freq="D").strftime("%Y-%m-%d")
+    codes = [str(c) for c in SOURCE_CODES]
+    hours = [str(h).zfill(2) + "h" for h in range(24)]
+
+    # percent time audible by individual source, with a daytime peak
+    diel = 0.5 + 0.5*np.sin(np.pi*(np.arange(24) - 6)/12).clip(0)
+    pa = rng.gamma(1.2, 2.0, (days, len(codes), 24))*diel*SOURCE_WEIGHTS[None, :, None]*10
+    pa = np.clip(pa, 0, 100).round(2)
+    counts = rng.poisson(40*SOURCE_WEIGHTS[None, :], (days, len(codes))).astype(float)
+
+    # totals: aviation (Total_1) and all sources (Total_All)
+    air = (SOURCE_CODES > 0) & (SOURCE_CODES < 2.)
+    pa_air = np.clip(pa[:, air, :].sum(axis=1), 0, 100)
+    pa_all = np.clip(pa.sum(axis=1), 0, 100)
+
+    labels = codes + ["Total_1", "Total_All"]
+    values = np.concatenate([pa, pa_air[:, None, :], pa_all[:, None, :]], axis=1)
+    events = np.concatenate([counts, counts[:, air].sum(axis=1)[:, None], counts.sum(axis=1)[:, None]], axis=1)
+
+    index = pd.MultiIndex.from_product([dates, labels], names=["date", "srcID"])
+    dailypa = pd.DataFrame(values.reshape(-1, 24), index=index, columns=hours)
+    dailypa["nEvents_24Hr"] = events.reshape(-1)
+
+    return dailypa
+
+
+def synthetic_loudevents(days = 90, start = "2019-06-01", seed = 0):
+    """
+    Generate a loudevents-shaped dataframe: hourly counts of events above and below the natural ambient.
+
+    Parameters
+    ----------
+    days: int, the number of days in the record.
+    start: str or timestamp, the first day of the record.
+    seed: int, seed for the random number generator.
+
+    Returns
+    -------
+    pandas dataframe indexed by date, with ("above" | "below", hour) columns
+    """
+
+    rng = np.random.default_rng(seed)
+
+    dates = pd.date_range(start, periods=days, freq="D")
+    columns = pd.MultiIndex.from_product([["above", "below"], range(24)])
+    counts = rng.poisson(1.5, (days, 48))
+
+    return pd.DataFrame(counts, index=dates, columns=columns)
+
+
+def synthetic_metrics(seed = 0):
+    """
+    Generate a metrics-shaped object with .ambient, .hourlyMedian and .percentTimeAbove members.
+
+    Parameters
+    ----------
+    seed: int, seed for the random number generator.
+
+    Returns
+    -------
+    object with the same attribute layout as a soundDB metrics object
+    """
+
+    rng = np.random.default_rng(seed)
+
+    weights = ["dBA", "dBT"]
+    periods = ["overall", "Day", "Night"]
+
+    ambient_metrics = ["L090", "L050", "L010", "Lnat", "Leq"]
+    index = pd.MultiIndex.from_product([SEASONS, weights, periods, ambient_metrics])
+    base = rng.uniform(20, 35, len(index)//len(ambient_metrics))
+    ambient = pd.Series(np.round((base[:, None] + np.array([0, 5, 12, 4, 9])).reshape(-1), 1), index=index)
+
+    index = pd.MultiIndex.from_product([SEASONS, weights, ["Leq", "L050"], range(24)])
+    hourly = pd.Series(np.round(rng.uniform(20, 50, len(index)), 1), index=index)
+
+    index = pd.MultiIndex.from_product([SEASONS, weights, periods, ["35dB", "45dB", "52dB", "60dB"]])
+    above = pd.Series(np.round(rng.uniform(0, 30, len(index)), 2), index=index)
+
+    return types.SimpleNamespace(ambient=types.SimpleNamespace(data=ambient),
+                                 hourlyMedian=types.SimpleNamespace(data=hourly),
+                                 percentTimeAbove=types.SimpleNamespace(data=above))
+
+
+def synthetic_nvspl(hours = 24, start = "2019-06-01", site = "SITE", seed = 0, as_object = True):
+    """
+    Generate an NVSPL-shaped dataframe: one row per second of one-third-octave band levels and dbA.
+
+    Parameters
+    ----------
+    hours: int, the number of hours of one-second data.
+    start: str or timestamp, the first second of the record.
+    site: str, the site code used for the second index level.
+    seed: int, seed for the random number generator.
+    as_object: bool, optional.  Return object-typed columns, the way soundDB delivers them.  Defaults to True.
+
+    Returns
+    -------
+    pandas dataframe indexed by (time, site)
+    """
+
+    rng = np.random.default_rng(seed)
+    n = hours*3600
+
+    times = pd.date_range(start, periods=n, freq="s")
+
+    # a pink-ish spectrum plus a slowly varying ambient, quantized to 0.1 dB like the real files
+    spectrum = np.linspace(35, 5, len(NVSPL_BANDS))
+    drift = np.repeat(rng.normal(0, 3, hours + 1)[:hours], 3600)[:, None]
+    bands = np.round(spectrum[None, :] + drift + rng.normal(0, 2, (n, len(NVSPL_BANDS))), 1)
+
+    frame = pd.DataFrame(bands, columns=NVSPL_BANDS)
+    frame["dbA"] = np.round(10*np.log10(np.power(10, bands/10).sum(axis=1)) - 3, 1)
+    frame.index = pd.MultiIndex.from_arrays([times, np.repeat(site, n)])
+
+    if(as_object):
+        frame = frame.astype(object)
+
+    return frame
+
+
+def synthetic_site(days = 90, nvspl_hours = 24, start = "2019-06-01", seed = 0):
+    """
+    Generate one site's worth of every derived data product.
+
+    Returns
+    -------
+    dict with keys "srcid", "dailypa", "loudevents", "metrics" and "nvspl"
+    """
+
+    return {"srcid": synthetic_srcid(days = days, start = start, seed = seed),
+            "dailypa": synthetic_dailypa(days = days, start = start, seed = seed),
+            "loudevents": synthetic_loudevents(days = days, start = start, seed = seed),
+            "metrics": synthetic_metrics(seed = seed),
+            "nvspl": synthetic_nvspl(hours = nvspl_hours, start = start, seed = seed)}
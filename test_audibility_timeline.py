@@ -0,0 +1,80 @@
+import tracemalloc
+
+import pandas as pd
+import numpy as np
+
+import audibility_timeline
+import synthetic_data
+from audibility_timeline import audibility_timeline as build_timeline, audibility_timelines
+from srcid_compact import source_mask
+
+#------------------------------------------------------------------------------------------------------------------
+# ### AUDIBILITY TIMELINES AGAINST A PER-SECOND COUNT
+#
+#     python -m pytest test_audibility_timeline.py
+
+
+def _per_second(srcid, source, first, seconds):
+
+    # brute force: mark every second each event touches, one event at a time
+    audible = np.zeros(seconds, dtype=bool)
+    rows = srcid.loc[source_mask(srcid, source)]
+    for start, length in zip(rows.index, rows["len"]):
+        lo = int((start - first)//pd.Timedelta(seconds=1))
+        hi = int(-(-(start + length - first)//pd.Timedelta(seconds=1)))
+        audible[max(lo, 0):min(hi, seconds)] = True
+
+    return audible
+
+
+def _gaps(audible):
+
+    # brute force: the inaudible runs with an audible second on either side
+    gaps, run, seen = [], 0, False
+    for a in audible:
+        if(a):
+            if(seen and run):
+                gaps.append(run)
+            seen, run = True, 0
+        else:
+            run += 1
+
+    return np.array(gaps, dtype=float)
+
+
+def test_timelines_match_a_per_second_count(monkeypatch):
+
+    # small chunks, so runs cross many chunk boundaries
+    monkeypatch.setattr(audibility_timeline, "_CHUNK_SECONDS", 8*125)
+
+    srcid = synthetic_data.synthetic_srcid(days = 5, seed = 1)
+    timelines = audibility_timelines(srcid)
+    vehicles = sorted(set(c for c in srcid["srcID"] if 2 <= c < 3))
+
+    for source, group in [("all", "all"), ("air", "air"), (vehicles, "vehicle")]:
+        timeline = build_timeline(srcid, source = source)
+        expected = _per_second(srcid, source, timeline.start, timeline.seconds)
+
+        assert np.array_equal(timeline.to_array(), expected)
+        assert np.array_equal(timelines[group].to_array(), expected)
+        assert np.array_equal(timeline.gaps(), _gaps(expected))
+
+        for t0, t1 in [(None, None), ("2019-06-02 03:00:07", "2019-06-03 17:45:01"), ("2019-06-04 10:00:03", "2019-06-04 10:00:05")]:
+            first, last = timeline._window(t0, t1)
+            assert timeline.audible_seconds(t0, t1) == expected[first:last].sum()
+
+
+def test_multi_year_timeline_builds_in_place():
+
+    srcid = synthetic_data.synthetic_srcid(days = 4, seed = 0)
+    start, end = pd.Timestamp("2015-01-01"), pd.Timestamp("2025-01-01")
+
+    tracemalloc.start()
+    timeline = build_timeline(srcid, start = start, end = end)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # the packed output (40 MB) plus a few MB of working memory, not 8 bytes per second
+    assert timeline.seconds == (end - start)//pd.Timedelta(seconds=1)
+    assert peak < timeline.bits.nbytes + 2**24
+    assert timeline.audible_seconds() == build_timeline(srcid).audible_seconds()
@@ -0,0 +1,75 @@
+import pandas as pd
+import numpy as np
+
+import synthetic_data
+from band_occupancy import band_occupancy
+from srcid_compact import compact_srcid, source_mask
+from stratified import SOURCE_GROUPS
+from weighting import CENTER_FREQUENCIES, NVSPL_BANDS
+
+#------------------------------------------------------------------------------------------------------------------
+# ### BAND OCCUPANCY AGAINST A LOOP OVER EVENTS, BANDS AND HOURS
+#
+#     python -m pytest test_band_occupancy.py
+
+
+def _hour_shares(start, length):
+
+    # brute force: walk the event from clock hour to clock hour, giving each hour its fraction of the event
+    if(length == pd.Timedelta(0)):
+        return [(start.hour, 1.)]
+
+    shares, t, end = [], start, start + length
+    while(t < end):
+        boundary = t.floor("h") + pd.Timedelta(hours=1)
+        shares.append((t.hour, (min(boundary, end) - t)/length))
+        t = boundary
+
+    return shares
+
+
+def _occupancy_by_hand(srcid, weight, by_hour, source):
+
+    rows = srcid.loc[source_mask(srcid, source)]
+    lower, upper = CENTER_FREQUENCIES/np.power(10, 0.05), CENTER_FREQUENCIES*np.power(10, 0.05)
+
+    occupancy = {}
+    for start, length, code, Hz_L, Hz_U, SEL in zip(rows.index, rows["len"], rows["srcID"], rows["Hz_L"], rows["Hz_U"], rows["SEL"]):
+        value = {"duration": length.total_seconds(), "energy": 10**(SEL/10), "count": 1.}[weight]
+        shares = _hour_shares(start, length) if by_hour and weight != "count" else [(start.hour, 1.)]
+        for hour, share in shares:
+            key = (SOURCE_GROUPS[int(code)], hour) if by_hour else SOURCE_GROUPS[int(code)]
+            row = occupancy.setdefault(key, np.zeros(len(NVSPL_BANDS)))
+            for band in range(len(NVSPL_BANDS)):
+                # a band is occupied when the span reaches past its lower edge and starts below its upper edge
+                if(Hz_L < upper[band] and Hz_U >= lower[band]):
+                    row[band] += value*share
+
+    return occupancy
+
+
+def test_band_occupancy_matches_a_loop_over_events():
+
+    srcid = synthetic_data.synthetic_srcid(days = 10, seed = 3)
+
+    for weight in ["duration", "energy", "count"]:
+        for by_hour in [False, True]:
+            for source in ["all", "air"]:
+                expected = _occupancy_by_hand(srcid, weight, by_hour, source)
+
+                for frame in [srcid, compact_srcid(srcid)]:
+                    result = band_occupancy(frame, weight = weight, by_hour = by_hour, source = source)
+
+                    # strata with no events (hours in which a group was never heard) hold zeros
+                    assert not result.loc[[k not in expected for k in result.index]].to_numpy().any()
+                    result = result.loc[[k in expected for k in result.index]]
+
+                    assert len(result) == len(expected)
+                    for key, row in expected.items():
+                        assert np.allclose(result.loc[key].to_numpy(dtype=float), row, rtol=1e-9, atol=1e-6), (weight, by_hour, source, key)
+
+    # normalized rows are fractions of each source group's total
+    fractions = band_occupancy(srcid, weight = "count", normalize = True)
+    counts = band_occupancy(srcid, weight = "count")
+    totals = srcid.groupby(srcid["srcID"].astype(int).map(SOURCE_GROUPS)).size()
+    assert np.allclose(fractions.to_numpy(), counts.to_numpy()/totals.reindex(counts.index).to_numpy()[:, None])
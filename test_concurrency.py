@@ -0,0 +1,65 @@
+import pandas as pd
+import numpy as np
+import pytest
+
+import synthetic_data
+from concurrency import concurrency_timeline, cooccurrence, peak_concurrency, time_at_concurrency
+from srcid_compact import source_mask
+from stratified import SOURCE_GROUPS
+
+#------------------------------------------------------------------------------------------------------------------
+# ### CONCURRENCY AGAINST A PER-SECOND COUNT
+#
+#     python -m pytest test_concurrency.py
+
+
+def _per_second(srcid, source, first, seconds):
+
+    # brute force: add one to every second each event covers, one event at a time
+    counts = np.zeros(seconds, dtype=np.int64)
+    rows = srcid.loc[source_mask(srcid, source)]
+    for start, length in zip(rows.index, rows["len"]):
+        lo = (start - first)//pd.Timedelta(seconds=1)
+        counts[lo:lo + length//pd.Timedelta(seconds=1)] += 1
+
+    return counts
+
+
+def test_concurrency_matches_a_per_second_count():
+
+    for seed in range(3):
+        srcid = synthetic_data.synthetic_srcid(days = 5, events_per_day = 300, seed = seed)
+        first = srcid.index.min().normalize()
+        seconds = 7*86400
+
+        for source in ["all", "air", [1.1, 2.0]]:
+            counts = _per_second(srcid, source, first, seconds)
+            grid = first + pd.to_timedelta(np.arange(seconds), unit="s")
+
+            timeline = concurrency_timeline(srcid, source = source)
+            assert np.array_equal(timeline.reindex(grid, method="ffill").fillna(0).to_numpy(dtype=np.int64), counts)
+
+            at_least = time_at_concurrency(srcid, source = source)
+            assert at_least.tolist() == [float((counts >= k).sum()) for k in range(1, counts.max() + 1)]
+
+            for freq, period in [("D", 86400), ("h", 3600)]:
+                peaks = peak_concurrency(srcid, freq = freq, source = source)
+                offset = (peaks.index[0] - first)//pd.Timedelta(seconds=period)
+                expected = counts.reshape(-1, period).max(axis=1)[offset:offset + len(peaks)]
+                assert peaks.tolist() == expected.tolist()
+
+        groups = {SOURCE_GROUPS[g]: _per_second(srcid, [c for c in srcid["srcID"].unique() if int(c) == g], first, seconds) > 0
+                  for g in sorted(set(int(c) for c in srcid["srcID"]))}
+        matrix = cooccurrence(srcid)
+        for a in matrix.index:
+            for b in matrix.columns:
+                assert matrix.loc[a, b] == (groups[a] & groups[b]).sum(), (a, b)
+
+
+def test_unknown_frequencies_are_refused():
+
+    srcid = synthetic_data.synthetic_srcid(days = 5)
+
+    for freq in ["W", "min", "", 3600]:
+        with pytest.raises(ValueError, match="freq"):
+            peak_concurrency(srcid, freq = freq)
@@ -0,0 +1,67 @@
+import pandas as pd
+import numpy as np
+
+import synthetic_data
+from episodes import episode_NFI_list, episodes
+from srcid_compact import compact_srcid, source_mask
+
+#------------------------------------------------------------------------------------------------------------------
+# ### NOISE EPISODES AGAINST A LOOP OVER EVENTS
+#
+#     python -m pytest test_episodes.py
+
+
+def _episodes_by_hand(srcid, max_gap, source, by):
+
+    # walk each group's events in start order, opening an episode when the silence since the latest end exceeds max_gap
+    rows = srcid.loc[source_mask(srcid, source)]
+    keys = [int(c) if by == "source_group" else 0 for c in rows["srcID"]]
+    events = sorted(zip(keys, rows.index, range(len(rows))), key=lambda e: (e[0], e[1]))
+
+    lengths = list(rows["len"])
+    found = []
+    for key, start, i in events:
+        end = start + lengths[i]
+        if(found and found[-1]["key"] == key and (start - found[-1]["end"]).total_seconds() <= max_gap):
+            found[-1]["end"] = max(found[-1]["end"], end)
+            found[-1]["members"].append(i)
+        else:
+            found.append({"key": key, "start": start, "end": end, "members": [i]})
+
+    Lmax, SEL, codes = (rows[c].to_numpy(dtype=float) for c in ["MaxSPL", "SEL", "srcID"])
+    for episode in found:
+        members = episode["members"]
+        episode["MaxSPL"] = Lmax[members].max()
+        episode["SEL"] = round(10*np.log10(np.power(10, SEL[members]/10).sum()), 1)
+        episode["srcID"] = codes[members][int(np.argmax(Lmax[members]))]
+
+    return sorted(found, key=lambda e: e["start"])
+
+
+def test_episodes_match_a_loop_over_events():
+
+    for seed in range(4):
+        srcid = synthetic_data.synthetic_srcid(days = 10, events_per_day = 120, seed = seed)
+
+        for max_gap, source, by in [(30, "all", "source_group"), (120, "air", "source_group"), (60, [1.1, 2.0], None), (0, "all", None)]:
+            expected = _episodes_by_hand(srcid, max_gap, source, by)
+
+            for frame in [srcid, compact_srcid(srcid)]:
+                result = episodes(frame, max_gap = max_gap, source = source, by = by)
+
+                assert len(result) == len(expected)
+                assert list(result.index) == [e["start"] for e in expected]
+                assert list(result["len"]) == [e["end"] - e["start"] for e in expected]
+                assert list(result["members"]) == [len(e["members"]) for e in expected]
+                assert np.allclose(result["MaxSPL"], [e["MaxSPL"] for e in expected])
+                assert np.allclose(result["SEL"], [e["SEL"] for e in expected])
+                assert np.allclose(result["srcID"], [e["srcID"] for e in expected])
+
+
+def test_episode_NFI_is_the_silence_between_merged_episodes():
+
+    srcid = synthetic_data.synthetic_srcid(days = 10, events_per_day = 120, seed = 0)
+    expected = _episodes_by_hand(srcid, 45, "all", None)
+
+    gaps = [(b["start"] - a["end"]).total_seconds()/60 for a, b in zip(expected[:-1], expected[1:])]
+    assert np.allclose(episode_NFI_list(srcid, max_gap = 45, unit = "minutes"), gaps)
@@ -0,0 +1,155 @@
+import datetime as dt
+
+import pandas as pd
+import numpy as np
+import pytest
+
+import merge_SRCID
+from kernels import hysteresis_events, verify_kernels
+
+#------------------------------------------------------------------------------------------------------------------
+# ### KERNEL FALLBACKS, HYSTERESIS EVENTS AND THE MERGE_SRCID GROUPING THEY REPLACED
+#
+#     python -m pytest test_kernels.py
+
+
+def _srcid_with_hour_breaks(chains = 60, singles = 200, seed = 0):
+
+    # annotations split at hour breaks: a piece ending at hh:59:59, any number of whole-hour pieces, and a final
+    # piece starting at hh:00:00; plus ordinary events that do not touch a break
+    rng = np.random.default_rng(seed)
+    rows = []
+    for c in range(chains):
+        hour = pd.Timestamp("2019-06-01") + pd.Timedelta(hours=int(rng.integers(0, 24*60)))
+        srcID = float(rng.choice([1.1, 1.2, 1.3, 2.0]))
+        first = int(rng.integers(1, 3599))
+        rows.append((hour + pd.Timedelta(seconds=3600 - first - 1), first, srcID))
+        for h in range(int(rng.integers(0, 3))):
+            hour = hour + pd.Timedelta(hours=1)
+            rows.append((hour, 3599, srcID))
+        rows.append((hour + pd.Timedelta(hours=1), int(rng.integers(1, 1800)), srcID))
+
+    for s in range(singles):
+        start = pd.Timestamp("2019-06-01") + pd.Timedelta(seconds=int(rng.integers(0, 86400*60)))
+        if(start.minute == 0 and start.second == 0):
+            start = start + pd.Timedelta(seconds=30)
+        rows.append((start, int(rng.integers(5, 120)), float(rng.choice([1.1, 2.0, 3.0]))))
+
+    srcid = pd.DataFrame(rows, columns=["start", "len", "srcID"]).drop_duplicates("start").set_index("start").sort_index()
+    srcid.index.name = None
+    srcid["len"] = pd.to_timedelta(srcid["len"], unit="s")
+    n = len(srcid)
+    srcid["Hz_L"] = rng.integers(20, 200, n)
+    srcid["Hz_U"] = rng.integers(500, 5000, n)
+    for column in ["MaxSPL", "SEL", "MaxSPLt", "SELt"]:
+        srcid[column] = np.round(rng.normal(45, 8, n), 1)
+    srcid["userName"] = "test"
+    srcid["tagDate"] = pd.Timestamp("2020-01-01")
+
+    return srcid
+
+
+def _merge_SRCID_loop(src):
+
+    # merge_SRCID as it was before the group assignment moved into kernels.merge_groups
+    end_at_hour = src.loc[((src.index + src["len"]).dt.minute==59)&
+                          ((src.index + src["len"]).dt.second==59)]
+    start_at_hour = src.loc[(src.index.minute==0)&(src.index.second==0)]
+
+    matches_end = start_at_hour.copy()
+    matches_end.index = (start_at_hour.index + start_at_hour["len"] + dt.timedelta(seconds=1))
+    matches_start = end_at_hour[(end_at_hour.index + end_at_hour["len"] + dt.timedelta(seconds=1)).isin(start_at_hour.index)].copy()
+
+    cons = pd.concat([matches_start, matches_end]).sort_index().dropna()
+    cons = cons.drop_duplicates(keep="first")
+
+    group = 1
+    for srcID, source_group in cons.groupby("srcID"):
+
+        for ts, annotation in source_group.sort_index().iterrows():
+
+            ends = ts + annotation["len"]
+
+            if((ts.minute!=0)&(ts.second!=0)&
+               (ends.minute==59)&(ends.second==59)):
+
+                group = group + 1
+                cons.loc[ts, "group"] = group
+
+            elif((ts.minute==0)&(ts.second==0)&
+               (ends.minute!=59)&(ends.second!=59)):
+
+                cons.loc[ts, "group"] = group
+                group = group + 1
+
+            else:
+                cons.loc[ts, "group"] = group
+
+        group = group + 1
+
+    frames = []
+    for group_number, pieces in cons.groupby('group'):
+        if(len(pieces) < 2):
+            cons.drop(pieces.index, inplace=True)
+        else:
+            frames.append(merge_SRCID.join_srcID_rows(pieces))
+
+    no_breaks = src.loc[~src.index.isin(cons.index)]
+
+    return pd.concat([pd.concat(frames), no_breaks]).sort_index()
+
+
+def test_verify_kernels():
+
+    assert verify_kernels()
+
+
+def test_merge_SRCID_matches_the_loop_it_replaced():
+
+    srcid = _srcid_with_hour_breaks()
+
+    expected = _merge_SRCID_loop(srcid)
+    result = merge_SRCID.merge_SRCID(srcid)
+
+    assert len(result) < len(srcid)
+    assert result.index.equals(expected.index)
+    for column in ["len", "srcID", "Hz_L", "Hz_U"]:
+        assert list(result[column]) == list(expected[column])
+    for column in ["MaxSPL", "SEL", "MaxSPLt", "SELt"]:
+        assert np.array_equal(result[column].to_numpy(dtype=float), pd.to_numeric(expected[column]).to_numpy(dtype=float))
+
+
+def _hysteresis_by_hand(levels, on, off):
+
+    # walk the samples: open at the first level >= on, close at the first level < off; NaN changes nothing
+    starts, stops, inside = [], [], False
+    for i, level in enumerate(levels):
+        if(not inside and level >= on):
+            starts.append(i)
+            inside = True
+        elif(inside and level < off):
+            stops.append(i)
+            inside = False
+    if(inside):
+        stops.append(len(levels))
+
+    return starts, stops
+
+
+def test_hysteresis_events_match_a_walk_over_the_samples():
+
+    rng = np.random.default_rng(0)
+    for trial in range(20):
+        levels = np.round(40 + np.cumsum(rng.normal(0, 1.5, 5000)) % 20, 1)
+        levels[rng.random(len(levels)) < 0.02] = np.nan
+        on, off = 50.0, float(rng.choice([50.0, 47.5, 42.0]))
+
+        starts, stops = hysteresis_events(levels, on, off)
+        expected_starts, expected_stops = _hysteresis_by_hand(levels, on, off)
+
+        assert starts.tolist() == expected_starts
+        assert stops.tolist() == expected_stops
+
+    assert [len(a) for a in hysteresis_events([], 45, 40)] == [0, 0]
+    with pytest.raises(ValueError):
+        hysteresis_events(levels, 40, 45)
@@ -0,0 +1,71 @@
+import asyncio
+import os
+import threading
+import time
+
+import pandas as pd
+import numpy as np
+
+import derivedDataFunctions
+import synthetic_data
+from metrics_service import MetricsClient, MetricsService
+
+#------------------------------------------------------------------------------------------------------------------
+# ### THE METRICS SERVICE AGAINST DIRECT CALLS
+#
+#     python -m pytest test_metrics_service.py
+
+
+def _serve(service):
+
+    # a server on a free port, in a daemon thread for the rest of the test session
+    port = []
+    threading.Thread(target=lambda: asyncio.run(service.serve(port=0, ready=port.append)), daemon=True).start()
+    while(not port):
+        time.sleep(0.01)
+
+    return MetricsClient("http://127.0.0.1:" + str(port[0]))
+
+
+def _write_sites(path, seeds):
+
+    sites, srcids = {}, {}
+    for seed in seeds:
+        srcids["S" + str(seed)] = synthetic_data.synthetic_srcid(days = 20, seed = seed)
+        sites["S" + str(seed)] = {"srcid": os.path.join(str(path), "srcid_" + str(seed) + ".pkl")}
+        srcids["S" + str(seed)].to_pickle(sites["S" + str(seed)]["srcid"])
+
+    return sites, srcids
+
+
+def test_client_returns_what_the_function_returns(tmp_path):
+
+    sites, srcids = _write_sites(tmp_path, range(10))
+    client = _serve(MetricsService(sites, processes = 1))
+
+    for site, srcid in srcids.items():
+        for source in ["all", "air", [1.1]]:
+            for name in ["mad_amplitude", "iqr_amplitude", "mean_amplitude", "stdev_amplitude", "stderr_amplitude"]:
+                assert getattr(client, name)(site, source = source) == getattr(derivedDataFunctions, name)(srcid, source = source)
+            for q in [0.1, 0.5, 0.9]:
+                assert client.quantile_amplitude(site, q, source = source) == derivedDataFunctions.quantile_amplitude(srcid, q, source = source)
+
+
+def test_a_slow_load_does_not_hold_up_other_sites(tmp_path):
+
+    sites, srcids = _write_sites(tmp_path, range(2))
+    slow = sites["S0"]["srcid"]
+
+    def load(path):
+        if(path == slow):
+            time.sleep(2)
+        return pd.read_pickle(path)
+
+    client = _serve(MetricsService(sites, processes = 1, load = load))
+
+    threading.Thread(target=lambda: client.total_count("S0"), daemon=True).start()
+    time.sleep(0.2)
+
+    t = time.perf_counter()
+    assert client.total_count("S1") == derivedDataFunctions.total_count(srcids["S1"])
+    assert time.perf_counter() - t < 1.5
@@ -0,0 +1,91 @@
+import pandas as pd
+import numpy as np
+import pytest
+
+import nvspl_store
+import synthetic_data
+from arrow_backend import nvspl_times
+from nvspl_store import NVSPLStore, write_nvspl_store
+
+#------------------------------------------------------------------------------------------------------------------
+# ### THE NVSPL STORE AGAINST BINARY SEARCH, NANQUANTILE AND AN INTERRUPTED APPEND
+#
+#     python -m pytest test_nvspl_store.py
+
+
+def _gappy_nvspl(seed):
+
+    # whole hours, an empty hour and partial hours, with a few levels missing
+    nvspl = synthetic_data.synthetic_nvspl(hours = 8, seed = seed, as_object = False)
+    rng = np.random.default_rng(seed)
+
+    hour = (nvspl_times(nvspl) - nvspl_times(nvspl)[0])//pd.Timedelta(hours=1)
+    keep = (hour != 2) & ((hour != 4) | (rng.random(len(nvspl)) < 0.3)) & ((hour != 6) | (rng.random(len(nvspl)) < 0.9))
+    nvspl = nvspl.loc[keep].copy()
+
+    missing = rng.random(nvspl.shape) < 0.02
+    nvspl = nvspl.mask(missing)
+
+    return nvspl
+
+
+def test_positions_match_a_binary_search_over_the_stored_seconds(tmp_path):
+
+    for seed in range(3):
+        nvspl = _gappy_nvspl(seed)
+        store = write_nvspl_store([nvspl.iloc[:10000], nvspl.iloc[10000:]], str(tmp_path/str(seed)))
+        stored = nvspl_times(nvspl).to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+        assert store.rows == len(nvspl)
+        assert np.array_equal(store.times().to_numpy(dtype="datetime64[ns]").view(np.int64), stored)
+
+        rng = np.random.default_rng(seed)
+        first, last = stored[0], stored[-1]
+        queries = np.concatenate([rng.integers(first - 10**12, last + 10**12, 5000), stored[::97], stored[::89] + 1])
+        expected = np.searchsorted(stored, queries, side="left")
+
+        assert np.array_equal(store.positions(queries.view("datetime64[ns]")), expected)
+
+
+def test_Lx_matches_nanquantile(tmp_path):
+
+    nvspl = _gappy_nvspl(0)
+    store = write_nvspl_store(nvspl, str(tmp_path/"int16"))
+    floats = write_nvspl_store(nvspl, str(tmp_path/"float32"), dtype = "float32")
+    bands = ["12.5", "1000", "dbA"]
+
+    for start, end in [(None, None), ("2019-06-01 03:10", "2019-06-01 05:20"), ("2019-06-01 02:00", "2019-06-01 03:00")]:
+        window = nvspl.loc[(nvspl_times(nvspl) >= pd.Timestamp(start or 0)) & (nvspl_times(nvspl) < pd.Timestamp(end or "2100"))]
+        for x in [1, 10, 50, 90, 99]:
+            with np.errstate(all="ignore"):
+                expected = np.nanquantile(window[bands].to_numpy(dtype=float), (100 - x)/100, axis=0) if len(window) else np.full(len(bands), np.nan)
+
+            result = store.Lx(x, start, end, bands = bands, chunk_rows = 777)
+            assert np.allclose(result.to_numpy(), expected, atol=1e-9, equal_nan=True), (start, end, x)
+            assert np.allclose(floats.Lx(x, start, end, bands = bands).to_numpy(), expected, atol=1e-4, equal_nan=True)
+
+
+def test_an_append_cut_off_before_the_commit_leaves_the_store_as_it_was(tmp_path, monkeypatch):
+
+    nvspl = _gappy_nvspl(1)
+    path = str(tmp_path/"store")
+    store = write_nvspl_store(nvspl.iloc[:8000], path)
+    before = store.frame()
+
+    def crash(path, meta):
+        raise OSError("disk went away")
+
+    monkeypatch.setattr(nvspl_store, "_write_meta", crash)
+    with pytest.raises(OSError):
+        store.append(nvspl.iloc[8000:15000])
+    monkeypatch.undo()
+
+    # the levels written past the committed rows are ignored, then cut off by the next append
+    reopened = NVSPLStore(path)
+    assert reopened.rows == 8000
+    assert reopened.frame().equals(before)
+
+    reopened.append(nvspl.iloc[8000:])
+    whole = write_nvspl_store(nvspl, str(tmp_path/"whole"))
+    assert NVSPLStore(path).frame().equals(whole.frame())
+    assert np.array_equal(NVSPLStore(path).raw(), whole.raw())
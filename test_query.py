@@ -0,0 +1,69 @@
+import inspect
+
+import pandas as pd
+
+import synthetic_data
+from function_catalog import call_arguments, data_product
+from query import Query, write_srcid_partitions
+from report_planner import FUNCTIONS
+from srcid_compact import source_mask
+
+#------------------------------------------------------------------------------------------------------------------
+# ### QUERY METRICS AGAINST DIRECT CALLS ON A FILTERED SRCID
+#
+#     python -m pytest test_query.py
+
+
+# every srcid metric is a Query method
+_SRCID_FUNCTIONS = {name: function for name, function in FUNCTIONS.items() if data_product(function) == "srcid"}
+
+
+def _filtered(srcid, t0, t1, first_hour, last_hour, source):
+
+    # the filters applied by hand, on the whole srcid
+    keep = (srcid.index >= pd.Timestamp(t0)) & (srcid.index < pd.Timestamp(t1)) & source_mask(srcid, source)
+    if(first_hour <= last_hour):
+        keep &= (srcid.index.hour >= first_hour) & (srcid.index.hour <= last_hour)
+    else:
+        keep &= (srcid.index.hour >= first_hour) | (srcid.index.hour <= last_hour)
+
+    return srcid.loc[keep]
+
+
+def _equal(a, b):
+
+    if(isinstance(a, (pd.Series, pd.DataFrame))):
+        return a.equals(b)
+
+    return a == b or (a != a and b != b)
+
+
+def test_query_metrics_equal_direct_calls(tmp_path):
+
+    srcid = synthetic_data.synthetic_srcid(days = 90, seed = 4)
+    srcid.to_pickle(str(tmp_path/"srcid.pkl"))
+    write_srcid_partitions(srcid, str(tmp_path/"parts"))
+
+    filters = [("2019-06-01", "2019-09-01", 0, 23, "all"),
+               ("2019-06-20 06:30", "2019-08-02", 7, 19, "air"),
+               ("2019-07-01", "2019-07-15", 19, 6, [1.1, 2.0])]
+
+    for site in [srcid, str(tmp_path/"srcid.pkl"), str(tmp_path/"parts"), {"srcid": str(tmp_path/"parts")}]:
+        for t0, t1, first_hour, last_hour, source in filters:
+            query = Query(site).source(source).between(t0, t1).hours(first_hour, last_hour)
+            subset = _filtered(srcid, t0, t1, first_hour, last_hour, source)
+            assert len(query.collect()) == len(subset)
+
+            spec = []
+            for name, function in _SRCID_FUNCTIONS.items():
+                args = call_arguments(function, {"srcid": subset})
+                expected = function(*args)
+                assert _equal(getattr(query, name)(*args[1:]), expected), (site, t0, name)
+
+                parameters = list(inspect.signature(function).parameters)[1:len(args)]
+                spec.append((name, name, dict(zip(parameters, args[1:]))))
+
+            # every metric in one scan, through the report planner
+            results = query.compute(spec)
+            for label, name, params in spec:
+                assert _equal(results[label], _SRCID_FUNCTIONS[name](subset, **params)), (site, t0, name)
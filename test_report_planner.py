@@ -0,0 +1,78 @@
+import pandas as pd
+import numpy as np
+
+import derivedDataFunctions
+import synthetic_data
+from function_catalog import data_product
+from report_planner import plan_report
+
+#------------------------------------------------------------------------------------------------------------------
+# ### REPORT PLANS AGAINST THE FUNCTIONS CALLED ONE BY ONE
+#
+#     python -m pytest test_report_planner.py
+
+
+def _spec():
+
+    spec = []
+    for source in ["all", "air", [1.1], [1.1, 2.0]]:
+        for name in ["quantile_amplitude", "mad_amplitude", "iqr_amplitude", "mean_amplitude", "stdev_amplitude", "stderr_amplitude"]:
+            params = {"q": 0.9} if name == "quantile_amplitude" else {}
+            spec.append((name, dict(params, metric="SEL", weight="T", source=source)))
+            spec.append((name, dict(params, source=source)))
+        for name in ["total_event_duration", "mad_event_duration", "iqr_event_duration", "mean_event_duration",
+                     "stdev_event_duration", "stderr_event_duration", "total_count", "NFI_list"]:
+            spec.append((name, {"source": source}))
+        spec.append(("quantile_event_duration", {"q": 0.25, "source": source}))
+        spec.append(("mean_NFI", {"source": source, "unit": "minutes"}))
+        spec.append(("quantile_NFI", {"q": 0.5, "source": source}))
+        for zone in ["low", "High", "very high"]:
+            spec.append(("DENABCMP_SPL_exceedance", {"zone": zone, "source": source}))
+            spec.append(("DENABCMP_SPL_exceedanceRate", {"zone": zone, "source": source}))
+            if(type(source) == str):
+                spec.append(("DENABCMP_PA_exceedance", {"zone": zone, "start_hour": 6, "end_hour": 20, "source": source}))
+        spec.append(("quantile_hourlyPA", {"q": 0.75, "hour": 13, "source": source}))
+        spec.append(("quantile_eventsPerDay", {"q": 0.5, "source": source}))
+        spec.append(("total_events", {"source": source}))
+        spec.append(("overall_PA", {"source": source}))
+
+    for source in ["all", "air", [1.1]]:
+        spec.append(("quantile_dailyPA", {"q": 0.5, "source": source, "hour_range": [7, 19]}))
+
+    for id_code in [1.1, 1.2, 2.0]:
+        spec.append(("percentageOfAll_bySource", {"id_code": id_code}))
+        spec.append(("percentageOfAir_bySource", {"id_code": id_code}))
+
+    # no decomposition: planned as single calls
+    spec += [("propJetRatio", {}), ("number_of_days_splatted", {}), ("event_saturation", {"source": "air"})]
+
+    return [(str(i) + " " + name, name, params) for i, (name, params) in enumerate(spec)]
+
+
+def _equal(a, b):
+
+    if(isinstance(a, (pd.Series, pd.DataFrame))):
+        return a.equals(b)
+    if(isinstance(a, tuple)):
+        return len(a) == len(b) and all(_equal(x, y) for x, y in zip(a, b))
+
+    return a == b or (a != a and b != b)
+
+
+def test_plan_equals_direct_calls():
+
+    spec = _spec()
+    plan = plan_report(spec)
+    assert plan.summary()["nodes"] < plan.summary()["references"]
+
+    for seed in range(3):
+        site = synthetic_data.synthetic_site(days = 30, seed = seed)
+        data = {"srcid": site["srcid"], "dailypa": site["dailypa"]}
+
+        for threads in [1, 4]:
+            cache = {}
+            for run in range(2):
+                results = plan.run(data, threads = threads, cache = cache)
+                for label, name, params in spec:
+                    function = getattr(derivedDataFunctions, name)
+                    assert _equal(results[label], function(data[data_product(function)], **params)), label
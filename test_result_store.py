@@ -0,0 +1,125 @@
+import os
+import shutil
+
+import pandas as pd
+import numpy as np
+
+import derivedDataFunctions
+import episodes
+import result_store
+import synthetic_data
+from result_store import ResultStore, rebuild_report
+
+#------------------------------------------------------------------------------------------------------------------
+# ### RESULT STORE HITS AND MISSES, AND STORES SHARED BETWEEN WRITERS
+#
+#     python -m pytest test_result_store.py
+
+
+_METRICS = [("L50 air", derivedDataFunctions.quantile_amplitude, "srcid", {"q": 0.5, "source": "air"}),
+            ("events", derivedDataFunctions.total_count, "srcid", {}),
+            ("episodes", episodes.episode_count, "srcid", {"max_gap": 60})]
+
+
+def _write_sites(path, seeds):
+
+    sites = {}
+    for seed in seeds:
+        sites["S" + str(seed)] = {"srcid": os.path.join(str(path), "srcid_" + str(seed) + ".pkl")}
+        synthetic_data.synthetic_srcid(days = 10, seed = seed).to_pickle(sites["S" + str(seed)]["srcid"])
+
+    return sites
+
+
+def _library_copy(path, monkeypatch):
+
+    # fingerprint a copy of the library, so its modules can be edited
+    library = os.path.dirname(os.path.abspath(result_store.__file__))
+    os.makedirs(str(path))
+    for name in os.listdir(library):
+        if(name.endswith(".py")):
+            shutil.copy(os.path.join(library, name), str(path))
+
+    monkeypatch.setattr(result_store, "_source_path", lambda name: os.path.join(str(path), str(name) + ".py") if os.path.isfile(os.path.join(str(path), str(name) + ".py")) else None)
+
+
+def _edit(path, monkeypatch):
+
+    with open(path, "a") as f:
+        f.write("\n# edited\n")
+
+    # versions are fingerprinted once per process
+    monkeypatch.setattr(result_store, "_library_versions", {})
+
+
+def test_only_edited_inputs_are_recomputed(tmp_path):
+
+    sites = _write_sites(tmp_path, range(3))
+    store = ResultStore(str(tmp_path/"store"))
+
+    first, counts = rebuild_report(store, sites, _METRICS)
+    assert counts == {"hits": 0, "misses": 9}
+
+    again, counts = rebuild_report(ResultStore(str(tmp_path/"store")), sites, _METRICS)
+    assert counts == {"hits": 9, "misses": 0}
+    assert again.equals(first)
+
+    synthetic_data.synthetic_srcid(days = 10, seed = 99).to_pickle(sites["S1"]["srcid"])
+    edited, counts = rebuild_report(ResultStore(str(tmp_path/"store")), sites, _METRICS)
+    assert counts == {"hits": 6, "misses": 3}
+    assert edited.loc["S1", "events"] == derivedDataFunctions.total_count(pd.read_pickle(sites["S1"]["srcid"]))
+    assert edited.drop(index="S1").equals(first.drop(index="S1"))
+
+
+def test_only_edits_to_modules_a_function_depends_on_miss(tmp_path, monkeypatch):
+
+    sites = _write_sites(tmp_path, range(2))
+    _library_copy(tmp_path/"library", monkeypatch)
+    monkeypatch.setattr(result_store, "_library_versions", {})
+    rebuild_report(ResultStore(str(tmp_path/"store")), sites, _METRICS)
+
+    # progressive.py is imported by neither derivedDataFunctions nor episodes
+    _edit(str(tmp_path/"library"/"progressive.py"), monkeypatch)
+    _, counts = rebuild_report(ResultStore(str(tmp_path/"store")), sites, _METRICS)
+    assert counts == {"hits": 6, "misses": 0}
+
+    # episodes.py is the episode metric's own module
+    _edit(str(tmp_path/"library"/"episodes.py"), monkeypatch)
+    _, counts = rebuild_report(ResultStore(str(tmp_path/"store")), sites, _METRICS)
+    assert counts == {"hits": 4, "misses": 2}
+
+    # _core.py is imported by derivedDataFunctions, so every metric depends on it
+    _edit(str(tmp_path/"library"/"_core.py"), monkeypatch)
+    _, counts = rebuild_report(ResultStore(str(tmp_path/"store")), sites, _METRICS)
+    assert counts == {"hits": 0, "misses": 6}
+
+
+def test_writers_sharing_a_store_keep_each_others_entries(tmp_path):
+
+    sites = _write_sites(tmp_path, range(4))
+    root = str(tmp_path/"store")
+
+    # two stores opened before either writes, as two processes would
+    a, b = ResultStore(root), ResultStore(root)
+    rebuild_report(a, {k: sites[k] for k in ["S0", "S1"]}, _METRICS)
+    rebuild_report(b, {k: sites[k] for k in ["S2", "S3"]}, _METRICS)
+    a.flush()
+
+    shared = ResultStore(root)
+    assert len(shared.entries()) == 12
+    _, counts = rebuild_report(shared, sites, _METRICS)
+    assert counts == {"hits": 12, "misses": 0}
+    assert sorted(shared._index["fingerprints"]) == sorted(os.path.abspath(p["srcid"]) for p in sites.values())
+
+    # an eviction by one writer is not undone by another's save; fingerprints of unused inputs go with the entries
+    keep = shared.entries().index[:3]
+    size = int(shared.entries().loc[keep, "size"].sum())
+    shared.prune(max_bytes = size)
+    a.flush()
+    b.put("extra", np.arange(3))
+
+    reopened = ResultStore(root)
+    assert set(reopened.entries().index) == set(keep) | {"extra"}
+    inputs = set(p for key in keep for p in reopened.entries().loc[key, "inputs"])
+    assert set(reopened._index["fingerprints"]) == inputs
+    assert reopened.get("extra")[0]
@@ -0,0 +1,66 @@
+import inspect
+
+import pandas as pd
+import numpy as np
+
+import derivedDataFunctions
+import synthetic_data
+from function_catalog import call_arguments, data_product, public_functions
+from srcid_compact import compact_srcid, expand_srcid
+
+#------------------------------------------------------------------------------------------------------------------
+# ### EVERY SRCID METRIC ON BOTH SRCID FORMS
+#
+#     python -m pytest test_srcid_compact.py
+
+
+def _srcid_functions():
+
+    return [(name, f) for name, f in public_functions(derivedDataFunctions) if data_product(f) == "srcid"]
+
+
+def _variants(function):
+
+    # the representative call, then every source subset and amplitude column the function takes
+    parameters = inspect.signature(function).parameters
+    variants = [{}]
+    if("source" in parameters):
+        variants += [{"source": source} for source in ["air", [1.1], [2.0, 3.0]]]
+    if("metric" in parameters):
+        variants += [{"metric": metric, "weight": weight} for metric in ["Lmax", "SEL"] for weight in ["A", "T"]]
+
+    return variants
+
+
+def _equal(a, b):
+
+    if(isinstance(a, (pd.Series, pd.DataFrame))):
+        return a.equals(b)
+
+    return a == b or (a != a and b != b)
+
+
+def test_every_srcid_metric_is_identical_on_both_forms():
+
+    functions = _srcid_functions()
+    assert len(functions) > 25
+
+    for seed in range(20):
+        srcid = synthetic_data.synthetic_srcid(days = 30, seed = seed)
+        site = {"srcid": srcid}
+        compact = {"srcid": compact_srcid(srcid)}
+
+        for name, function in functions:
+            for params in _variants(function):
+                expected = function(*call_arguments(function, site), **params)
+                result = function(*call_arguments(function, compact), **params)
+                assert _equal(result, expected), (seed, name, params, result, expected)
+
+
+def test_expand_restores_the_recorded_levels():
+
+    srcid = synthetic_data.synthetic_srcid(days = 30, seed = 0)
+    expanded = expand_srcid(compact_srcid(srcid))
+
+    for column in ["MaxSPL", "SEL", "MaxSPLt", "SELt", "Hz_L", "Hz_U"]:
+        assert np.array_equal(expanded[column].to_numpy(), srcid[column].to_numpy(dtype=float), equal_nan=True), column
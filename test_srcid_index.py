@@ -0,0 +1,111 @@
+import pandas as pd
+import numpy as np
+import pytest
+
+import concurrency
+import episodes
+import synthetic_data
+from audibility_timeline import audibility_timeline, audibility_timelines
+from query import Query
+from srcid_compact import source_mask
+from srcid_index import SRCIDIntervalIndex, srcid_between
+
+#------------------------------------------------------------------------------------------------------------------
+# ### THE INTERVAL INDEX AGAINST BRUTE FORCE, AND ITS CONSUMERS WITH AND WITHOUT ONE
+#
+#     python -m pytest test_srcid_index.py
+
+
+def _shuffled(seed):
+
+    # events out of time order, as a hand-edited srcid can be
+    srcid = synthetic_data.synthetic_srcid(days = 10, seed = seed)
+    return srcid.iloc[np.random.default_rng(seed).permutation(len(srcid))]
+
+
+def _equal(a, b):
+
+    if(isinstance(a, (pd.Series, pd.DataFrame))):
+        return a.equals(b)
+
+    return a == b or (a != a and b != b)
+
+
+def test_window_queries_match_a_loop_over_events():
+
+    for seed in range(5):
+        srcid = _shuffled(seed)
+        index = SRCIDIntervalIndex(srcid, source = "air")
+
+        rng = np.random.default_rng(seed)
+        t0 = srcid.index.min() + pd.to_timedelta(rng.integers(0, 10*86400, 200), unit="s")
+        t1 = t0 + pd.to_timedelta(rng.integers(1, 4*3600, 200), unit="s")
+
+        rows = srcid.loc[source_mask(srcid, "air")]
+        positions = np.flatnonzero(source_mask(srcid, "air"))
+        counts, seconds, pairs = [], [], set()
+        for w, (a, b) in enumerate(zip(t0, t1)):
+            n, s = 0, 0.
+            for p, start, length in zip(positions, rows.index, rows["len"]):
+                if(start < b and start + length > a):
+                    n += 1
+                    s += (min(start + length, b) - max(start, a)).total_seconds()
+                    pairs.add((w, p))
+            counts.append(n)
+            seconds.append(s)
+
+        window, position = index.overlaps(t0, t1)
+        assert set(zip(window.tolist(), position.tolist())) == pairs
+        assert np.array_equal(index.count(t0, t1), counts)
+        assert np.allclose(index.overlap_seconds(t0, t1), seconds)
+
+        a, b = t0[0], t1[0] + pd.Timedelta(days=2)
+        assert srcid_between(srcid, a, b, source = "air", index = index).equals(srcid.iloc[index.rows(a, b)])
+        assert sorted(index.starting(a, b)) == [p for p, start in zip(positions, rows.index) if a <= start < b]
+
+
+def test_consumers_give_the_same_results_with_an_index():
+
+    for seed in range(5):
+        srcid = _shuffled(seed)
+
+        for source in ["all", "air", [1.1, 2.0]]:
+            index = SRCIDIntervalIndex(srcid, source = source)
+
+            for name in ["concurrency_timeline", "time_at_concurrency", "peak_concurrency", "cooccurrence"]:
+                function = getattr(concurrency, name)
+                assert function(srcid, source = source, index = index).equals(function(srcid, source = source))
+
+            for name in ["episodes", "episode_count", "total_episode_duration", "episode_NFI_list", "mean_episode_NFI"]:
+                function = getattr(episodes, name)
+                assert _equal(function(srcid, source = source, index = index), function(srcid, source = source)), name
+            assert episodes.episodes(srcid, source = source, by = None, index = index).equals(episodes.episodes(srcid, source = source, by = None))
+
+            timeline = audibility_timeline(srcid, source = source, index = index)
+            assert np.array_equal(timeline.bits, audibility_timeline(srcid, source = source).bits)
+
+        index = SRCIDIntervalIndex(srcid)
+        with_index, without = audibility_timelines(srcid, index = index), audibility_timelines(srcid)
+        assert with_index.keys() == without.keys()
+        assert all(np.array_equal(with_index[k].bits, without[k].bits) for k in without)
+
+        query = Query(srcid, index = index).source("air").between("2019-06-03", "2019-06-07 12:00")
+        assert query.collect().equals(Query(srcid).source("air").between("2019-06-03", "2019-06-07 12:00").collect())
+        assert query.hours(7, 19).total_count() == Query(srcid).source("air").between("2019-06-03", "2019-06-07 12:00").hours(7, 19).total_count()
+
+
+def test_an_index_over_other_events_is_refused():
+
+    srcid = _shuffled(0)
+    air = SRCIDIntervalIndex(srcid, source = "air")
+
+    with pytest.raises(ValueError):
+        concurrency.peak_concurrency(srcid, source = "all", index = air)
+    with pytest.raises(ValueError):
+        episodes.episodes(srcid.iloc[:-1], source = "air", index = air)
+    with pytest.raises(ValueError):
+        audibility_timelines(srcid, index = air)
+    with pytest.raises(ValueError):
+        srcid_between(srcid, "2019-06-02", "2019-06-03", source = [1.1], index = air)
+    with pytest.raises(ValueError):
+        Query(srcid, index = air).between("2019-06-02", "2019-06-03").collect()
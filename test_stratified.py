@@ -0,0 +1,24 @@
+import pandas as pd
+import numpy as np
+import pytest
+
+import synthetic_data
+from stratified import stratified_dailypa, stratified_srcid
+
+#------------------------------------------------------------------------------------------------------------------
+# ### STRATIFIED METRICS: ARGUMENT CHECKS
+#
+#     python -m pytest test_stratified.py
+
+
+def test_an_empty_grouping_is_refused_up_front():
+
+    srcid = synthetic_data.synthetic_srcid(days = 20)
+    dailypa = synthetic_data.synthetic_dailypa(days = 20)
+
+    for by in [[], ()]:
+        with pytest.raises(ValueError, match="grouping key"):
+            stratified_srcid(srcid, by, ["count"])
+        for metrics in [["mean_PA"], ["mean_events"], ["mean_PA", "mean_events"]]:
+            with pytest.raises(ValueError, match="grouping key"):
+                stratified_dailypa(dailypa, by, metrics)
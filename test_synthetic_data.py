@@ -0,0 +1,32 @@
+import pandas as pd
+import numpy as np
+
+import synthetic_data
+from merge_SRCID import merge_SRCID
+
+#------------------------------------------------------------------------------------------------------------------
+# ### SYNTHETIC SRCID HOUR BREAKS THAT MERGE_SRCID JOINS
+#
+#     python -m pytest test_synthetic_data.py
+
+
+def test_split_events_resume_on_the_hour_and_are_joined():
+
+    for seed in range(5):
+        srcid = synthetic_data.synthetic_srcid(days = 30, seed = seed)
+        ends = pd.DatetimeIndex(srcid.index + srcid["len"])
+
+        # pieces ending at hh:59:59, each followed one second later by a piece of the same srcID
+        first = srcid.loc[(ends.minute == 59) & (ends.second == 59)]
+        resumed = srcid.loc[(srcid.index.minute == 0) & (srcid.index.second == 0)]
+        resumes = set(zip(resumed.index, resumed["srcID"]))
+        pairs = [t for t, length, code in zip(first.index, first["len"], first["srcID"])
+                 if (t + length + pd.Timedelta(seconds=1), code) in resumes]
+        assert len(pairs) > 0.01*len(srcid)
+
+        # merge_SRCID replaces the first piece of a pair by the joined annotation, longer than either piece
+        merged = merge_SRCID(srcid)
+        longer = merged["len"].groupby(level=0).max() > srcid["len"].groupby(level=0).max().reindex(merged.index.unique())
+        joined = set(longer.index[longer.to_numpy()])
+        assert len(joined) > 0.9*len(pairs)
+        assert joined <= set(pairs)
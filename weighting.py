@@ -0,0 +1,169 @@
+import pandas as pd
+import numpy as np
+
+from arrow_backend import column_names, column_values
+
+#------------------------------------------------------------------------------------------------------------------
+# ### FREQUENCY-WEIGHTING RECOMPUTATION FROM ONE-THIRD-OCTAVE BANDS
+#
+# NVSPL ships a precomputed dbA column.  These functions apply any weighting vector (A, C, Z or custom) to the
+# one-third-octave band matrix and energy-sum the bands into a new broadband level, in float32 chunks, using
+# a max-shifted log-sum-exp so that quiet and loud rows are summed with the same relative precision.
+
+
+# the NVSPL band columns and their exact base-10 centre frequencies, 10^(n/10) Hz
+NVSPL_BANDS = ['12.5', '15.8', '20', '25', '31.5', '40', '50', '63', '80',
+               '100', '125', '160', '200', '250', '315', '400', '500', '630', '800',
+               '1000', '1250', '1600', '2000', '2500', '3150', '4000', '5000', '6300',
+               '8000', '10000', '12500', '16000', '20000']
+
+CENTER_FREQUENCIES = np.power(10, np.arange(11, 44)/10.)
+
+
+def A_weighting(f):
+    """
+    IEC 61672-1 A-weighting, in dB, at frequencies f (Hz).
+    """
+
+    f2 = np.asarray(f, dtype=float)**2
+    RA = (12194.**2*f2**2)/((f2 + 20.6**2)*np.sqrt((f2 + 107.7**2)*(f2 + 737.9**2))*(f2 + 12194.**2))
+
+    return 20*np.log10(RA) + 2.00
+
+
+def C_weighting(f):
+    """
+    IEC 61672-1 C-weighting, in dB, at frequencies f (Hz).
+    """
+
+    f2 = np.asarray(f, dtype=float)**2
+    RC = (12194.**2*f2)/((f2 + 20.6**2)*(f2 + 12194.**2))
+
+    return 20*np.log10(RC) + 0.06
+
+
+def Z_weighting(f):
+    """
+    IEC 61672-1 Z-weighting (flat), in dB, at frequencies f (Hz).
+    """
+
+    return np.zeros(np.shape(f))
+
+
+WEIGHTINGS = {"A": A_weighting, "C": C_weighting, "Z": Z_weighting}
+
+
+def weighting_vector(weighting = "A", bands = None):
+    """
+    The weighting, in dB, for each NVSPL band.
+
+    Parameters
+    ----------
+    weighting: str, dict or array-like, optional.  "A", "C" or "Z"; a dict of {band name: dB}; or one dB value per band.  Defaults to "A".
+    bands: list of str or (low Hz, high Hz) tuple, optional.  Restrict to these bands (a truncated band range, inclusive of the nominal band frequencies).  Defaults to all 33 bands.
+
+    Returns
+    -------
+    pandas Series of dB offsets indexed by band name
+    """
+
+    if(bands is None):
+        names = list(NVSPL_BANDS)
+    elif(isinstance(bands, tuple) and len(bands) == 2 and not isinstance(bands[0], str)):
+        # by nominal band label, so (20, 5000) includes the 20 Hz (19.95) and 5000 Hz (5011.9) bands
+        names = [b for b in NVSPL_BANDS if bands[0] <= float(b) <= bands[1]]
+    else:
+        names = [str(b) for b in bands]
+
+    frequencies = pd.Series(CENTER_FREQUENCIES, index=NVSPL_BANDS)
+
+    if(isinstance(weighting, str)):
+        return pd.Series(WEIGHTINGS[weighting.upper()](frequencies[names].values), index=names)
+
+    if(isinstance(weighting, dict)):
+        return pd.Series({name: float(weighting[name]) for name in names})
+
+    values = np.asarray(weighting, dtype=float)
+    if(len(values) != len(names)):
+        raise ValueError("a custom weighting needs one value per band ({0} bands)".format(len(names)))
+
+    return pd.Series(values, index=names)
+
+
+def weighted_level(nvspl, weighting = "A", bands = None, chunk_rows = 1000000):
+    """
+    Recompute a broadband level from the one-third-octave bands of an NVSPL with any weighting.
+
+    Parameters
+    ----------
+    nvspl: pandas dataframe representing NPS NSNSD NVSPL file, formatted by soundDB library.  May also be ArrowDtype-backed or a pyarrow Table.
+    weighting: str, dict or array-like, optional.  "A", "C", "Z" or a custom weighting, see weighting_vector().  Defaults to "A".
+    bands: list of str or (low Hz, high Hz) tuple, optional.  Restrict the sum to these bands.  Bands missing from the NVSPL are skipped.
+    chunk_rows: int, optional.  Rows processed per float32 chunk, bounding the working memory.  Defaults to 1,000,000.
+
+    Returns
+    -------
+    numpy array of float32 broadband levels, one per NVSPL row
+    """
+
+    vector = weighting_vector(weighting, bands)
+    present = [b for b in vector.index if b in set(column_names(nvspl))]
+    if(not present):
+        raise ValueError("none of the requested bands are in the NVSPL")
+
+    offsets = vector[present].to_numpy(dtype=np.float32)
+    columns = [column_values(nvspl, band) for band in present]
+
+    out = np.empty(len(columns[0]), dtype=np.float32)
+    _energy_sum(columns, offsets, out, chunk_rows)
+
+    return out
+
+
+def _energy_sum(columns, offsets, out, chunk_rows = 1000000):
+
+    # weighted energy sum of equal-length band columns into out; also run by the workers in parallel.py
+    n = len(out)
+
+    # preallocated working buffers, reused for every chunk; band-major so each band copy is contiguous
+    block = np.empty((len(columns), min(chunk_rows, n)), dtype=np.float32)
+    peak = np.empty(min(chunk_rows, n), dtype=np.float32)
+    scale = np.float32(np.log(10)/10)
+
+    for start in range(0, n, chunk_rows):
+        stop = min(start + chunk_rows, n)
+        b = block[:, :stop - start]
+        m = peak[:stop - start]
+
+        for j, values in enumerate(columns):
+            np.add(values[start:stop], offsets[j], out=b[j], casting="unsafe")
+
+        # log-sum-exp: L = max + 10 log10(sum 10^((L_i - max)/10)), so every exponent is <= 0
+        np.fmax.reduce(b, axis=0, out=m)
+        b -= m
+        b *= scale
+        np.exp(b, out=b)
+
+        # nan-aware sum, so a missing band drops out rather than blanking the row
+        out[start:stop] = m + np.float32(10)*np.log10(np.nansum(b, axis=0))
+
+
+def add_weighted_levels(nvspl, weightings = None, bands = None):
+    """
+    Return a copy of an NVSPL with new broadband columns, e.g. {"dbC": "C", "dbZ": "Z"}.
+
+    Parameters
+    ----------
+    nvspl: pandas dataframe representing NPS NSNSD NVSPL file, formatted by soundDB library.
+    weightings: dict of {new column name: weighting}, optional.  Defaults to C- and Z-weighted columns.
+    bands: list of str or (low Hz, high Hz) tuple, optional.  Restrict the sums to these bands.
+
+    Returns
+    -------
+    pandas DataFrame
+    """
+
+    if(weightings is None):
+        weightings = {"dbC": "C", "dbZ": "Z"}
+
+    return nvspl.assign(**{name: weighted_level(nvspl, w, bands) for name, w in weightings.items()})